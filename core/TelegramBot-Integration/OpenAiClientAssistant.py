@@ -2,19 +2,45 @@
 import time
 import asyncio
 import aiosqlite
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 import os
 from datetime import datetime
-import requests
+import io
 import logging
 import json
 from settings import settings
+from thread_pool import ThreadPool
 import sqlite3
 from settings import settings
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=settings["openAIToken"], default_headers={"OpenAI-Beta": "assistants=v1"})
-clientblind = OpenAI(api_key=settings["openAIToken2"])
+# Initialize the OpenAI clients; async so one chat's request never blocks the bot's event loop
+_http_limits = httpx.Limits(max_connections=settings["openai_max_connections"])
+client = AsyncOpenAI(api_key=settings["openAIToken"], default_headers={"OpenAI-Beta": "assistants=v1"}, http_client=DefaultAsyncHttpxClient(limits=_http_limits))
+clientblind = AsyncOpenAI(api_key=settings["openAIToken2"], http_client=DefaultAsyncHttpxClient(limits=_http_limits))
+
+# Streamed runs that already returned their reply but are still finishing, keyed by thread_id
+pending_runs = {}
+
+async def _create_thread():
+    try:
+        thread = await client.beta.threads.create()
+        return thread.id
+    except Exception as e:
+        print(f"Error creating new thread: {e}")
+        return None
+
+async def _delete_thread(thread_id):
+    try:
+        await client.beta.threads.delete(thread_id)
+    except Exception as e:
+        logging.warning(f"Could not delete unused thread {thread_id}: {e}")
+
+# Empty threads created ahead of time, so new chats and /resetuser skip that round trip
+thread_pool = ThreadPool(_create_thread, size=settings["thread_pool_size"], max_age=settings["thread_pool_max_age"], discard=_delete_thread)
+
+# Messages requested per page when fetching the reply of a run
+REPLY_PAGE_SIZE = 5
 
 os.path.dirname(os.path.abspath(__file__))
 import sqlite3  # Add this to handle sqlite3 errors
@@ -79,7 +105,7 @@ async def init_db():
 
 async def blind_response(prompt):
     try:
-        completion = clientblind.chat.completions.create(
+        completion = await clientblind.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "user", "content": prompt}
@@ -90,36 +116,57 @@ async def blind_response(prompt):
         logging.error(f"An error occurred: {str(e)}")
         return None
 
-async def whisper_transcribe(file_path):
+async def whisper_transcribe(audio, filename="voice.ogg"):
+    """Transcribes a voice note given as in-memory bytes (or a file path)."""
+    if not isinstance(audio, (bytes, bytearray)):
+        with open(audio, "rb") as audio_file:
+            audio = audio_file.read()
+    model = settings["transcription_model"]
+    if model.startswith("local:"):
+        # Offline model (needs faster-whisper): loaded once, then kept in
+        # memory between messages.
+        from local_whisper import get_model
+
+        try:
+            result = await get_model(model).transcribe_file_async(io.BytesIO(audio))
+            return result.text
+        except Exception as e:
+            logging.error(f"An error occurred during local transcription: {e}")
+            return ""
     try:
-        # Open the audio file in binary mode
-        with open(file_path, "rb") as audio_file:
-            # Create a transcription using the OpenAI API
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text",
-                language="en"
-            )
+        # The bytes go straight into the multipart upload; nothing touches the disk
+        transcript = await client.audio.transcriptions.create(
+            model=model,
+            file=(filename, bytes(audio)),
+            response_format="text",
+            language="en"
+        )
         return transcript
     except Exception as e:
         logging.error(f"An error occurred during transcription: {e}")
         return ""
 
+async def download_voice(bot, file_id):
+    """Streams a Telegram file into memory and returns its bytes (None on failure)."""
+    # bot.download reuses the bot's pooled aiohttp session and writes the file
+    # in chunks into a per-message buffer, so concurrent voice notes never share
+    # a file and no session is opened per message
+    buffer = io.BytesIO()
+    try:
+        await bot.download(file_id, destination=buffer)
+    except Exception as e:
+        logging.error(f"An error occurred while downloading voice message {file_id}: {e}")
+        return None
+    return buffer.getvalue()
+
 async def handle_voice_message(file_id, bot, chat_id):
     """Handles downloading and transcribing voice messages."""
-    file_path = (await bot.get_file(file_id)).file_path
-    file_url = f"https://api.telegram.org/file/bot{settings['telepotToken']}/{file_path}"
-    
-    # Download the file from Telegram using requests
-    response = requests.get(file_url)
-
-    # Save the file locally
-    with open("temp_voice.ogg", "wb") as f:
-        f.write(response.content)
+    audio = await download_voice(bot, file_id)
+    if not audio:
+        return ""
 
     # Transcribe the voice message using Whisper
-    message_text = await whisper_transcribe("temp_voice.ogg")
+    message_text = await whisper_transcribe(audio)
     
     return message_text
 
@@ -178,7 +225,7 @@ async def save_conversation(chat_id, user_id, thread_id, assistant_id, sender, m
 
 async def check_run(client, thread_id, run_id):
     while True:
-        run = client.beta.threads.runs.retrieve(
+        run = await client.beta.threads.runs.retrieve(
             thread_id=thread_id,
             run_id=run_id
         )
@@ -186,13 +233,88 @@ async def check_run(client, thread_id, run_id):
         if run.status == "completed":
             print("Run is completed.")
             break
-        elif run.status == "expired":
-            print("Run is expired.")
+        elif run.status in ("expired", "failed", "cancelled", "incomplete"):
+            print(f"Run ended without completing: {run.status}")
             break
         else:
             print(f"OpenAI: Run is not yet completed. Waiting...{run.status}")
             await asyncio.sleep(3)
 
+async def fetch_run_reply(client, thread_id, run_id):
+    """Return the text of the assistant message written by run_id.
+
+    Only that run's messages are requested, so the call costs the same on a
+    thread with hours of history. If the run filter finds nothing, page back
+    from the newest message until the prompt that started the run.
+    """
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        run_id=run_id,
+        order="desc",
+        limit=REPLY_PAGE_SIZE
+    )
+    for message in page.data:
+        if message.role == "assistant":
+            return message.content[0].text.value
+
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order="desc",
+        limit=REPLY_PAGE_SIZE
+    )
+    while True:
+        for message in page.data:
+            if message.role == "user":
+                return None
+            if message.run_id == run_id:
+                return message.content[0].text.value
+        if not page.has_next_page():
+            return None
+        page = await page.get_next_page()
+
+async def stream_run(client, thread_id, assistant_id, run_ref):
+    """Run the assistant with streamed events and return the reply text.
+
+    Returns as soon as the assistant message is completed; the rest of the
+    stream is drained in a background task (tracked in pending_runs) so the
+    next message on this thread waits for the run to settle. The id of the
+    run is stored in run_ref["id"] once the stream reports it.
+    """
+    loop = asyncio.get_running_loop()
+    reply = loop.create_future()
+
+    async def consume():
+        try:
+            stream = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                stream=True
+            )
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        run_ref["id"] = event.data.id
+                    elif event.event == "thread.message.completed" and not reply.done():
+                        print("Run message is completed.")
+                        reply.set_result(event.data.content[0].text.value)
+                    elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete"):
+                        print(f"Run ended without a reply: {event.event}")
+                        break
+        except Exception as e:
+            if not reply.done():
+                reply.set_exception(e)
+        finally:
+            if not reply.done():
+                reply.set_result(None)
+
+    pending_runs[thread_id] = asyncio.ensure_future(consume())
+    return await reply
+
+async def wait_for_pending_run(thread_id):
+    pending = pending_runs.pop(thread_id, None)
+    if pending is not None:
+        await pending
+
 async def GPT_response(prompt, chat_id, db_connection, message_id):
     print("GPT_response called")
     
@@ -203,9 +325,8 @@ async def GPT_response(prompt, chat_id, db_connection, message_id):
     if not thread_id:
         # If no valid thread ID exists, create a new one
         print(f"No existing thread found for chat_id: {chat_id}, creating a new thread.")
-        thread = client.beta.threads.create()
-        if thread.id:
-            thread_id = thread.id
+        thread_id = await thread_pool.acquire()
+        if thread_id:
             user_id = f"User{chat_id}"  # Generate a user_id if necessary
             await save_thread_id(chat_id, thread_id, db_connection)
             print(f"New thread created with ID: {thread_id}")
@@ -215,27 +336,47 @@ async def GPT_response(prompt, chat_id, db_connection, message_id):
 
     # Send the user's prompt to the GPT model in the correct thread
     print(f"Sending message to thread {thread_id}")
-    client.beta.threads.messages.create(
+    await wait_for_pending_run(thread_id)
+    await client.beta.threads.messages.create(
         thread_id=thread_id,
         role="user",
         content=prompt
     )
 
-    # Run the GPT model for this thread
-    run = client.beta.threads.runs.create(
-        thread_id=thread_id,
-        assistant_id=settings["assistant_id"]
-    )
+    assistant_message = None
+    run_ref = {"id": None}
+    if settings["run_mode"] != "poll":
+        # Stream the run so we can answer as soon as the reply is written
+        try:
+            assistant_message = await stream_run(client, thread_id, settings["assistant_id"], run_ref)
+        except Exception as e:
+            print(f"Streaming run failed, falling back to polling: {e}")
+
+    if assistant_message is None:
+        await wait_for_pending_run(thread_id)
+        if not run_ref["id"]:
+            # No run was started yet: run the GPT model for this thread
+            run = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=settings["assistant_id"]
+            )
+            run_ref["id"] = run.id
 
-    # Wait until the run is completed
-    await check_run(client, thread_id, run.id)
+        # Wait until the run is finished; a streamed run is polled, not re-run
+        await check_run(client, thread_id, run_ref["id"])
+
+        # Retrieve only the reply written by this run
+        assistant_message = await fetch_run_reply(client, thread_id, run_ref["id"])
+
+    if assistant_message is None:
+        # The run failed, expired or was cancelled without writing a reply
+        return {"response": "Sorry, I couldn't get a response. Please try again.", "values": {}}
 
-    # Retrieve the list of messages from the thread
-    messages = client.beta.threads.messages.list(thread_id=thread_id)
-    assistant_message = messages.data[0].content[0].text.value
-    
     # Parse the response JSON to access individual parts if needed
-    response_json = json.loads(assistant_message)
+    try:
+        response_json = json.loads(assistant_message)
+    except json.JSONDecodeError:
+        return {"response": assistant_message, "values": {}}
 
     # Return the entire response JSON without MQTT publishing
     return response_json
@@ -247,12 +388,9 @@ async def check_if_chat_id_exists(chat_id, db_connection):
     return count[0] > 0  # Returns True if there is at least one entry for the chat_id
 
 async def create_new_thread(chat_id, db_connection):
-    try:
-        # Create a new thread via OpenAI API
-        thread = client.beta.threads.create()  
-        new_thread_id = thread.id  # Extract the valid thread ID from the response
-    except Exception as e:
-        print(f"Error creating new thread: {e}")
+    # Take a pre-created thread from the pool (or create one via the OpenAI API)
+    new_thread_id = await thread_pool.acquire()
+    if not new_thread_id:
         return None, None
 
     # Generate a user_id if necessary
@@ -283,12 +421,9 @@ async def reset_user(chat_id, db_connection):
     # Generate a new user_id
     new_user_id = await generate_new_user_id(db_connection)
 
-    # Create a new thread by calling OpenAI's API to generate a valid thread ID
-    try:
-        thread = client.beta.threads.create()  # This should return a valid thread object
-        new_thread_id = thread.id  # Extract the valid thread ID from the response
-    except Exception as e:
-        print(f"Error creating new thread: {e}")
+    # Take a pre-created thread from the pool (or create one via the OpenAI API)
+    new_thread_id = await thread_pool.acquire()
+    if not new_thread_id:
         return None, None
 
     # Insert the new user_id and thread_id into the threads table
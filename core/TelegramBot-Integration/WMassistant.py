@@ -1,4 +1,3 @@
-import time
 import asyncio
 import aiosqlite
 from aiogram import Bot, Dispatcher, types, F
@@ -7,25 +6,25 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram import Router
 from aiogram.filters import Command  # Import Command filter for handling commands
 import logging
-import paho.mqtt.client as mqtt
 import sys
 import os
-import aiohttp  # Import aiohttp to handle HTTP requests
 import json
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.filters.callback_data import CallbackData
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# Global variable to track last message sent time
-last_message_time = None
-mqtt_timeout_seconds = 60  # Adjust this value (in seconds) as needed for your timeout
-
 # Add the directory containing OpenAiClientAssistant.py to the Python path
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(script_dir)
 
-from OpenAiClientAssistant import reset_user, GPT_response, whisper_transcribe, blind_response, create_new_thread, get_thread_id_and_user_id, save_conversation, save_user_and_thread_id
+from OpenAiClientAssistant import thread_pool, reset_user, GPT_response, whisper_transcribe, download_voice, blind_response, create_new_thread, get_thread_id_and_user_id, save_conversation, save_user_and_thread_id
+from ack_tracker import AckTracker
+from chat_pipeline import ChatPipeline
+from mqtt_transport import MQTTTransport
+from outbound_queue import OutboundQueue
+from state_shadow import StateShadow
+from voice_pipeline import AcknowledgementPool, LatencyStats, VoiceTimeline, start_voice_prefetch
 from settings import settings
 
 # Initialize logging
@@ -37,6 +36,14 @@ storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
 
+# Per-chat ordering, cross-chat parallelism and a cap on concurrent assistant runs
+pipeline = ChatPipeline(max_inflight_runs=settings["max_inflight_runs"])
+
+# "One moment" replies for voice notes, picked locally and refreshed in the background
+acknowledgements = AcknowledgementPool(blind_response)
+# Voice note received -> acknowledged / downloaded / transcribed / answered / published
+voice_latency = LatencyStats()
+
 # MQTT settings
 broker = settings["broker"]
 port = 1883
@@ -44,68 +51,69 @@ topic = settings["topic"]
 mqtt_user = settings["mqtt_user"]
 mqtt_password = settings["mqtt_password"]
 
-# MQTT Client setup
-clientQ = mqtt.Client(client_id=settings["client_id"])
-clientQ.username_pw_set(mqtt_user, password=mqtt_password)
-
-async def monitor_mqtt_connection():
-    global last_message_time
-    while True:
-        try:
-            # Send a ping to keep the connection alive
-            clientQ.loop()
-            if last_message_time and (time.time() - last_message_time) > mqtt_timeout_seconds:
-                print("No MQTT message sent recently. Reconnecting...")
-                clientQ.reconnect()  # Attempt to reconnect
-                print("Reconnected to MQTT broker.")
-                last_message_time = time.time()  # Reset the timer after reconnection
-            await asyncio.sleep(10)  # Sleep for 10 seconds before the next check
-        except Exception as e:
-            print(f"Error in MQTT monitoring: {e}")
-            await asyncio.sleep(30)  # Wait longer before retrying if there's an error
-
-def on_connect(clientQ, userdata, flags, rc):
-    if rc == 0:
+def on_connect(code):
+    if code == 0:
         print("Connected successfully to MQTT broker")
     else:
-        print(f"Connection failed with code {rc}")
-
-def on_disconnect(clientQ, userdata, rc):
-    if rc != 0:
-        print("Unexpected disconnection. Will attempt to reconnect.")
-        try:
-            clientQ.loop_stop()  # Stop the current loop
-            clientQ.disconnect()  # Ensure the client is fully disconnected
-            clientQ.reconnect()   # Try to reconnect
-            print("Reconnected successfully.")
-            clientQ.loop_start()  # Restart the loop after reconnecting
-        except Exception as e:
-            print(f"Reconnection attempt failed: {e}")
-
-
-# Asynchronous function to establish a connection to the broker with retries
-async def connect_with_retries(clientQ, broker, port, max_retries=5):
-    retries = 0
-    while retries < max_retries:
-        try:
-            clientQ.connect(broker, port, keepalive=60)  # Try connecting
-            clientQ.loop_start()  # Start the MQTT loop
-            print("Connected to MQTT broker.")
-            return
-        except Exception as e:
-            print(f"Connection attempt {retries + 1} failed: {e}")
-            retries += 1
-            await asyncio.sleep(2 ** retries)  # Exponential backoff
-    print("Failed to connect after multiple attempts. Exiting.")
-    exit(1)
-
-clientQ.on_connect = on_connect
-clientQ.on_disconnect = on_disconnect
+        print(f"Connection failed with code {code}")
+
+def on_disconnect(code):
+    if code != 0:
+        print("Unexpected disconnection. Reconnecting in the background.")
+
+# MQTT client on the bot's event loop; keepalive and reconnects are handled by it
+clientQ = MQTTTransport(
+    client_id=settings["client_id"],
+    username=mqtt_user,
+    password=mqtt_password,
+    on_connect=on_connect,
+    on_disconnect=on_disconnect,
+)
+# With MQTT_DELTA only the values that changed are sent, plus periodic full states
+shadow = None
+if settings["mqtt_delta"]:
+    shadow = StateShadow(keyframe_every=settings["mqtt_keyframe_every"], keyframe_seconds=settings["mqtt_keyframe_seconds"])
+# Values wait here while the broker is unreachable, keeping only the newest state
+outbox = OutboundQueue(clientQ, depth=settings["mqtt_queue_depth"], coalesce=settings["mqtt_coalesce"], shadow=shadow)
+# With MQTT_ACKS the board acks each payload on <topic>/ack and unacked state is resent
+acks = None
+if settings["mqtt_acks"]:
+    acks = AckTracker(outbox, topic, timeout=settings["mqtt_ack_timeout"], retries=settings["mqtt_ack_retries"])
+
+
+# Connect to the broker; if it is unreachable the transport keeps retrying in the
+# background (with exponential backoff) and the outbox holds values meanwhile
+async def connect_mqtt(clientQ, broker, port):
+    try:
+        if not await clientQ.connect(broker, port, retry=True):
+            print("MQTT broker unreachable; retrying in the background and queueing values meanwhile")
+    except Exception as e:
+        print(f"Unable to connect to MQTT broker: {e}")
+
+
+async def publish_values(values):
+    print(f"Publishing values to MQTT topic {topic}: {values}")
+    payload = json.dumps(values)
+    sent = await acks.publish(payload) if acks is not None else await outbox.publish(topic, payload)
+    if sent:
+        print(f"Published to MQTT: {values}")
+    elif clientQ.connected.is_set():
+        print(f"MQTT publish of {values} was not confirmed")
+    else:
+        stats = outbox.stats()
+        print(f"MQTT broker unreachable; values held for the reconnect "
+              f"(queued {stats['depth']}, coalesced {stats['coalesced']}, dropped {stats['dropped']})")
 
 
 # Command handler for /resetuser
 @router.message(Command(commands=["resetuser"]))
 async def reset_user_command(message: types.Message):
+    # Wait for this chat's in-flight messages before swapping its thread
+    async with pipeline.chat_turn(message.chat.id):
+        await reset_user_for_chat(message)
+
+
+async def reset_user_for_chat(message: types.Message):
     chat_id = message.chat.id
 
     # Reset user and create a new thread (returns new_user_id and new_thread_id)
@@ -269,6 +277,30 @@ async def consent_callback_handler(callback_query: types.CallbackQuery, callback
 # Handling user messages for both text and voice
 @router.message(F.content_type.in_([ContentType.TEXT, ContentType.VOICE]))
 async def handle_user_message(message: types.Message):
+    # Voice notes are acknowledged, downloaded and transcribed right away, while
+    # the turn below may still be waiting for this chat's earlier messages
+    voice = start_voice_note(message) if message.content_type == ContentType.VOICE else None
+
+    # aiogram runs each update as its own task; the pipeline keeps one chat's
+    # messages in order while other chats are answered in parallel
+    async with pipeline.chat_turn(message.chat.id):
+        await process_user_message(message, voice)
+
+
+def start_voice_note(message: types.Message):
+    """Starts the acknowledgement, download and transcription of a voice note."""
+    timeline = VoiceTimeline()
+
+    async def acknowledge():
+        await bot.send_message(chat_id=message.chat.id, text=acknowledgements.next(), reply_to_message_id=message.message_id)
+
+    async def download():
+        return await download_voice(bot, message.voice.file_id)
+
+    return start_voice_prefetch(acknowledge, download, whisper_transcribe, timeline), timeline
+
+
+async def process_user_message(message: types.Message, voice=None):
     chat_id = message.chat.id
     message_id = message.message_id  # Unique ID for each user's message
 
@@ -287,6 +319,8 @@ async def handle_user_message(message: types.Message):
 
     if count[0] > 0:
         print(f"User message {message_id} for chat_id {chat_id} has already been processed. Skipping.")
+        if voice:
+            voice[0].cancel()
         return  # Avoid processing the same message again
 
     if message.content_type == ContentType.TEXT:
@@ -296,62 +330,54 @@ async def handle_user_message(message: types.Message):
         await save_conversation(chat_id, user_id, thread_id, settings["assistant_id"], "user", prompt, db_connection, message_id)
 
         # Generate assistant's response (it returns the full response including values)
-        gpt_response = await GPT_response(prompt, chat_id, db_connection, message_id)
+        async with pipeline.llm_slot():
+            gpt_response = await GPT_response(prompt, chat_id, db_connection, message_id)
         
         # Extract the `response` (assistant's message) and `values` (MQTT payload) from the GPT response
         response_text = gpt_response.get("response", "")
         values = gpt_response.get("values", {})
 
+        # Send `values` to MQTT first so the windmills move while the reply is delivered
+        if values:
+            await publish_values(values)
+
         # Send the assistant's response back to the user via Telegram
         await bot.send_message(chat_id=chat_id, text=response_text, reply_to_message_id=message.message_id)
 
-        # Send `values` to MQTT if available
-        if values:
-            print(f"Publishing values to MQTT topic {topic}: {values}")
-            clientQ.publish(topic, json.dumps(values))
-            print(f"Published to MQTT: {values}")
-
         # Save the assistant's response with the new message_id
         assistant_message_id = f"{message_id}_assistant"
         await save_conversation(chat_id, user_id, thread_id, settings["assistant_id"], "assistant", json.dumps(gpt_response), db_connection, assistant_message_id)
 
     elif message.content_type == ContentType.VOICE:
-        file_id = message.voice.file_id
-        blind_acknowledgment = await blind_response("write a casual text message no more than 10 words in response to someone who sent a voice message to you but you need a moment to first listen to it and then answer!")
-        await bot.send_message(chat_id=chat_id, text=blind_acknowledgment, reply_to_message_id=message.message_id)
-
-        # Process and transcribe the voice message
-        file_info = await bot.get_file(file_id)
-        file_path = file_info.file_path
-        file_url = f"https://api.telegram.org/file/bot{settings['telepotToken']}/{file_path}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url) as response:
-                if response.status == 200:
-                    with open("temp_voice.ogg", "wb") as f:
-                        f.write(await response.read())
-
-        transcription = await whisper_transcribe("temp_voice.ogg")
+        # Usually already acknowledged and transcribed while this turn was queued
+        prefetch, timeline = voice or start_voice_note(message)
+        transcription = await prefetch
 
         if transcription:
             # Save the user transcription
             await save_conversation(chat_id, user_id, thread_id, settings["assistant_id"], "user", transcription, db_connection, message_id)
 
             # Generate assistant's response
-            gpt_response = await GPT_response(transcription, chat_id, db_connection, message_id)
+            async with pipeline.llm_slot():
+                gpt_response = await GPT_response(transcription, chat_id, db_connection, message_id)
+            timeline.mark("answered")
 
             # Extract the `response` (assistant's message) and `values` (MQTT payload) from the GPT response
             response_text = gpt_response.get("response", "")
             values = gpt_response.get("values", {})
 
+            # Send `values` to MQTT first so the windmills move while the reply is delivered
+            if values:
+                await publish_values(values)
+                timeline.mark("published")
+
             # Send the assistant's response back to the user via Telegram
             await bot.send_message(chat_id=chat_id, text=response_text, reply_to_message_id=message.message_id)
 
-            # Send `values` to MQTT if available
-            if values:
-                print(f"Publishing values to MQTT topic {topic}: {values}")
-                clientQ.publish(topic, json.dumps(values))
-                print(f"Published to MQTT: {values}")
+            voice_latency.add(timeline)
+            logging.info(f"Voice note {message_id}: {timeline.summary()}")
+            if voice_latency.count % 20 == 0:
+                logging.info(f"Voice latency over the last {len(voice_latency.samples['transcribed'])} notes: {voice_latency.summary()}")
 
             # Save the assistant's response with the new message_id
             assistant_message_id = f"{message_id}_assistant"
@@ -378,11 +404,16 @@ async def main():
         types.BotCommand(command="consent", description="Open consent form")  # Add /consent here
     ])
 
-    # Connect to the MQTT broker with retries
-    await connect_with_retries(clientQ, broker, port)
+    # Connect to the MQTT broker (retried in the background while it is unreachable)
+    await connect_mqtt(clientQ, broker, port)
+    if acks is not None and not await acks.start():
+        print(f"Could not subscribe to {acks.ack_topic}; device acks will not arrive")
+
+    # Generate fresh acknowledgement phrases in the background
+    acknowledgements.start()
 
-    # Start the MQTT monitoring task in the background
-    asyncio.create_task(monitor_mqtt_connection())
+    # Keep a few empty assistant threads ready for new chats and /resetuser
+    thread_pool.start()
 
     # Include the router into the dispatcher (for handling commands like /start, /resetuser, /consent)
     dp.include_router(router)
@@ -390,7 +421,12 @@ async def main():
     # Start polling for Telegram messages
     await dp.start_polling(bot, skip_updates=True)
 
-    # Close the database connection when done
+    # Send what is still queued, then close MQTT, the spare threads and the database
+    if acks is not None:
+        acks.close()
+    await outbox.close()
+    await clientQ.disconnect()
+    await thread_pool.close()
     await db_connection.close()
 
 
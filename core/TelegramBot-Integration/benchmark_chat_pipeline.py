@@ -0,0 +1,141 @@
+#benchmark_chat_pipeline.py
+"""Show how bot throughput scales with the number of simultaneous chats.
+
+Text messages go through the bot's real handler (WMassistant.handle_user_message):
+ChatPipeline, the SQLite conversation log, the thread pool and GPT_response with
+its streamed run. Only the outside world is replaced: Telegram by a fake bot
+that records each reply after `--send` seconds, OpenAI by mock_openai_server
+(`--latency` seconds per run plus `--rtt` per request), and the MQTT broker is
+left unreachable, so values are held in the outbox. The "serialized" column runs
+every update through one lock, which is what the bot did while the OpenAI calls
+blocked the event loop; the "pipeline" column uses ChatPipeline with the given
+run cap.
+
+    python benchmark_chat_pipeline.py --latency 0.5 --messages 3 --max-inflight 8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import logging
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from mock_openai_server import MockOpenAIServer
+
+
+class FakeBot:
+    """Stands in for aiogram's Bot: records replies instead of calling Telegram."""
+
+    def __init__(self, send_latency):
+        self.send_latency = send_latency
+        self.replies = {}
+
+    async def send_message(self, chat_id, text, reply_to_message_id=None, **kwargs):
+        await asyncio.sleep(self.send_latency)
+        self.replies.setdefault(chat_id, []).append(reply_to_message_id)
+
+
+def configure(args, server_url, db_path):
+    # settings.py reads these at import time; everything points at local fakes
+    os.environ.update(
+        OPENAI_BASE_URL=server_url,
+        OPENAI_API_KEY_PRIMARY="mock",
+        OPENAI_API_KEY_SECONDARY="mock",
+        OPENAI_ASSISTANT_ID="asst_mock",
+        OPENAI_RUN_MODE="stream",
+        TELEGRAM_BOT_TOKEN="123456:mock-token",
+        MQTT_BROKER="127.0.0.1",
+        MQTT_USER="mock",
+        MQTT_PASSWORD="mock",
+        DB_PATH=db_path,
+        MAX_INFLIGHT_RUNS=str(args.max_inflight),
+    )
+
+
+async def simulate(bot_module, chats, messages_per_chat, serialized):
+    serial_lock = asyncio.Lock()
+    message_ids = itertools.count(int(time.time() * 1000))
+    bot_module.bot.replies.clear()
+    sent = {chat_id: [] for chat_id in range(chats)}
+
+    async def handle(chat_id):
+        message_id = next(message_ids)
+        sent[chat_id].append(message_id)
+        message = SimpleNamespace(
+            chat=SimpleNamespace(id=chat_id),
+            message_id=message_id,
+            content_type=bot_module.ContentType.TEXT,
+            text="spin the windmills a bit faster",
+        )
+        if serialized:
+            async with serial_lock:
+                await bot_module.handle_user_message(message)
+        else:
+            await bot_module.handle_user_message(message)
+
+    start = time.perf_counter()
+    # Interleave chats the way updates arrive from Telegram: message n of every chat, then n + 1
+    await asyncio.gather(*(handle(chat_id) for _ in range(messages_per_chat) for chat_id in range(chats)))
+    elapsed = time.perf_counter() - start
+
+    in_order = all(bot_module.bot.replies.get(chat_id) == ids for chat_id, ids in sent.items())
+    return chats * messages_per_chat / elapsed, in_order
+
+
+async def run(args):
+    import aiosqlite
+
+    import WMassistant
+    from chat_pipeline import ChatPipeline
+    from OpenAiClientAssistant import init_db
+
+    # The handlers print every step; keep the table readable
+    logging.getLogger().setLevel(logging.WARNING)
+    WMassistant.bot = FakeBot(args.send)
+    with contextlib.redirect_stdout(io.StringIO()):
+        await init_db()
+    WMassistant.db_connection = await aiosqlite.connect(WMassistant.settings["DB"])
+
+    print(f"latency={args.latency}s rtt={args.rtt}s send={args.send}s messages/chat={args.messages} max_inflight={args.max_inflight}")
+    print(f"{'chats':>6} {'serialized msg/s':>17} {'pipeline msg/s':>15} {'speedup':>8} {'peak runs':>10} {'ordered':>8}")
+    try:
+        for chats in args.chats:
+            with contextlib.redirect_stdout(io.StringIO()):
+                serial_rate, _ = await simulate(WMassistant, chats, args.messages, serialized=True)
+                WMassistant.pipeline = ChatPipeline(max_inflight_runs=args.max_inflight)
+                pipeline_rate, in_order = await simulate(WMassistant, chats, args.messages, serialized=False)
+            print(
+                f"{chats:>6} {serial_rate:>17.2f} {pipeline_rate:>15.2f} "
+                f"{pipeline_rate / serial_rate:>7.1f}x {WMassistant.pipeline.peak_inflight_runs:>10} {str(in_order):>8}"
+            )
+    finally:
+        await WMassistant.outbox.close(timeout=0)
+        await WMassistant.thread_pool.close()
+        await WMassistant.db_connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds the mock assistant takes per run")
+    parser.add_argument("--rtt", type=float, default=0.02, help="seconds added to every OpenAI request")
+    parser.add_argument("--send", type=float, default=0.05, help="seconds per Telegram send_message")
+    parser.add_argument("--messages", type=int, default=3, help="messages sent by each chat")
+    parser.add_argument("--max-inflight", type=int, default=8, help="MAX_INFLIGHT_RUNS for the pipeline")
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(rtt=args.rtt, generation_time=args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(args, server.start(), os.path.join(tmp, "benchmark.db"))
+        try:
+            asyncio.run(run(args))
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#benchmark_voice_pipeline.py
+"""Time from a voice note arriving to the MQTT publish, old path vs concurrent.
+
+Each stage is simulated with its typical latency (override on the command
+line). The "sequential" path is what the bot used to do: generate a blind
+acknowledgement with a chat completion, send it, download the file, transcribe,
+run the assistant, send the reply and only then publish. The "concurrent" path
+uses voice_pipeline: a pooled acknowledgement sent while the file downloads,
+transcription straight after the download, prefetching while an earlier message
+of the same chat is still being answered, and publishing before the reply.
+
+    python benchmark_voice_pipeline.py --notes 2 --assistant 2.0
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from chat_pipeline import ChatPipeline
+from voice_pipeline import AcknowledgementPool, VoiceTimeline, start_voice_prefetch
+
+
+async def sequential(args, lock):
+    received = time.perf_counter()
+    async with lock:
+        await asyncio.sleep(args.completion)  # blind_response
+        await asyncio.sleep(args.send)  # acknowledgement
+        await asyncio.sleep(args.download)
+        await asyncio.sleep(args.transcribe)
+        await asyncio.sleep(args.assistant)
+        await asyncio.sleep(args.send)  # reply
+        return time.perf_counter() - received
+
+
+async def concurrent(args, pipeline, acknowledgements):
+    timeline = VoiceTimeline()
+
+    async def acknowledge():
+        acknowledgements.next()
+        await asyncio.sleep(args.send)
+
+    async def download():
+        await asyncio.sleep(args.download)
+        return b"voice"
+
+    async def transcribe(audio):
+        await asyncio.sleep(args.transcribe)
+        return "make them spin"
+
+    prefetch = start_voice_prefetch(acknowledge, download, transcribe, timeline)
+    async with pipeline.chat_turn(0):
+        await prefetch
+        async with pipeline.llm_slot():
+            await asyncio.sleep(args.assistant)
+        timeline.mark("published")
+        await asyncio.sleep(args.send)  # reply
+    return timeline.marks["published"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2, help="voice notes sent back to back by one chat")
+    parser.add_argument("--completion", type=float, default=0.8, help="blind acknowledgement completion (s)")
+    parser.add_argument("--send", type=float, default=0.15, help="one Telegram send_message (s)")
+    parser.add_argument("--download", type=float, default=0.3, help="get_file + download (s)")
+    parser.add_argument("--transcribe", type=float, default=0.9, help="transcription (s)")
+    parser.add_argument("--assistant", type=float, default=2.0, help="assistant run (s)")
+    args = parser.parse_args()
+
+    acknowledgements = AcknowledgementPool(generate=None)
+    old = await sequential(args, asyncio.Lock())
+    lock = asyncio.Lock()
+    old_burst = await asyncio.gather(*(sequential(args, lock) for _ in range(args.notes)))
+    new = await concurrent(args, ChatPipeline(), acknowledgements)
+    pipeline = ChatPipeline()
+    new_burst = await asyncio.gather(*(concurrent(args, pipeline, acknowledgements) for _ in range(args.notes)))
+
+    print("seconds from voice note received to MQTT publish")
+    print(f"{'':>12} {'single':>8} {f'{args.notes} queued (mean)':>18}")
+    print(f"{'sequential':>12} {old:>8.2f} {statistics.mean(old_burst):>18.2f}")
+    print(f"{'concurrent':>12} {new:>8.2f} {statistics.mean(new_burst):>18.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
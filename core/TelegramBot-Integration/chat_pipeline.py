@@ -0,0 +1,48 @@
+#chat_pipeline.py
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class ChatPipeline:
+    """Schedules bot work so chats run in parallel but each chat stays in order.
+
+    aiogram handles every update in its own task. `chat_turn` makes the tasks of
+    one chat wait for each other (asyncio.Lock is FIFO, so replies keep the order
+    the messages were sent in), while different chats never wait on each other.
+    `llm_slot` caps how many assistant runs are in flight across all chats.
+    """
+
+    def __init__(self, max_inflight_runs=8):
+        self.max_inflight_runs = max_inflight_runs
+        self._run_slots = asyncio.Semaphore(max_inflight_runs)
+        self._chat_locks = {}
+        self._chat_waiting = {}
+        self.inflight_runs = 0
+        self.peak_inflight_runs = 0
+
+    @asynccontextmanager
+    async def chat_turn(self, chat_id):
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiting[chat_id] = self._chat_waiting.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._chat_waiting[chat_id] -= 1
+            if not self._chat_waiting[chat_id]:
+                # Nobody else is queued for this chat; drop its lock
+                del self._chat_waiting[chat_id]
+                del self._chat_locks[chat_id]
+
+    @asynccontextmanager
+    async def llm_slot(self):
+        async with self._run_slots:
+            self.inflight_runs += 1
+            self.peak_inflight_runs = max(self.peak_inflight_runs, self.inflight_runs)
+            try:
+                yield
+            finally:
+                self.inflight_runs -= 1
+
+    def active_chats(self):
+        return len(self._chat_locks)
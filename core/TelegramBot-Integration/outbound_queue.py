@@ -0,0 +1,238 @@
+"""Per-topic outbound MQTT queue that keeps only the newest device state.
+
+``MQTTClient.publish`` used to drop a payload whenever the broker was
+unreachable, so a Wi-Fi blip during a reply lost that change.  Payloads now
+go through an ``OutboundQueue``: a single sender task publishes them in
+order while connected, and holds them while the broker is away, flushing as
+soon as ``MQTTTransport`` has reconnected.
+
+With ``coalesce`` (the default) a topic holds at most one pending payload.
+A newer JSON object is merged over the pending one key by key (each key is a
+device setting such as ``speed_para``), and any other payload replaces it,
+so rapid-fire prompts or a long outage cost one broker message carrying the
+latest state.  Without it, up to ``depth`` payloads per topic are kept in
+order and the oldest is dropped beyond that.  ``stats()`` reports the depth
+and the coalesced/dropped/sent counters.
+
+Given a ``StateShadow``, JSON objects are delta-encoded against the state
+last delivered on their topic when they are sent, not when queued, so a
+delta always describes the change from what the device last received.  A
+payload that changes nothing is not sent; its future resolves to None
+rather than True, so an ``AckTracker`` does not wait for an ack that will
+never come.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import logging
+from typing import Any, Deque, Dict, List, Optional
+
+
+class _Pending:
+    __slots__ = ("payload", "state", "waiters")
+
+    def __init__(self, payload: Any, state: Optional[dict], waiter: asyncio.Future) -> None:
+        self.payload = payload
+        self.state = state
+        self.waiters: List[asyncio.Future] = [waiter]
+
+    def absorb(self, newer: "_Pending") -> None:
+        """Fold a newer payload for the same topic into this one."""
+        if self.state is not None and newer.state is not None:
+            self.state = {**self.state, **newer.state}
+            self.payload = json.dumps(self.state)
+        else:
+            self.state, self.payload = newer.state, newer.payload
+        self.waiters.extend(newer.waiters)
+
+    def resolve(self, sent: Optional[bool]) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(sent)
+
+
+def _as_state(payload: Any) -> Optional[dict]:
+    try:
+        state = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+
+class OutboundQueue:
+    """Bounded per-topic queue in front of an ``MQTTTransport``."""
+
+    def __init__(
+        self,
+        transport,
+        *,
+        depth: int = 16,
+        coalesce: bool = True,
+        qos: int = 0,
+        shadow=None,
+    ) -> None:
+        self.transport = transport
+        self.shadow = shadow
+        self.depth = max(1, depth)
+        self.coalesce = coalesce
+        self.qos = qos
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._pending: "collections.OrderedDict[str, Deque[_Pending]]" = collections.OrderedDict()
+        self._has_pending = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self._reconnects = transport.reconnects
+
+    def put(self, topic: str, payload: Any) -> asyncio.Future:
+        """Queue ``payload``; the future resolves True once it (or a newer
+        state merged into it) has been published, None if the shadow found
+        nothing to send, and False if it was dropped."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        parse = self.coalesce or self.shadow is not None
+        entry = _Pending(payload, _as_state(payload) if parse else None, loop.create_future())
+        queue = self._pending.setdefault(topic, collections.deque())
+        if self.coalesce and queue:
+            queue[-1].absorb(entry)
+            self.coalesced += 1
+        else:
+            if len(queue) >= self.depth:
+                queue.popleft().resolve(False)
+                self.dropped += 1
+            queue.append(entry)
+        self._has_pending.set()
+        self._idle.clear()
+        return entry.waiters[-1]
+
+    async def publish(self, topic: str, payload: Any, *, timeout: float = 10.0) -> bool:
+        """Queue ``payload`` and wait until it is sent.
+
+        Returns False straight away while the broker is unreachable (the
+        payload stays queued), or after ``timeout`` seconds.
+        """
+        return await self.wait(self.put(topic, payload), timeout=timeout)
+
+    async def wait(self, delivery: asyncio.Future, *, timeout: float = 10.0) -> bool:
+        """Wait for a future returned by ``put``, as ``publish`` does.
+
+        An unchanged state needs no publish and counts as sent.
+        """
+        if not self.transport.connected.is_set():
+            return False
+        try:
+            # Shielded: giving up on waiting must not unqueue the payload.
+            return await asyncio.wait_for(asyncio.shield(delivery), timeout) is not False
+        except asyncio.TimeoutError:
+            return False
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued payload has been sent; False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, timeout: float = 2.0) -> None:
+        """Give queued payloads ``timeout`` seconds to go out, then stop."""
+        if self.transport.connected.is_set():
+            await self.flush(timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in self._pending.values():
+            for entry in queue:
+                entry.resolve(False)
+        self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "depth": sum(len(queue) for queue in self._pending.values()),
+            "topics": len(self._pending),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+        if self.shadow is not None:
+            stats.update(self.shadow.stats())
+        return stats
+
+    def _pop(self) -> tuple[str, _Pending]:
+        # Round-robin over topics so a busy one cannot starve the others.
+        topic, queue = next(iter(self._pending.items()))
+        entry = queue.popleft()
+        if queue:
+            self._pending.move_to_end(topic)
+        else:
+            del self._pending[topic]
+        return topic, entry
+
+    def _requeue(self, topic: str, entry: _Pending) -> None:
+        queue = self._pending.setdefault(topic, collections.deque())
+        self._pending.move_to_end(topic, last=False)
+        if self.coalesce and queue:
+            # Anything queued meanwhile is newer; keep it on top.
+            entry.absorb(queue.popleft())
+            self.coalesced += 1
+        elif len(queue) >= self.depth:
+            # It is the oldest payload of the topic.
+            entry.resolve(False)
+            self.dropped += 1
+            return
+        queue.appendleft(entry)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._has_pending.clear()
+                self._idle.set()
+                await self._has_pending.wait()
+            if not self.transport.connected.is_set():
+                held = self.stats()["depth"]
+                logging.info("MQTT broker unreachable; holding %d queued payload(s)", held)
+                await self.transport.connected.wait()
+                logging.info("MQTT reconnected; flushing %d queued payload(s)", self.stats()["depth"])
+            topic, entry = self._pop()
+            payload, keyframe = entry.payload, False
+            if self.shadow is not None and entry.state is not None:
+                if self.transport.reconnects != self._reconnects:
+                    # The board may have rebooted while we were away.
+                    self._reconnects = self.transport.reconnects
+                    self.shadow.invalidate()
+                payload, keyframe = self.shadow.encode(topic, entry.state)
+                if payload is None:
+                    self.shadow.commit(topic, entry.state, None, False)
+                    entry.resolve(None)
+                    continue
+            try:
+                sent = await self.transport.publish(topic, payload, qos=self.qos)
+            except Exception as exc:
+                logging.error("MQTT publish to %s failed: %s", topic, exc)
+                sent = False
+            if sent:
+                self.sent += 1
+                if self.shadow is not None and entry.state is not None:
+                    self.shadow.commit(topic, entry.state, payload, keyframe)
+                entry.resolve(True)
+            elif not self.transport.connected.is_set():
+                # Lost the connection mid-publish: send it after reconnecting.
+                self._requeue(topic, entry)
+            else:
+                self.failed += 1
+                entry.resolve(False)
+
+
+__all__ = ["OutboundQueue"]
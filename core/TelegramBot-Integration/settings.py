@@ -40,9 +40,27 @@ settings = {
     "mqtt_password": _require("MQTT_PASSWORD"),
     "telepotToken": _require("TELEGRAM_BOT_TOKEN"),
     "client_id": os.getenv("MQTT_CLIENT_ID", "WM_Sender"),
+    # Values held per topic while the broker is unreachable; coalescing keeps only the newest
+    "mqtt_queue_depth": int(os.getenv("MQTT_QUEUE_DEPTH", "16")),
+    "mqtt_coalesce": os.getenv("MQTT_COALESCE", "true").lower() in ("1", "true", "yes"),
+    # Send only the values that changed, with a full state every N messages or S seconds
+    "mqtt_delta": os.getenv("MQTT_DELTA", "false").lower() in ("1", "true", "yes"),
+    "mqtt_keyframe_every": int(os.getenv("MQTT_KEYFRAME_EVERY", "20")),
+    "mqtt_keyframe_seconds": float(os.getenv("MQTT_KEYFRAME_SECONDS", "60")),
+    # The board acks each payload on <topic>/ack; unacked state is resent
+    "mqtt_acks": os.getenv("MQTT_ACKS", "false").lower() in ("1", "true", "yes"),
+    "mqtt_ack_timeout": float(os.getenv("MQTT_ACK_TIMEOUT", "2")),
+    "mqtt_ack_retries": int(os.getenv("MQTT_ACK_RETRIES", "3")),
     "openAIToken": _require("OPENAI_API_KEY_PRIMARY"),
     "assistant_id": _require("OPENAI_ASSISTANT_ID"),
     "openAIToken2": _require("OPENAI_API_KEY_SECONDARY"),
+    "run_mode": os.getenv("OPENAI_RUN_MODE", "stream"),
+    "openai_max_connections": int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+    "max_inflight_runs": int(os.getenv("MAX_INFLIGHT_RUNS", "8")),
+    "thread_pool_size": int(os.getenv("THREAD_POOL_SIZE", "4")),
+    "thread_pool_max_age": float(os.getenv("THREAD_POOL_MAX_AGE", "3600")),
+    # "local:tiny.en", "local:base.en", ... transcribes on this machine (faster-whisper).
+    "transcription_model": os.getenv("TRANSCRIPTION_MODEL", "whisper-1"),
     "Welcom_msg": """👋 Hey! You're chatting with a bot that can reprogram the Windmill Sculpture! like ChatGPT but can also change the windmills' speed
 
 💬 Start sending a message and see how it goes.
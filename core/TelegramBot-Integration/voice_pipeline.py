@@ -0,0 +1,152 @@
+#voice_pipeline.py
+import asyncio
+import collections
+import logging
+import random
+import time
+
+
+DEFAULT_ACKNOWLEDGEMENTS = [
+    "Got it, give me a sec to listen 🎧",
+    "One moment, listening to your message now!",
+    "Hang on, playing your voice note 👂",
+    "Ooh a voice note! Listening...",
+    "Give me a second to hear this out",
+    "Listening now, back in a moment!",
+    "Just a sec, tuning in to your message",
+    "Hold on, let me hear what you said",
+]
+
+ACKNOWLEDGEMENT_PROMPT = (
+    "Write {count} different casual text messages, no more than 10 words each, in response to "
+    "someone who sent a voice message to you but you need a moment to first listen to it and "
+    "then answer! Put each message on its own line, without numbering or quotes."
+)
+
+
+class AcknowledgementPool:
+    """Ready-made "one moment" replies for voice notes.
+
+    Picking a phrase is instant, so the acknowledgement no longer waits for a
+    chat completion. The pool starts with DEFAULT_ACKNOWLEDGEMENTS and is
+    refreshed in the background with `generate` (e.g. blind_response), so the
+    wording keeps varying without being on any message's critical path.
+    """
+
+    def __init__(self, generate, phrases=None, size=24, refresh_seconds=6 * 3600):
+        self.generate = generate
+        self.phrases = list(phrases or DEFAULT_ACKNOWLEDGEMENTS)
+        self.size = size
+        self.refresh_seconds = refresh_seconds
+        self.refreshed_at = None
+        self._last = None
+        self._task = None
+
+    def next(self):
+        choices = [phrase for phrase in self.phrases if phrase != self._last] or self.phrases
+        self._last = random.choice(choices)
+        return self._last
+
+    async def refresh(self):
+        text = await self.generate(ACKNOWLEDGEMENT_PROMPT.format(count=self.size))
+        phrases = []
+        for line in (text or "").splitlines():
+            phrase = line.strip().lstrip("-*•0123456789.) ").strip().strip('"')
+            if 3 <= len(phrase) <= 80 and phrase not in phrases:
+                phrases.append(phrase)
+        if len(phrases) < max(3, self.size // 2):
+            logging.warning(f"Acknowledgement refresh returned {len(phrases)} usable phrases; keeping the current pool")
+            return False
+        self.phrases = phrases
+        self.refreshed_at = time.time()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Could not refresh acknowledgements: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+
+class VoiceTimeline:
+    """Seconds from receiving a voice note to each stage of its handling."""
+
+    STAGES = ("acknowledged", "downloaded", "transcribed", "answered", "published")
+
+    def __init__(self):
+        self.received = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, stage):
+        self.marks[stage] = time.perf_counter() - self.received
+
+    def summary(self):
+        return ", ".join(f"{stage} {self.marks[stage]:.2f}s" for stage in self.STAGES if stage in self.marks)
+
+
+class LatencyStats:
+    """Rolling per-stage latency percentiles over the last `window` voice notes."""
+
+    def __init__(self, window=200):
+        self.samples = {stage: collections.deque(maxlen=window) for stage in VoiceTimeline.STAGES}
+        self.count = 0
+
+    def add(self, timeline):
+        self.count += 1
+        for stage, seconds in timeline.marks.items():
+            self.samples[stage].append(seconds)
+
+    def summary(self):
+        parts = []
+        for stage, values in self.samples.items():
+            if values:
+                ordered = sorted(values)
+                p50 = ordered[len(ordered) // 2]
+                p95 = ordered[int(0.95 * (len(ordered) - 1))]
+                parts.append(f"{stage} p50 {p50:.2f}s p95 {p95:.2f}s")
+        return "; ".join(parts)
+
+
+def start_voice_prefetch(acknowledge, download, transcribe, timeline):
+    """Acknowledge, download and transcribe a voice note as one background task.
+
+    The acknowledgement is sent while the file downloads, and transcription
+    starts as soon as the download has finished. The task's result is the
+    transcript ("" when the download failed).
+    """
+
+    async def acknowledge_and_mark():
+        await acknowledge()
+        timeline.mark("acknowledged")
+
+    async def run():
+        ack = asyncio.create_task(acknowledge_and_mark())
+        try:
+            audio = await download()
+            timeline.mark("downloaded")
+            transcript = await transcribe(audio) if audio else ""
+            timeline.mark("transcribed")
+            return transcript
+        finally:
+            # Normally long done; awaiting keeps the task referenced until then
+            try:
+                await ack
+            except Exception as e:
+                logging.error(f"Could not send voice acknowledgement: {e}")
+
+    return asyncio.create_task(run())
@@ -1,9 +1,10 @@
 import time
 import board
 from adafruit_motorkit import MotorKit
-from MQTT import Create_MQTT
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 import json
+import payload_codec
 from digitalio import DigitalInOut, Direction, Pull
 
 # Initialize variables for the three motors
@@ -36,13 +37,25 @@ def handle_message(client, topic, m):
     print(f"New message on topic {topic}: {m}")
 
     try:
-        # Clean up the message to avoid issues with extra whitespace or control characters
-        cleaned_message = m.strip()
-        print(f"Cleaned message: {cleaned_message}")
+        cleaned_message = m
+        if m and m[0] == payload_codec.MAGIC:
+            # Binary payload (see payload_codec.py); never strip it
+            data = payload_codec.decode(m)
+            print(f"Binary payload decoded: {data}")
+        else:
+            # Clean up the message to avoid issues with extra whitespace or control characters
+            cleaned_message = (m if isinstance(m, str) else str(m, "utf-8")).strip()
+            print(f"Cleaned message: {cleaned_message}")
+
+            # Attempt to parse the cleaned message payload as JSON
+            data = json.loads(cleaned_message)
+            print(f"JSON parsed successfully: {data}")
 
-        # Attempt to parse the cleaned message payload as JSON
-        data = json.loads(cleaned_message)
-        print(f"JSON parsed successfully: {data}")
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Already applied; the host did not get our ack
+            Ack(client, topic, seq)
+            return
 
         # Extract and update the variables from the parsed JSON data
         if "speed_para" in data:
@@ -70,6 +83,9 @@ def handle_message(client, topic, m):
         # Reset i when a new message is received
         i = 0
 
+        # Tell the host the new values are in effect
+        Ack(client, topic, seq)
+
     except ValueError as e:
         print(f"JSON decode error: {e}")
         print(f"Original message content: {m}")  # Log the problematic message for debugging
@@ -84,7 +100,8 @@ client_id = settings["client_id"]
 group_number = "wind"
 
 # Create an MQTT client and set the message handling function
-mqtt_client = Create_MQTT(client_id, handle_message)
+# Accepts JSON and binary payloads (payload_codec.py is generated from the response schema)
+mqtt_client = Create_MQTT(client_id, handle_message, binary_payloads=True)
 
 # Subscribe to the specified topic
 mqtt_client.subscribe(group_number)
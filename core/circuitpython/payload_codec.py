@@ -0,0 +1,34 @@
+"""Binary payload decoder generated by payload_codec.py from main/assistant_response_schema.json.
+
+Layout {speed_para:f,dir_para:i,speed_old:f,dir_old:i,speed_reg:f,dir_reg:i}
+
+Do not edit; regenerate it when the schema changes.
+"""
+
+import json
+import struct
+
+MAGIC = 0xA5
+LAYOUT_ID = 0x29C1
+
+
+def decode(buf):
+    """Decode a binary payload into the dict its JSON form would give."""
+    if buf[0] != MAGIC or struct.unpack_from("<H", buf, 1)[0] != LAYOUT_ID:
+        raise ValueError("unknown payload layout")
+    o = 3
+    v1 = struct.unpack_from("<fififi", buf, o)
+    o += 24
+    values = {"speed_para": v1[0], "dir_para": v1[1], "speed_old": v1[2], "dir_old": v1[3], "speed_reg": v1[4], "dir_reg": v1[5]}
+    if len(buf) >= o + 4:
+        values["seq"] = struct.unpack_from("<I", buf, o)[0]
+    return values
+
+
+def loads(message):
+    """Parse an MQTT message: binary payloads with decode(), anything else as JSON."""
+    if isinstance(message, str):
+        return json.loads(message)
+    if message and message[0] == MAGIC:
+        return decode(message)
+    return json.loads(str(message, "utf-8"))
@@ -0,0 +1,252 @@
+"""End-to-end acknowledgement of device payloads, with round-trip latency.
+
+A publish that reached the broker says nothing about the board: it may be
+offline, have missed a QoS 0 message, or be stuck.  ``AckTracker`` tags
+each payload with a sequence number (a ``"seq"`` key in JSON objects, a
+trailing uint32 after a ``payload_codec`` binary payload) and listens on the
+status topic ``<topic>/ack``, where the firmware publishes ``{"seq": n}``
+once it has applied the payload (``Ack`` in the boards' ``MQTT.py``).
+
+* The time from the payload being written to the broker to its ack goes into
+  a ``LatencyHistogram``.
+* An ack covers every older payload too: the board applied newer state.
+* When the newest payload is not acknowledged within ``timeout`` seconds it
+  is sent again with the same sequence number (the board acks a repeat
+  without applying it twice), after ``timeout * 2``, ``* 4``... up to
+  ``retries`` times, and then counted as lost.  With a ``StateShadow`` the
+  retransmission is a full-state keyframe.  The clock only runs while the
+  broker is reachable.
+* A payload the ``StateShadow`` finds unchanged is not sent, so it is not
+  waited for either: the board already holds that state, and an older
+  payload still awaiting its ack keeps being chased.
+
+Sequence numbers start from the wall clock so that a restarted host does not
+reuse the number the board saw last.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import json
+import logging
+import struct
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class LatencyHistogram:
+    """Publish-to-ack latencies: fixed buckets since start, percentiles over a window."""
+
+    BUCKETS_MS = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, window: int = 1000) -> None:
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.samples: Deque[float] = collections.deque(maxlen=window)
+        self.total = 0
+        self.max_ms = 0.0
+
+    def add(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        self.samples.append(ms)
+        self.total += 1
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def buckets(self) -> List[Tuple[str, int]]:
+        """``("<=50ms", count)`` pairs, the last one for anything slower."""
+        labels = [f"<={edge}ms" for edge in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return list(zip(labels, self.counts))
+
+
+class _Sent:
+    __slots__ = ("seq", "payload", "queued", "sent", "attempts", "timer")
+
+    def __init__(self, seq: int, payload: Any) -> None:
+        self.seq = seq
+        self.payload = payload
+        self.queued = time.monotonic()
+        self.sent: Optional[float] = None
+        self.attempts = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AckTracker:
+    """Sequence-numbered publishes to one topic through an ``OutboundQueue``."""
+
+    def __init__(
+        self,
+        outbox,
+        topic: str,
+        *,
+        ack_topic: Optional[str] = None,
+        timeout: float = 2.0,
+        retries: int = 3,
+    ) -> None:
+        self.outbox = outbox
+        self.topic = topic
+        self.ack_topic = ack_topic or f"{topic}/ack"
+        self.timeout = timeout
+        self.retries = retries
+        self.latency = LatencyHistogram()
+        self.acked = 0
+        self.superseded = 0
+        self.retransmits = 0
+        self.lost = 0
+        self.unexpected = 0
+        self._seq = int(time.time() * 10) & 0x7FFFFFFF
+        self._pending: "collections.OrderedDict[int, _Sent]" = collections.OrderedDict()
+
+    async def start(self) -> bool:
+        """Subscribe to the ack topic; True once the broker granted it."""
+        return await self.outbox.transport.subscribe(self.ack_topic, self._on_ack)
+
+    async def publish(self, payload: Any, *, timeout: float = 10.0) -> bool:
+        """Tag ``payload``, queue it and wait until it is sent (``OutboundQueue.publish``)."""
+        seq = self._next_seq()
+        tagged = self._tag(payload, seq)
+        if tagged is None:
+            return await self.outbox.publish(self.topic, payload, timeout=timeout)
+        entry = _Sent(seq, tagged)
+        self._pending[entry.seq] = entry
+        self._arm(entry, self.timeout)
+        return await self.outbox.wait(self._send(entry), timeout=timeout)
+
+    def close(self) -> None:
+        for entry in self._pending.values():
+            if entry.timer is not None:
+                entry.timer.cancel()
+        self._pending.clear()
+        if self.latency.total:
+            logging.info("Device acks: %s", self.summary())
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.latency.percentile(fraction) for fraction in (0.5, 0.95, 0.99))
+        return {
+            "acked": self.acked,
+            "pending": len(self._pending),
+            "superseded": self.superseded,
+            "retransmits": self.retransmits,
+            "lost": self.lost,
+            "unexpected": self.unexpected,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_ms": self.latency.max_ms,
+            "histogram": self.latency.buckets(),
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        line = (
+            f"{stats['acked']} acked, {stats['pending']} pending, {stats['retransmits']} retransmits, "
+            f"{stats['lost']} lost"
+        )
+        if stats["p50_ms"] is not None:
+            line += (
+                f"; publish-to-ack p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, "
+                f"p99 {stats['p99_ms']:.0f} ms, max {stats['max_ms']:.0f} ms"
+            )
+        return line
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        return self._seq
+
+    @staticmethod
+    def _tag(payload: Any, seq: int) -> Any:
+        """``payload`` carrying ``seq``, or None when it cannot carry one."""
+        try:
+            state = json.loads(payload)
+        except (TypeError, ValueError):
+            state = None
+        if isinstance(state, dict):
+            return json.dumps({**state, "seq": seq})
+        if isinstance(payload, (bytes, bytearray)):
+            # A binary payload_codec payload: the decoder reads a trailing uint32.
+            return bytes(payload) + struct.pack("<I", seq)
+        return None
+
+    def _send(self, entry: _Sent) -> asyncio.Future:
+        delivery = self.outbox.put(self.topic, entry.payload)
+
+        def sent(done: asyncio.Future) -> None:
+            if done.cancelled():
+                return
+            if done.result() is None:
+                # Nothing changed, so nothing was sent and no ack will come.
+                self._forget(entry)
+            elif done.result() and entry.sent is None:
+                entry.sent = time.monotonic()
+
+        delivery.add_done_callback(sent)
+        return delivery
+
+    def _forget(self, entry: _Sent) -> None:
+        if self._pending.get(entry.seq) is entry:
+            del self._pending[entry.seq]
+        if entry.timer is not None:
+            entry.timer.cancel()
+
+    def _arm(self, entry: _Sent, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        entry.timer = loop.call_later(delay, self._expire, entry.seq)
+
+    def _expire(self, seq: int) -> None:
+        entry = self._pending.get(seq)
+        if entry is None:
+            return
+        if seq != next(reversed(self._pending)):
+            # A newer payload carries the current state; stop chasing this one.
+            del self._pending[seq]
+            self.superseded += 1
+            return
+        if entry.sent is None or not self.outbox.transport.connected.is_set():
+            # Still queued or the broker is away: not the board's fault yet.
+            self._arm(entry, self.timeout)
+            return
+        if entry.attempts >= self.retries:
+            del self._pending[seq]
+            self.lost += 1
+            logging.warning("No ack for payload %d on %s after %d retransmits", seq, self.topic, entry.attempts)
+            return
+        entry.attempts += 1
+        self.retransmits += 1
+        shadow = getattr(self.outbox, "shadow", None)
+        if shadow is not None:
+            # The board may have missed earlier deltas as well.
+            shadow.invalidate(self.topic)
+        logging.info("Retransmitting payload %d on %s (attempt %d)", seq, self.topic, entry.attempts)
+        self._send(entry)
+        self._arm(entry, self.timeout * 2 ** entry.attempts)
+
+    def _on_ack(self, topic: str, payload: bytes) -> None:
+        try:
+            seq = int(json.loads(payload)["seq"])
+        except (TypeError, ValueError, KeyError):
+            logging.warning("Ignoring malformed ack on %s: %r", topic, payload)
+            return
+        entry = self._pending.get(seq)
+        if entry is None:
+            # A repeat ack, or one for a payload already given up on.
+            self.unexpected += 1
+            return
+        self.latency.add(time.monotonic() - (entry.sent or entry.queued))
+        self.acked += 1
+        for pending_seq in list(self._pending):
+            older = self._pending.pop(pending_seq)
+            if older.timer is not None:
+                older.timer.cancel()
+            if pending_seq == seq:
+                break
+            self.superseded += 1
+
+
+__all__ = ["AckTracker", "LatencyHistogram"]
@@ -1,24 +1,30 @@
 """Command-line chat application that wraps the OpenAI Responses workflow."""
 
 import asyncio
-import collections
+import atexit
 import json
-import select
 import sys
-import time
-import wave
-from io import BytesIO
+import threading
 
-import audioop
-import paho.mqtt.client as mqtt
-import sounddevice as sd
 import webrtcvad
 
 from settings import settings
+from ack_tracker import AckTracker
+from audio_capture import MicrophoneCapture
+from endpointer import Endpointer
+from intent_rules import IntentMatcher
+from mqtt_transport import MQTTTransport
+from outbound_queue import OutboundQueue
+from payload_codec import PayloadCodec
+from response_cache import ResponseCache, config_fingerprint
+from run_supervisor import RunSupervisor
+from state_shadow import StateShadow
 from conversation_client import (
+    cancelled_run_stats,
     conversation_response,
     create_new_conversation,
-    transcribe_audio,
+    prepare_transcription,
+    start_transcription,
 )
 
 broker = settings["broker"]
@@ -33,9 +39,10 @@ SAMPLE_RATE = 16000  # Hertz; PortAudio + VAD both operate well at 16 kHz.
 FRAME_DURATION_MS = 30  # ms; VAD expects 10/20/30 ms frames.
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
 SILENCE_FRAMES_LIMIT = int(0.9 / (FRAME_DURATION_MS / 1000))
+MIN_SILENCE_FRAMES = int(0.45 / (FRAME_DURATION_MS / 1000))  # shortest tail, for clear speech.
 MAX_FRAMES = int(10 / (FRAME_DURATION_MS / 1000))
 PRE_SPEECH_FRAMES = int(0.18 / (FRAME_DURATION_MS / 1000))
-VOICE_WAIT_TIMEOUT = 8  # seconds before timing out while listening.
+VOICE_POLL_INTERVAL = 0.25  # seconds between typed-input checks in voice mode.
 ENERGY_THRESHOLD = 300  # RMS energy gate for noisy rooms.
 MIN_VOICE_FRAMES = int(0.35 / (FRAME_DURATION_MS / 1000))
 POST_SPEECH_FRAMES = int(0.4 / (FRAME_DURATION_MS / 1000))
@@ -46,67 +53,176 @@ current_response_id = None  # Populated with the latest Responses API ID.
 input_mode = "text"  # Either "text" or "voice".
 voice_prompt_displayed = False  # Avoid spamming the mic prompt between turns.
 dev_mode = False  # When True, MQTT payloads are printed instead of published.
+device_state = {}  # Last values sent to the windmills; part of the cache key.
+model_state_stale = False  # True after a turn the model did not see.
+supervisor = RunSupervisor()  # A newer prompt cancels the turn still running.
 
 vad = webrtcvad.Vad(3)
-noise_floor = ENERGY_THRESHOLD
+microphone = None
+
+
+def build_microphone():
+    """Create the session-long microphone stream; started in ``main()``."""
+    endpointer = Endpointer(
+        frame_ms=FRAME_DURATION_MS,
+        energy_threshold=ENERGY_THRESHOLD,
+        pre_speech_frames=PRE_SPEECH_FRAMES,
+        post_speech_frames=POST_SPEECH_FRAMES,
+        min_tail_frames=MIN_SILENCE_FRAMES,
+        max_tail_frames=SILENCE_FRAMES_LIMIT,
+        max_frames=MAX_FRAMES,
+        min_voice_frames=MIN_VOICE_FRAMES,
+    )
+    return MicrophoneCapture(
+        vad,
+        endpointer,
+        sample_rate=SAMPLE_RATE,
+        frame_size=FRAME_SIZE,
+        transcriber=start_transcription,
+    )
+
+
+# Changes whenever the prompt or schema do, invalidating cached replies.
+config_hash = config_fingerprint(
+    settings["prompt_id"],
+    settings["prompt_instructions"],
+    settings["response_json_schema"],
+)
+
+
+def build_response_cache():
+    """Create the opt-in exact-match reply cache (``RESPONSE_CACHE=true``)."""
+    if not settings["response_cache"]:
+        return None
+    return ResponseCache(
+        fingerprint=config_hash,
+        max_entries=settings["response_cache_size"],
+        ttl=settings["response_cache_ttl"],
+        path=settings["response_cache_file"] or None,
+    )
+
+
+def build_semantic_cache():
+    """Create the opt-in paraphrase cache (``SEMANTIC_CACHE=true``, needs NumPy)."""
+    if not settings["semantic_cache"]:
+        return None, None
+    try:
+        from semantic_cache import SemanticCache, namespace_for
+    except ImportError as exc:
+        print(f"Semantic cache disabled ({exc}). Install numpy to use it.")
+        return None, None
+
+    cache = SemanticCache(
+        threshold=settings["semantic_cache_threshold"],
+        max_entries=settings["semantic_cache_size"],
+        path=settings["semantic_cache_file"] or None,
+    )
+    atexit.register(cache.save)
+    return cache, namespace_for(settings["response_json_schema"], config_hash)
+
+
+intent_matcher = None
+if settings["intent_rules"]:
+    # Commands like "stop" or "faster" are answered from assistant_rules.json.
+    intent_matcher = IntentMatcher.from_file(settings["intent_rules_file"])
+response_cache = build_response_cache()
+semantic_cache, semantic_namespace = build_semantic_cache()
+
+
+def build_payload_codec():
+    """Create the binary payload encoder (``MQTT_PAYLOAD_FORMAT=binary``)."""
+    if settings["mqtt_payload_format"] != "binary":
+        return None
+    return PayloadCodec(settings["response_json_schema"])
+
+
+binary_codec = build_payload_codec()
+
+
+def build_state_shadow():
+    """Create the opt-in device state shadow for delta payloads (``MQTT_DELTA=true``)."""
+    if not settings["mqtt_delta"]:
+        return None
+    return StateShadow(
+        keyframe_every=settings["mqtt_keyframe_every"],
+        keyframe_seconds=settings["mqtt_keyframe_seconds"],
+    )
 
 
 class MQTTClient:
-    """Thin wrapper around paho-mqtt with async-friendly hooks."""
+    """Publishes structured values to the configured topic via MQTTTransport."""
 
     def __init__(self):
-        self.client = mqtt.Client(
+        # Runs on the application's event loop and reconnects by itself.
+        self.transport = MQTTTransport(
             client_id=settings["client_id"],
-            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            username=mqtt_user,
+            password=mqtt_password,
+            on_connect=self.on_connect,
+            on_disconnect=self.on_disconnect,
+        )
+        self.connected = self.transport.connected
+        # Held while the broker is unreachable and flushed on reconnect.
+        self.outbox = OutboundQueue(
+            self.transport,
+            depth=settings["mqtt_queue_depth"],
+            coalesce=settings["mqtt_coalesce"],
+            shadow=build_state_shadow(),
         )
-        if mqtt_user:
-            self.client.username_pw_set(mqtt_user, password=mqtt_password)
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.connected = asyncio.Event()
-
-    def on_connect(self, client, userdata, flags, reason_code, properties=None):
-        code = getattr(reason_code, "value", reason_code)
+        # Sequence-numbered payloads acked by the board (``MQTT_ACKS=true``).
+        self.acks = None
+        if settings["mqtt_acks"]:
+            self.acks = AckTracker(
+                self.outbox,
+                topic,
+                timeout=settings["mqtt_ack_timeout"],
+                retries=settings["mqtt_ack_retries"],
+            )
+
+    def on_connect(self, code):
         if code == 0:
             print("\nConnected to MQTT broker.")
-            self.connected.set()
         else:
             print(f"\nMQTT connection failed with code {code}.")
-            self.connected.clear()
 
-    def on_disconnect(self, client, userdata, reason_code, properties=None):
-        code = getattr(reason_code, "value", reason_code)
+    def on_disconnect(self, code):
         if code not in (0, None):
             print(f"\nMQTT disconnected unexpectedly (code {code}).")
-        self.connected.clear()
 
     async def connect(self):
         """Establish a connection to the broker and wait until it is ready."""
         try:
-            self.client.connect(broker, port, keepalive=60)
-            self.client.loop_start()
-            try:
-                await asyncio.wait_for(self.connected.wait(), timeout=5)
-                return True
-            except asyncio.TimeoutError:
-                print("MQTT connection timed out.")
-                return False
+            # An unreachable broker is retried in the background meanwhile.
+            connected = await self.transport.connect(broker, port, timeout=5, retry=True)
         except Exception as exc:
             print(f"Unable to connect to MQTT broker: {exc}")
             return False
+        # Kept across reconnects, so it also applies once the broker answers.
+        if self.acks is not None and not await self.acks.start() and connected:
+            print(f"Could not subscribe to {self.acks.ack_topic}; device acks will not arrive.")
+        return connected
 
     async def disconnect(self):
-        if self.client.is_connected():
-            self.client.loop_stop()
-            self.client.disconnect()
+        if self.acks is not None:
+            self.acks.close()
+        await self.outbox.close()
+        await self.transport.disconnect()
 
-    async def publish(self, payload: str):
+    async def publish(self, payload):
         """Ship a JSON payload to the configured topic if connected."""
-        if not self.connected.is_set():
-            print("Skipping MQTT publish; not connected.")
-            return False
         try:
-            self.client.publish(topic, payload)
+            # Waits until the payload is on the wire (backpressure).
+            if self.acks is not None:
+                sent = await self.acks.publish(payload)
+            else:
+                sent = await self.outbox.publish(topic, payload)
+            if not sent:
+                if self.connected.is_set():
+                    print("Failed to publish MQTT message.")
+                    return False
+                # Held in the outbox; the device gets the newest values on reconnect.
+                print("MQTT broker unreachable; the newest values will be sent when it reconnects.")
+                return True
             print("\n")
             print("////To see preset commands type /help")
             return True
@@ -123,131 +239,6 @@ async def restart_conversation():
     return True
 
 
-def calibrate_noise_floor(duration: float = 1.0) -> int | None:
-    """Measure ambient RMS level to improve speech gating.
-
-    We sample the microphone for a short window and average the raw RMS energy.
-    That value feeds into the dynamic VAD threshold so the app adapts to quiet
-    offices and louder factory floors alike.
-    """
-    frames_needed = max(1, int(duration * SAMPLE_RATE / FRAME_SIZE))
-    energies: list[int] = []
-
-    try:
-        with sd.RawInputStream(
-            samplerate=SAMPLE_RATE,
-            blocksize=FRAME_SIZE,
-            dtype="int16",
-            channels=1,
-        ) as stream:
-            for _ in range(frames_needed):
-                frame, _ = stream.read(FRAME_SIZE)
-                if not frame:
-                    continue
-                energy = audioop.rms(frame, 2)
-                energies.append(energy)
-    except sd.PortAudioError as exc:
-        print(f"Calibration audio error: {exc}")
-        return None
-
-    if not energies:
-        return None
-
-    avg_energy = sum(energies) / len(energies)
-    return max(int(avg_energy), ENERGY_THRESHOLD // 2)
-
-
-def record_voice_once() -> bytes | None:
-    """Capture a single utterance using VAD-controlled recording.
-
-    Frames hit a ring buffer until VAD detects speech.  Once triggered we keep
-    recording until either the speaker pauses for ``SILENCE_FRAMES_LIMIT`` or we
-    reach ``MAX_FRAMES`` worth of audio.  The result is raw PCM bytes which are
-    later wrapped into a WAV container.
-    """
-    ring_buffer = collections.deque(maxlen=PRE_SPEECH_FRAMES)
-    post_buffer = collections.deque(maxlen=POST_SPEECH_FRAMES)
-    voiced_frames: list[bytes] = []
-    voiced_energies: list[int] = []
-    silence_frames = 0
-    triggered = False
-    start_time = time.time()
-    dynamic_threshold = max(ENERGY_THRESHOLD, int(noise_floor * 2))
-
-    try:
-        with sd.RawInputStream(
-            samplerate=SAMPLE_RATE,
-            blocksize=FRAME_SIZE,
-            dtype="int16",
-            channels=1,
-        ) as stream:
-            while True:
-                frame, _ = stream.read(FRAME_SIZE)
-                if not frame:
-                    continue
-
-                energy = audioop.rms(frame, 2)
-                is_voiced = energy >= dynamic_threshold and vad.is_speech(frame, SAMPLE_RATE)
-
-                if not triggered:
-                    ring_buffer.append((frame, energy))
-                    if is_voiced:
-                        triggered = True
-                        for buffered_frame, buffered_energy in ring_buffer:
-                            voiced_frames.append(buffered_frame)
-                            voiced_energies.append(buffered_energy)
-                        ring_buffer.clear()
-                        silence_frames = 0
-                    elif time.time() - start_time > VOICE_WAIT_TIMEOUT:
-                        return None
-                    continue
-
-                if is_voiced:
-                    voiced_frames.append(frame)
-                    voiced_energies.append(energy)
-                    silence_frames = 0
-                    post_buffer.clear()
-                else:
-                    post_buffer.append(frame)
-                    silence_frames += 1
-                    if silence_frames > SILENCE_FRAMES_LIMIT:
-                        voiced_frames.extend(post_buffer)
-                        post_buffer.clear()
-                        break
-
-                if len(voiced_frames) > MAX_FRAMES:
-                    voiced_frames.extend(post_buffer)
-                    post_buffer.clear()
-                    break
-
-    except sd.PortAudioError as exc:
-        print(f"Audio input error: {exc}")
-        return None
-
-    if not voiced_frames or len(voiced_frames) < MIN_VOICE_FRAMES:
-        return None
-
-    if not voiced_energies:
-        return None
-
-    avg_voiced_energy = sum(voiced_energies) / len(voiced_energies)
-    if avg_voiced_energy < dynamic_threshold * 1.1:
-        return None
-
-    return b"".join(voiced_frames)
-
-
-def pcm_to_wav(pcm_data: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
-    """Wrap raw PCM data in a WAV container."""
-    buffer = BytesIO()
-    with wave.open(buffer, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm_data)
-    return buffer.getvalue()
-
-
 async def handle_command(command, mqtt_client):
     """Process slash-commands that control app state instead of chatting."""
     global input_mode, voice_prompt_displayed, dev_mode
@@ -260,11 +251,16 @@ async def handle_command(command, mqtt_client):
             "/voice   Switch to voice mode\n"
             "/text    Switch to text mode\n"
             "/dev     Enable dev mode (text + MQTT preview)\n"
+            "/cache   Show response cache stats (/cache clear empties it)\n"
+            "/mic     Show microphone noise floor and endpointing stats\n"
+            "/runs    Show turns superseded by a newer prompt\n"
+            "/mqtt    Show MQTT connection and outbound queue stats\n"
             "/quit    Exit the program"
         )
         return True
 
     if command == "/restart":
+        supervisor.supersede()
         await restart_conversation()
         return True
 
@@ -289,8 +285,87 @@ async def handle_command(command, mqtt_client):
         print("\nDev mode enabled. Text replies will show MQTT payloads without sending. Type /text to exit dev mode.")
         return True
 
+    if command.startswith("/cache"):
+        caches = {"Response cache": response_cache, "Semantic cache": semantic_cache}
+        if not any(caches.values()):
+            print("\nCaching is off. Set RESPONSE_CACHE=true or SEMANTIC_CACHE=true to enable it.")
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            if command == "/cache clear":
+                cache.clear()
+                print(f"\n{name} cleared.")
+                continue
+            stats = cache.stats()
+            print(
+                f"\n{name}: {stats['entries']} entries, {stats['hits']} hits, "
+                f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                f"{stats['evictions']} evictions"
+            )
+        return True
+
+    if command == "/mic":
+        if microphone is None:
+            print("\nNo microphone available.")
+            return True
+        stats = microphone.endpointer.stats()
+        print(
+            f"\nNoise floor {stats['noise_floor']} (speech gate {stats['threshold']}), "
+            f"{stats['triggers']} triggers: {stats['accepted']} sent, "
+            f"{stats['too_short']} too short, {stats['too_quiet']} too quiet. "
+            f"Mean silence tail {stats['mean_tail_ms']:.0f} ms."
+        )
+        last = stats["last_segment"]
+        if last:
+            print(
+                f"Last utterance: {last['verdict']}, ended by {last['cause']} after a "
+                f"{last['tail_ms']} ms tail (confidence {last['confidence']:.2f})."
+            )
+        return True
+
+    if command == "/runs":
+        stats = supervisor.stats()
+        cancelled = cancelled_run_stats()
+        print(
+            f"\n{stats['submitted']} turns: {stats['completed']} answered, "
+            f"{stats['superseded']} superseded by a newer prompt "
+            f"({stats['superseded_seconds']:.1f} s of work dropped)."
+        )
+        line = f"Model runs cancelled: {cancelled['runs']}"
+        if "prompt_tokens" in cancelled:
+            line += (
+                f", {cancelled['prompt_tokens']} prompt + {cancelled['completion_tokens']} "
+                f"completion tokens already spent, {cancelled['finished_anyway']} "
+                "finished before the cancel arrived"
+            )
+        print(line + ".")
+        return True
+
+    if command == "/mqtt":
+        queue = mqtt_client.outbox.stats()
+        link = mqtt_client.transport.stats()
+        state = "connected" if link["connected"] else "reconnecting"
+        print(
+            f"\nMQTT {state} ({link['reconnects']} reconnects). Sent {queue['sent']}, "
+            f"queued {queue['depth']}, coalesced {queue['coalesced']}, "
+            f"dropped {queue['dropped']}, failed {queue['failed']}."
+        )
+        if "keyframes" in queue:
+            print(
+                f"Delta mode: {queue['deltas']} deltas, {queue['keyframes']} keyframes, "
+                f"{queue['skipped']} unchanged skipped; {queue['bytes_sent']} of "
+                f"{queue['bytes_full']} full-state bytes sent ({queue['saved']:.0%} saved)."
+            )
+        if mqtt_client.acks is not None:
+            print(f"Device acks: {mqtt_client.acks.summary()}.")
+            buckets = [f"{label} {count}" for label, count in mqtt_client.acks.stats()["histogram"] if count]
+            if buckets:
+                print("Publish-to-ack latency: " + ", ".join(buckets) + ".")
+        return True
+
     if command == "/quit":
         print("Goodbye!")
+        await supervisor.shutdown()
         if mqtt_client:
             await mqtt_client.disconnect()
         sys.exit(0)
@@ -298,46 +373,198 @@ async def handle_command(command, mqtt_client):
     return False
 
 
+def encode_payload(values):
+    """Return the MQTT payload for ``values``: binary when enabled and they fit the schema, else JSON."""
+    if binary_codec is not None:
+        try:
+            # Keys the reply left out keep their last published value.
+            return binary_codec.encode({**device_state, **values})
+        except ValueError as exc:
+            print(f"Sending JSON instead of a binary payload: {exc}")
+    return json.dumps(values)
+
+
+async def publish_values(values, mqtt_client, *, dev_mode: bool = False):
+    """Publish a ``values`` object, or preview it when dev mode is on."""
+    payload = json.dumps(values, indent=2 if dev_mode else None)
+    if mqtt_client and not dev_mode:
+        if await mqtt_client.publish(encode_payload(values)):
+            device_state.update(values)
+    elif not dev_mode:
+        print("To see preset commands type /help")
+    if dev_mode:
+        print("\n[DEV] MQTT payload preview:")
+        print(payload)
+
+
+def cached_reply(message, state, *, dev_mode: bool = False):
+    """Return a stored reply for this prompt and windmill state, if any."""
+    if response_cache is not None:
+        cached = response_cache.get(message, state)
+        if cached is not None:
+            if dev_mode:
+                print("\n[DEV] Served from the response cache.")
+            return cached
+    if semantic_cache is not None:
+        hit = semantic_cache.lookup(semantic_namespace, message, state)
+        if hit is not None:
+            if dev_mode:
+                print(f"\n[DEV] Semantic cache match {hit.score:.2f}: {hit.prompt!r}")
+            return hit.reply
+    return None
+
+
+def remember_reply(message, state, reply):
+    if response_cache is not None:
+        response_cache.put(message, state, reply)
+    if semantic_cache is not None:
+        semantic_cache.add(semantic_namespace, message, state, reply)
+
+
 async def process_user_message(message: str, mqtt_client, *, dev_mode: bool = False):
-    """Send a user message to the model and reflect the structured response."""
-    global current_response_id
+    """Send a user message to the model and reflect the structured response.
+
+    The reply is streamed: ``values`` is published as soon as it is parsed so
+    the artifact starts moving while the ``response`` text is still printing.
+    """
+    global current_response_id, model_state_stale
+
+    state = dict(device_state)
+    if intent_matcher is not None:
+        intent = intent_matcher.match(message, state)
+        if intent is not None:
+            print(f"\nAssistant: {intent.response}")
+            if dev_mode:
+                print(f"[DEV] Matched rule '{intent.name}'; the model was not called.")
+            await publish_values(intent.values, mqtt_client, dev_mode=dev_mode)
+            model_state_stale = True
+            return
+
+    cached = cached_reply(message, state, dev_mode=dev_mode)
+    if cached is not None:
+        # Answered locally; the conversation chain is left where it was.
+        print(f"\nAssistant: {cached.get('response', '')}")
+        await publish_values(cached["values"], mqtt_client, dev_mode=dev_mode)
+        model_state_stale = True
+        return
 
-    payload, new_response_id = await conversation_response(current_response_id, message)
+    early_publish = None
+    streamed_text = False
+    superseded = False
+
+    def on_values(values):
+        nonlocal early_publish
+        if values and early_publish is None and not superseded:
+            early_publish = asyncio.create_task(
+                publish_values(values, mqtt_client, dev_mode=dev_mode)
+            )
+
+    def on_text(delta):
+        nonlocal streamed_text
+        if superseded:
+            return
+        if not streamed_text:
+            print("\nAssistant: ", end="")
+            streamed_text = True
+        print(delta, end="", flush=True)
+
+    prompt = message
+    if model_state_stale and device_state:
+        # Earlier turns were answered locally; tell the model where things stand.
+        prompt = f"(Current values: {json.dumps(device_state)})\n{message}"
+    try:
+        payload, new_response_id = await conversation_response(
+            current_response_id, prompt, on_values=on_values, on_text=on_text
+        )
+    except asyncio.CancelledError:
+        # A newer prompt replaced this one.  The run can still emit events
+        # while it is being cancelled; none of them may reach the device.
+        superseded = True
+        if early_publish is not None:
+            early_publish.cancel()
+        if streamed_text:
+            print(" [interrupted]")
+        raise
+    model_state_stale = False
 
     if new_response_id:
         current_response_id = new_response_id
 
     text = payload.get("response", "")
     values = payload.get("values", {})
+    remember_reply(message, state, payload)
 
-    print(f"\nAssistant: {text}")
+    if streamed_text:
+        print()
+    else:
+        print(f"\nAssistant: {text}")
 
-    if values:
-        payload = json.dumps(values, indent=2 if dev_mode else None)
-        if mqtt_client and not dev_mode:
-            await mqtt_client.publish(payload)
-        elif not dev_mode:
-            print("To see preset commands type /help")
-        if dev_mode:
-            print("\n[DEV] MQTT payload preview:")
-            print(payload)
-            if current_response_id:
-                print(f"[DEV] Last response id: {current_response_id}")
+    if early_publish is not None:
+        await early_publish
+    elif values:
+        await publish_values(values, mqtt_client, dev_mode=dev_mode)
+
+    if values and dev_mode and current_response_id:
+        print(f"[DEV] Last response id: {current_response_id}")
+
+
+def start_stdin_reader(loop):
+    """Read typed lines on a daemon thread and queue them on ``loop``.
+
+    Waiting for input never blocks the event loop, so a line typed while a
+    reply is still running is seen straight away.
+    """
+    lines = asyncio.Queue()
+
+    def read():
+        for line in iter(sys.stdin.readline, ""):
+            loop.call_soon_threadsafe(lines.put_nowait, line.strip())
+
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+    return lines
+
+
+async def run_turn(message, mqtt_client, *, dev_mode: bool = False):
+    """Run one supervised turn, reporting errors instead of raising them."""
+    try:
+        await process_user_message(message, mqtt_client, dev_mode=dev_mode)
+    except Exception as exc:
+        print(f"\nError: {exc}")
+
+
+def submit_message(message, mqtt_client):
+    """Answer ``message`` in the background, superseding an unfinished turn."""
+    supervisor.submit(run_turn(message, mqtt_client, dev_mode=dev_mode))
 
 
 async def chat_loop(mqtt_client):
     """Main event loop: collect input, call the model, and fan out results."""
     global voice_prompt_displayed, input_mode, dev_mode
 
-    loop = asyncio.get_event_loop()
+    typed_lines = start_stdin_reader(asyncio.get_running_loop())
+    text_prompt_displayed = False
 
     while True:
         try:
+            if input_mode == "voice" and microphone is None:
+                print("\nNo microphone available; staying in text mode.")
+                input_mode = "text"
+            if microphone is not None:
+                microphone.listening = input_mode == "voice"
+
             if input_mode == "text":
                 voice_prompt_displayed = False
-                user_input = await loop.run_in_executor(
-                    None, lambda: input("\nYou: ").strip()
-                )
+                if not text_prompt_displayed and not supervisor.busy():
+                    print("\nYou: ", end="", flush=True)
+                    text_prompt_displayed = True
+                try:
+                    # Typing stays possible while a reply is still running.
+                    user_input = await asyncio.wait_for(
+                        typed_lines.get(), timeout=VOICE_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                text_prompt_displayed = False
                 if not user_input:
                     continue
 
@@ -345,14 +572,13 @@ async def chat_loop(mqtt_client):
                     if await handle_command(user_input, mqtt_client):
                         continue
 
-                await process_user_message(user_input, mqtt_client, dev_mode=dev_mode)
+                submit_message(user_input, mqtt_client)
                 continue
 
             if input_mode == "voice":
                 # Allow typed commands/messages even while in voice mode.
-                readable, _, _ = select.select([sys.stdin], [], [], 0)
-                if sys.stdin in readable:
-                    typed = sys.stdin.readline().strip()
+                if not typed_lines.empty():
+                    typed = typed_lines.get_nowait()
                     if not typed:
                         continue
                     print(f"\nYou (text): {typed}")
@@ -364,24 +590,23 @@ async def chat_loop(mqtt_client):
                         voice_prompt_displayed = False
                         print("\nSwitched to text mode based on typed input.")
                         dev_mode = False
-                    await process_user_message(typed, mqtt_client, dev_mode=dev_mode)
+                    submit_message(typed, mqtt_client)
                     continue
 
             if input_mode == "voice" and not voice_prompt_displayed:
                 print("\n🎤 Voice mode active. Speak clearly and pause to send.")
                 voice_prompt_displayed = True
 
-            if input_mode == "voice":
-                pcm_data = await asyncio.to_thread(record_voice_once)
-            else:
-                # Should not reach here in text mode due to continue above.
-                pcm_data = None
-
-            if not pcm_data:
+            try:
+                # Wake up regularly so typed input is noticed while listening.
+                utterance = await asyncio.wait_for(
+                    microphone.utterances.get(), timeout=VOICE_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
                 continue
 
-            wav_bytes = pcm_to_wav(pcm_data)
-            transcript = await transcribe_audio(wav_bytes)
+            # Streamed transcriptions were uploaded while the user was speaking.
+            transcript = await utterance.transcription.finish()
             if not transcript:
                 print("Didn't catch that. Try again.")
                 continue
@@ -391,12 +616,15 @@ async def chat_loop(mqtt_client):
                 continue
 
             print(f"\nYou (voice): {message}")
+            if utterance.transcription.rtf is not None:
+                print(f"(transcribed locally in {utterance.transcription.elapsed:.2f} s, "
+                      f"real-time factor {utterance.transcription.rtf:.2f})")
 
             if message.startswith("/"):
                 if await handle_command(message, mqtt_client):
                     continue
 
-            await process_user_message(message, mqtt_client, dev_mode=dev_mode)
+            submit_message(message, mqtt_client)
         except KeyboardInterrupt:
             print("\nExiting...")
             break
@@ -406,18 +634,28 @@ async def chat_loop(mqtt_client):
 
 async def main():
     """Application entry point: init hardware, start MQTT, then chat."""
-    global noise_floor
+    global microphone
 
     print(settings["Welcom_msg"])
 
+    microphone = build_microphone()
     try:
-        print("Calibrating microphone... please remain silent.")
-        measured = await asyncio.to_thread(calibrate_noise_floor)
+        microphone.start()
+        print("Measuring room noise... please remain silent.")
+        measured = await microphone.calibrate()
         if measured:
-            noise_floor = measured
-            print(f"Calibrated ambient noise level: {noise_floor:.0f}")
+            print(f"Ambient noise level: {measured:.0f} (tracked while running)")
     except Exception as exc:
-        print(f"Microphone calibration failed: {exc}")
+        print(f"Microphone unavailable: {exc}")
+        microphone = None
+
+    if microphone is not None:
+        try:
+            local_model = await prepare_transcription()
+            if local_model:
+                print(f"Local transcription model {local_model} loaded.")
+        except Exception as exc:
+            print(f"Local transcription model failed to load: {exc}")
 
     if not await restart_conversation():
         print("Failed to create a conversation. Exiting.")
@@ -425,13 +663,15 @@ async def main():
 
     mqtt_client = MQTTClient()
     if not await mqtt_client.connect():
-        print("Continuing without MQTT publishing.")
-        mqtt_client = None
+        print("MQTT broker unreachable; retrying in the background and queueing values meanwhile.")
 
     await chat_loop(mqtt_client)
+    await supervisor.shutdown()
 
     if mqtt_client:
         await mqtt_client.disconnect()
+    if microphone is not None:
+        microphone.stop()
 
 
 if __name__ == "__main__":
@@ -9,24 +9,58 @@ responsibilities:
 * Exchanging conversational turns while enforcing the schema declared in
   ``settings.response_json_schema``.
 * Converting microphone audio into text with the configured transcription model.
+
+Every call goes through a single ``AsyncOpenAI`` client backed by one
+keep-alive connection pool (HTTP/2 when the ``h2`` package is installed), so
+turns reuse open connections instead of paying for a TLS handshake each time.
 """
 
 from __future__ import annotations
 
 import asyncio
+import importlib.util
+import io
 import json
 import logging
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
+from audio_encoding import EncodedAudio, prepare_upload
+from local_whisper import get_model, is_local_model
 from settings import settings
+from streaming_payload import StreamingPayloadParser
+from transcription import (
+    BufferedTranscription,
+    LocalTranscription,
+    TranscriptionStream,
+    UploadTranscription,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 
-_client = OpenAI(api_key=settings["openAIToken"])
+def _build_http_client() -> DefaultAsyncHttpxClient:
+    """Create the keep-alive connection pool shared by every API call."""
+
+    http2 = settings["openai_http2"] and importlib.util.find_spec("h2") is not None
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings["openai_max_connections"],
+            max_keepalive_connections=settings["openai_max_keepalive"],
+        ),
+    )
+
+
+_http_client = _build_http_client()
+
+_client = AsyncOpenAI(
+    api_key=settings["openAIToken"],
+    http_client=_http_client,
+)
 _model = settings["conversation_model"]
 _prompt_id = settings.get("prompt_id")
 _prompt_instructions = settings.get("prompt_instructions", "")
@@ -41,6 +75,19 @@ _json_schema_format = {
 
 StructuredPayload = Dict[str, Any]
 
+# Audio collected before a streamed transcription upload is opened, so blips
+# the endpointer discards never reach the server.
+_STREAM_START_SECONDS = 0.35
+
+_TERMINAL_STREAM_EVENTS = {
+    "response.completed",
+    "response.incomplete",
+    "response.failed",
+}
+
+# Turns superseded by a newer prompt while their response was being generated.
+_cancelled_runs = {"runs": 0}
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
@@ -59,6 +106,9 @@ def create_new_conversation() -> Optional[str]:
 async def conversation_response(
     previous_response_id: Optional[str],
     user_message: str,
+    *,
+    on_values: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_text: Optional[Callable[[str], None]] = None,
 ) -> Tuple[StructuredPayload, Optional[str]]:
     """Submit a user turn and receive the assistant payload.
 
@@ -68,6 +118,12 @@ async def conversation_response(
             is no history yet.
         user_message: Human-readable prompt gathered from either text input or
             the speech recogniser.
+        on_values: Optional callback that receives the ``values`` object as
+            soon as it is complete in the streamed reply, before the
+            ``response`` text has finished.
+        on_text: Optional callback that receives decoded pieces of the
+            ``response`` text while it streams.  Supplying either callback
+            switches the request to streaming mode.
 
     Returns:
         A tuple of ``(payload, response_id)`` where ``payload`` matches the
@@ -93,12 +149,20 @@ async def conversation_response(
         kwargs["text"] = {"format": _json_schema_format}
 
     try:
-        response = await asyncio.to_thread(
-            _client.responses.create,
-            model=_model,
-            input=request_payload,
-            **kwargs,
-        )
+        if on_values or on_text:
+            parser = StreamingPayloadParser(on_values, on_text)
+            response = await _stream_response(request_payload, kwargs, parser)
+        else:
+            response = await _client.responses.create(
+                model=_model,
+                input=request_payload,
+                **kwargs,
+            )
+    except asyncio.CancelledError:
+        # Superseded: closing the request stops generation.  The caller keeps
+        # the previous response id, so this prompt never enters the context.
+        _cancelled_runs["runs"] += 1
+        raise
     except Exception as exc:
         logging.error("Error in conversation response: %s", exc)
         return (
@@ -106,6 +170,9 @@ async def conversation_response(
             previous_response_id,
         )
 
+    if response is None:
+        return {"response": "No response received", "values": {}}, previous_response_id
+
     assistant_text = _extract_assistant_text(response)
     response_id = getattr(response, "id", None)
 
@@ -115,13 +182,28 @@ async def conversation_response(
     return _parse_structured_payload(assistant_text), response_id
 
 
-async def transcribe_audio(audio_bytes: bytes) -> Optional[str]:
-    """Convert PCM WAV bytes into text with the configured transcription model."""
+def cancelled_run_stats() -> Dict[str, int]:
+    """Return how many responses were abandoned for a newer prompt."""
+
+    return dict(_cancelled_runs)
 
+
+async def transcribe_audio(
+    audio_bytes: bytes, filename: str = "speech.wav", content_type: str = "audio/wav"
+) -> Optional[str]:
+    """Transcribe an utterance (WAV bytes unless another file type is given)."""
+
+    if is_local_model(settings["transcription_model"]):
+        try:
+            result = await get_model(settings["transcription_model"]).transcribe_file_async(io.BytesIO(audio_bytes))
+            return result.text or None
+        except Exception as exc:
+            logging.error("Error transcribing audio locally: %s", exc)
+            return None
     try:
-        result = _client.audio.transcriptions.create(
+        result = await _client.audio.transcriptions.create(
             model=settings["transcription_model"],
-            file=("speech.wav", audio_bytes, "audio/wav"),
+            file=(filename, audio_bytes, content_type),
             response_format="text",
             language="en",
         )
@@ -131,10 +213,77 @@ async def transcribe_audio(audio_bytes: bytes) -> Optional[str]:
         return None
 
 
+def _encode_upload(pcm: bytes, sample_rate: int) -> EncodedAudio:
+    """Compress a finished utterance as configured before it is uploaded."""
+
+    return prepare_upload(
+        pcm,
+        sample_rate,
+        settings["transcription_codec"],
+        trim=settings["transcription_trim_silence"],
+    )
+
+
+def start_transcription(sample_rate: int) -> TranscriptionStream:
+    """Open a transcription for an utterance that is still being spoken."""
+
+    if is_local_model(settings["transcription_model"]):
+        return LocalTranscription(get_model(settings["transcription_model"]), sample_rate)
+    if not settings["transcription_streaming"]:
+        return BufferedTranscription(transcribe_audio, sample_rate, encode=_encode_upload)
+    return UploadTranscription(
+        _http_client,
+        base_url=settings["transcription_base_url"] or str(_client.base_url),
+        api_key=_client.api_key,
+        model=settings["transcription_model"],
+        sample_rate=sample_rate,
+        start_after=int(_STREAM_START_SECONDS * sample_rate) * 2,
+        fallback=transcribe_audio,
+        encode=_encode_upload,
+    )
+
+
+async def prepare_transcription() -> Optional[str]:
+    """Load and warm up a local transcription model; returns its name, if any."""
+
+    if not is_local_model(settings["transcription_model"]):
+        return None
+    model = get_model(settings["transcription_model"])
+    await model.warm_up()
+    return model.model_name
+
+
 # ---------------------------------------------------------------------------
 # Internal helpers
 # ---------------------------------------------------------------------------
 
+async def _stream_response(
+    request_payload: list[Dict[str, Any]],
+    kwargs: Dict[str, Any],
+    parser: StreamingPayloadParser,
+) -> Any:
+    """Stream a turn, feeding text deltas to ``parser`` as they arrive.
+
+    Returns the final response object carried by the terminal stream event.
+    """
+
+    final_response = None
+    stream = await _client.responses.create(
+        model=_model,
+        input=request_payload,
+        stream=True,
+        **kwargs,
+    )
+    async with stream:
+        async for event in stream:
+            event_type = getattr(event, "type", None)
+            if event_type == "response.output_text.delta":
+                parser.feed(event.delta)
+            elif event_type in _TERMINAL_STREAM_EVENTS:
+                final_response = event.response
+    return final_response
+
+
 def _extract_assistant_text(response: Any) -> str:
     """Flatten the structured API response into a raw JSON string."""
 
@@ -162,5 +311,10 @@ def _parse_structured_payload(text_blob: str) -> StructuredPayload:
     return parsed
 
 
-__all__ = ["create_new_conversation", "conversation_response", "transcribe_audio"]
+__all__ = [
+    "cancelled_run_stats",
+    "create_new_conversation",
+    "conversation_response",
+    "transcribe_audio",
+]
 
@@ -0,0 +1,158 @@
+"""Rule-based fast path for simple control commands.
+
+"stop", "faster" or "reverse" always mean the same change to the device, so
+waiting seconds for a model run is wasted time.  ``IntentMatcher`` reads a
+per-assistant rules file (``assistant_rules.json`` next to the schema) and
+turns a matching prompt into a ``values`` payload computed from the current
+device state.  Anything that does not match goes to the model as before.
+
+Rules file layout::
+
+    {
+      "defaults": {"speed_para": 0, "dir_para": 1},
+      "rules": [
+        {
+          "name": "faster",
+          "patterns": ["(spin |go )?faster", "speed (it |them )?up"],
+          "ops": [{"op": "add", "keys": ["speed_para"], "value": 0.15,
+                   "min": 0.5, "max": 0.95, "skip_zero": false}],
+          "response": "Picking up speed!"
+        }
+      ]
+    }
+
+``patterns`` are regular expressions matched against the whole prompt after
+``normalize_prompt`` (lower case, punctuation removed), allowing polite words
+such as "please" or "could you" around it.  ``defaults`` fill in
+state the device has not reported yet and define which keys are sent.  Keys
+may address list items as ``"led.3"``.  Supported ops:
+
+* ``set``    - assign ``value``
+* ``add``    - add ``value``
+* ``scale``  - multiply by ``value``
+* ``negate`` - flip the sign (directions)
+
+Each op can clamp the result to ``min``/``max`` and ``round`` it (default 3
+decimals, 0 for integers); ``skip_zero`` leaves keys that are currently 0
+untouched (a stopped motor stays stopped on "slower").  ``if_zero`` lists keys
+that must all be 0 for the op to run at all, e.g. to pick a default colour
+when "brighter" finds the LED off.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from response_cache import normalize_prompt
+
+_OPS = {"set", "add", "scale", "negate"}
+# Politeness around a command does not change it: "please stop", "faster now".
+_POLITE_PREFIX = r"(?:(?:please|hey|ok|okay|now|can you|could you|would you|will you) )*"
+_POLITE_SUFFIX = r"(?: (?:please|now|thanks|thank you|again))*"
+
+
+class IntentMatch(NamedTuple):
+    name: str
+    values: Dict[str, Any]
+    response: str
+
+
+class IntentMatcher:
+    """Match prompts against command rules and compute the resulting values."""
+
+    def __init__(self, rules: List[Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None) -> None:
+        self.defaults = dict(defaults or {})
+        self.rules = []
+        alternatives = []
+        for index, rule in enumerate(rules):
+            for op in rule.get("ops", []):
+                if op.get("op") not in _OPS:
+                    raise ValueError(f"Rule {rule.get('name', index)!r} has unknown op {op.get('op')!r}")
+            self.rules.append(rule)
+            patterns = "|".join(f"(?:{pattern})" for pattern in rule.get("patterns", []))
+            if patterns:
+                alternatives.append(f"(?P<r{index}>{patterns})")
+        # One alternation for all rules, so a prompt is scanned once.
+        self._pattern = None
+        if alternatives:
+            self._pattern = re.compile(f"{_POLITE_PREFIX}(?:{'|'.join(alternatives)}){_POLITE_SUFFIX}")
+
+    @classmethod
+    def from_file(cls, path: str) -> Optional["IntentMatcher"]:
+        """Load a rules file; returns ``None`` when it is missing or invalid."""
+        rules_path = Path(path)
+        if not rules_path.exists():
+            return None
+        try:
+            data = json.loads(rules_path.read_text(encoding="utf-8"))
+            return cls(data.get("rules", []), data.get("defaults"))
+        except (OSError, json.JSONDecodeError, ValueError, re.error) as exc:
+            logging.error("Ignoring intent rules %s: %s", rules_path, exc)
+            return None
+
+    def match(self, prompt: str, device_state: Optional[Dict[str, Any]] = None) -> Optional[IntentMatch]:
+        """Return the payload for ``prompt``, or ``None`` to ask the model."""
+        if self._pattern is None:
+            return None
+        found = self._pattern.fullmatch(normalize_prompt(prompt))
+        if found is None:
+            return None
+        rule = self.rules[int(found.lastgroup[1:])]
+
+        values = copy.deepcopy(self.defaults)
+        values.update(copy.deepcopy(device_state or {}))
+        for op in rule.get("ops", []):
+            if any(_get(values, key) for key in op.get("if_zero", [])):
+                continue
+            for key in op.get("keys", []):
+                _apply(values, key, op)
+        return IntentMatch(rule.get("name", ""), values, rule.get("response", ""))
+
+
+def _locate(values: Dict[str, Any], key: str) -> tuple:
+    """The container holding ``key`` and the index or name within it."""
+    container: Any = values
+    parts = key.split(".")
+    for part in parts[:-1]:
+        container = container[int(part)] if isinstance(container, list) else container.setdefault(part, {})
+    leaf: Any = int(parts[-1]) if isinstance(container, list) else parts[-1]
+    return container, leaf
+
+
+def _get(values: Dict[str, Any], key: str) -> Any:
+    container, leaf = _locate(values, key)
+    return container[leaf] if isinstance(container, list) else container.get(leaf, 0)
+
+
+def _apply(values: Dict[str, Any], key: str, op: Dict[str, Any]) -> None:
+    container, leaf = _locate(values, key)
+    current = _get(values, key)
+    if op.get("skip_zero") and not current:
+        return
+
+    kind = op["op"]
+    if kind == "set":
+        result = copy.deepcopy(op.get("value"))
+    elif kind == "add":
+        result = current + op.get("value", 0)
+    elif kind == "scale":
+        result = current * op.get("value", 1)
+    else:
+        result = -current
+
+    if isinstance(result, (int, float)):
+        if "min" in op:
+            result = max(op["min"], result)
+        if "max" in op:
+            result = min(op["max"], result)
+        digits = op.get("round", 3)
+        result = round(result, digits) if digits else int(round(result))
+    container[leaf] = result
+
+
+__all__ = ["IntentMatch", "IntentMatcher"]
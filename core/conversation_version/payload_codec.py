@@ -0,0 +1,374 @@
+"""Compact binary MQTT payloads generated from the response schema.
+
+Boards parse every JSON payload with ``json.loads``, which is slow on a
+microcontroller and allocates a string per key and number.  ``PayloadCodec``
+reads the ``values`` (or ``MQTT_value``) object of a structured-output
+schema and derives a fixed little-endian layout for it:
+
+* ``number`` is a float32 and ``boolean`` one byte (0/1); ``integer`` uses the
+  smallest type that holds its ``minimum``/``maximum`` bounds (int32 when
+  unbounded);
+* objects are their properties in schema order, without keys;
+* arrays with ``minItems == maxItems`` are their items inline, other arrays
+  are prefixed with a uint8 (``maxItems`` <= 255) or uint16 count;
+* strings are a uint16 length and UTF-8 bytes.
+
+A payload starts with ``MAGIC`` and a 16-bit layout id (a checksum of the
+layout), so a board never mistakes it for JSON or decodes it with the
+decoder of another schema.  A trailing uint32, when present, is the
+sequence number ``ack_tracker.py`` tags payloads with; it is decoded as
+``seq``.  ``encode`` packs a ``values`` dict with a single
+``struct.pack`` call.  ``board_source`` generates the matching CircuitPython
+module: ``decode`` reads the payload with ``struct.unpack_from`` straight
+from the received buffer, and ``loads`` falls back to JSON for anything
+else, so a board accepts both formats.
+
+    python payload_codec.py assistant_response_schema.json --board-out ../circuitpython/payload_codec.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import binascii
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+MAGIC = 0xA5
+_HEADER = struct.Struct("<BH")
+
+_INTEGER_TYPES = (("B", 0, 0xFF), ("b", -0x80, 0x7F), ("H", 0, 0xFFFF), ("h", -0x8000, 0x7FFF))
+
+
+class _Scalar:
+    def __init__(self, fmt: str) -> None:
+        self.fmt = fmt
+
+    def signature(self) -> str:
+        return self.fmt
+
+
+class _String:
+    def signature(self) -> str:
+        return "s"
+
+
+class _Array:
+    def __init__(self, item: "_Node", count: Optional[int], count_fmt: str = "H") -> None:
+        self.item = item
+        self.count = count  # None: variable length with a count_fmt prefix
+        self.count_fmt = count_fmt
+
+    def signature(self) -> str:
+        size = self.count if self.count is not None else self.count_fmt
+        return f"[{size}:{self.item.signature()}]"
+
+
+class _Object:
+    def __init__(self, fields: List[Tuple[str, "_Node"]]) -> None:
+        self.fields = fields
+
+    def signature(self) -> str:
+        return "{" + ",".join(f"{key}:{node.signature()}" for key, node in self.fields) + "}"
+
+
+_Node = Union[_Scalar, _String, _Array, _Object]
+
+
+def _fixed_format(node: _Node) -> Optional[str]:
+    """struct format of ``node`` if its size does not depend on the payload."""
+    if isinstance(node, _Scalar):
+        return node.fmt
+    if isinstance(node, _Array) and node.count is not None:
+        inner = _fixed_format(node.item)
+        return None if inner is None else inner * node.count
+    if isinstance(node, _Object):
+        parts = [_fixed_format(field) for _, field in node.fields]
+        return None if None in parts else "".join(parts)
+    return None
+
+
+def _integer_format(schema: Dict[str, Any]) -> str:
+    low = schema.get("minimum")
+    high = schema.get("maximum")
+    if "exclusiveMinimum" in schema:
+        low = schema["exclusiveMinimum"] + 1
+    if "exclusiveMaximum" in schema:
+        high = schema["exclusiveMaximum"] - 1
+    if low is None or high is None:
+        return "i"
+    for fmt, type_low, type_high in _INTEGER_TYPES:
+        if type_low <= low and high <= type_high:
+            return fmt
+    return "i"
+
+
+def _build(schema: Dict[str, Any], path: str) -> _Node:
+    kind = schema.get("type")
+    if kind == "number":
+        return _Scalar("f")
+    if kind == "integer":
+        return _Scalar(_integer_format(schema))
+    if kind == "boolean":
+        # CircuitPython's struct has no "?"; booleans arrive as 0/1.
+        return _Scalar("B")
+    if kind == "string":
+        return _String()
+    if kind == "array":
+        item = _build(schema.get("items", {}), f"{path}[]")
+        count = schema.get("maxItems")
+        if count is not None and schema.get("minItems") == count:
+            return _Array(item, count)
+        return _Array(item, None, "B" if count is not None and count <= 0xFF else "H")
+    if kind == "object":
+        return _Object([(key, _build(value, f"{path}.{key}")) for key, value in schema.get("properties", {}).items()])
+    raise ValueError(f"{path}: type {kind!r} has no binary layout")
+
+
+def values_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Find the device payload in a response schema file.
+
+    Accepts the ``{"name", "schema"}`` wrapper or a bare schema, whose
+    ``values`` or ``MQTT_value`` property is the payload; a schema without
+    either is taken to describe the payload itself.
+    """
+    schema = schema.get("schema", schema)
+    properties = schema.get("properties", {})
+    for key in ("values", "MQTT_value"):
+        if key in properties:
+            return properties[key]
+    return schema
+
+
+class PayloadCodec:
+    """Binary encoder for one schema, and generator of its board decoder."""
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        root = _build(values_schema(schema), "values")
+        if not isinstance(root, _Object):
+            raise ValueError("the device payload must be a JSON object")
+        self.root = root
+        self.layout = root.signature()
+        self.layout_id = binascii.crc32(self.layout.encode("utf-8")) & 0xFFFF
+        self.fixed_size = None
+        fixed = _fixed_format(root)
+        if fixed is not None:
+            self.fixed_size = _HEADER.size + struct.calcsize("<" + fixed)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "PayloadCodec":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def encode(self, values: Dict[str, Any]) -> bytes:
+        """Pack ``values``; raises ValueError when they do not fit the schema."""
+        fmt = ["<BH"]
+        args: List[Any] = [MAGIC, self.layout_id]
+        try:
+            self._collect(self.root, values, fmt, args)
+            return struct.pack("".join(fmt), *args)
+        except (KeyError, TypeError, IndexError, struct.error) as exc:
+            raise ValueError(f"values do not match the payload layout: {exc!r}") from exc
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """Host-side decoder, mirroring the generated board module."""
+        magic, layout_id = _HEADER.unpack_from(data)
+        if magic != MAGIC or layout_id != self.layout_id:
+            raise ValueError("unknown payload layout")
+        value, offset = self._read(self.root, data, _HEADER.size)
+        if len(data) >= offset + 4:
+            (value["seq"],) = struct.unpack_from("<I", data, offset)
+        return value
+
+    def _collect(self, node: _Node, value: Any, fmt: List[str], args: List[Any]) -> None:
+        if isinstance(node, _Scalar):
+            fmt.append(node.fmt)
+            args.append(value)
+        elif isinstance(node, _String):
+            encoded = value.encode("utf-8")
+            fmt.append(f"H{len(encoded)}s")
+            args.extend((len(encoded), encoded))
+        elif isinstance(node, _Array):
+            if node.count is None:
+                fmt.append(node.count_fmt)
+                args.append(len(value))
+            elif len(value) != node.count:
+                raise IndexError(f"expected {node.count} items, got {len(value)}")
+            for item in value:
+                self._collect(node.item, item, fmt, args)
+        else:
+            for key, field in node.fields:
+                self._collect(field, value[key], fmt, args)
+
+    def _read(self, node: _Node, data: bytes, offset: int) -> Tuple[Any, int]:
+        if isinstance(node, _Scalar):
+            (value,) = struct.unpack_from("<" + node.fmt, data, offset)
+            return value, offset + struct.calcsize(node.fmt)
+        if isinstance(node, _String):
+            (length,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            return data[offset:offset + length].decode("utf-8"), offset + length
+        if isinstance(node, _Array):
+            count = node.count
+            if count is None:
+                (count,) = struct.unpack_from("<" + node.count_fmt, data, offset)
+                offset += struct.calcsize(node.count_fmt)
+            items = []
+            for _ in range(count):
+                item, offset = self._read(node.item, data, offset)
+                items.append(item)
+            return items, offset
+        value = {}
+        for key, field in node.fields:
+            value[key], offset = self._read(field, data, offset)
+        return value, offset
+
+    def board_source(self, origin: str = "the response schema") -> str:
+        """Source of the CircuitPython decoder module for this layout."""
+        writer = _DecoderWriter()
+        result = writer.emit(self.root, 1)
+        lines = [
+            f'"""Binary payload decoder generated by payload_codec.py from {origin}.',
+            "",
+            f"Layout {self.layout}",
+            "",
+            "Do not edit; regenerate it when the schema changes.",
+            '"""',
+            "",
+            "import json",
+            "import struct",
+            "",
+            f"MAGIC = 0x{MAGIC:02X}",
+            f"LAYOUT_ID = 0x{self.layout_id:04X}",
+            "",
+            "",
+            "def decode(buf):",
+            '    """Decode a binary payload into the dict its JSON form would give."""',
+            '    if buf[0] != MAGIC or struct.unpack_from("<H", buf, 1)[0] != LAYOUT_ID:',
+            '        raise ValueError("unknown payload layout")',
+            f"    o = {_HEADER.size}",
+            *writer.lines,
+            f"    values = {result}",
+            "    if len(buf) >= o + 4:",
+            '        values["seq"] = struct.unpack_from("<I", buf, o)[0]',
+            "    return values",
+            "",
+            "",
+            "def loads(message):",
+            '    """Parse an MQTT message: binary payloads with decode(), anything else as JSON."""',
+            "    if isinstance(message, str):",
+            "        return json.loads(message)",
+            "    if message and message[0] == MAGIC:",
+            "        return decode(message)",
+            '    return json.loads(str(message, "utf-8"))',
+            "",
+        ]
+        return "\n".join(lines)
+
+
+class _DecoderWriter:
+    """Emits ``struct.unpack_from`` code, one call per fixed-size run."""
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self._names = 0
+
+    def _name(self) -> str:
+        self._names += 1
+        return f"v{self._names}"
+
+    def _line(self, depth: int, text: str) -> None:
+        self.lines.append("    " * depth + text)
+
+    def emit(self, node: _Node, depth: int) -> str:
+        """Write the code reading ``node`` at ``o``; returns an expression for its value."""
+        fixed = _fixed_format(node)
+        if fixed is not None and not isinstance(node, _Scalar):
+            name = self._name()
+            self._line(depth, f'{name} = struct.unpack_from("<{fixed}", buf, o)')
+            self._line(depth, f"o += {struct.calcsize('<' + fixed)}")
+            if isinstance(node, _Array) and isinstance(node.item, _Scalar):
+                return f"list({name})"
+            expression, _ = self._from_tuple(node, name, 0)
+            return expression
+        if isinstance(node, _Scalar):
+            name = self._name()
+            self._line(depth, f'{name} = struct.unpack_from("<{node.fmt}", buf, o)[0]')
+            self._line(depth, f"o += {struct.calcsize(node.fmt)}")
+            return name
+        if isinstance(node, _String):
+            length, name = self._name(), self._name()
+            self._line(depth, f'{length} = struct.unpack_from("<H", buf, o)[0]')
+            self._line(depth, f'{name} = str(buf[o + 2:o + 2 + {length}], "utf-8")')
+            self._line(depth, f"o += 2 + {length}")
+            return name
+        if isinstance(node, _Array):
+            name = self._name()
+            count = str(node.count)
+            if node.count is None:
+                count = self._name()
+                self._line(depth, f'{count} = struct.unpack_from("<{node.count_fmt}", buf, o)[0]')
+                self._line(depth, f"o += {struct.calcsize(node.count_fmt)}")
+            item_format = _fixed_format(node.item)
+            if node.count is None and item_format is not None:
+                # One unpack_from for every item, instead of one call each.
+                flat = self._name()
+                width = len(item_format)
+                if item_format == item_format[0] * width:
+                    self._line(depth, f'{flat} = struct.unpack_from("<%d{item_format[0]}" % ({width} * {count}), buf, o)')
+                else:
+                    self._line(depth, f'{flat} = struct.unpack_from("<" + "{item_format}" * {count}, buf, o)')
+                self._line(depth, f"o += {struct.calcsize('<' + item_format)} * {count}")
+                item, _ = self._from_tuple(node.item, flat, 0, base="i")
+                self._line(depth, f"{name} = [{item} for i in range(0, {width} * {count}, {width})]")
+                return name
+            self._line(depth, f"{name} = []")
+            self._line(depth, f"for _ in range({count}):")
+            item = self.emit(node.item, depth + 1)
+            self._line(depth + 1, f"{name}.append({item})")
+            return name
+        parts = [f'"{key}": {self.emit(field, depth)}' for key, field in node.fields]
+        return "{" + ", ".join(parts) + "}"
+
+    def _from_tuple(self, node: _Node, name: str, index: int, base: Optional[str] = None) -> Tuple[str, int]:
+        """Expression building ``node`` from ``name[base + index:]`` of an unpacked tuple."""
+        if isinstance(node, _Scalar):
+            if base is None:
+                return f"{name}[{index}]", index + 1
+            return (f"{name}[{base} + {index}]" if index else f"{name}[{base}]"), index + 1
+        if isinstance(node, _Array):
+            if isinstance(node.item, _Scalar) and node.count > 8 and base is None:
+                end = index + node.count
+                return f"list({name}[{index}:{end}])", end
+            items = []
+            for _ in range(node.count):
+                item, index = self._from_tuple(node.item, name, index, base)
+                items.append(item)
+            return "[" + ", ".join(items) + "]", index
+        parts = []
+        for key, field in node.fields:
+            value, index = self._from_tuple(field, name, index, base)
+            parts.append(f'"{key}": {value}')
+        return "{" + ", ".join(parts) + "}", index
+
+
+__all__ = ["MAGIC", "PayloadCodec", "values_schema"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show the binary layout of a response schema and generate its board decoder.")
+    parser.add_argument("schema", help="schema.json or assistant_response_schema.json")
+    parser.add_argument("--board-out", help="write the CircuitPython decoder module here")
+    args = parser.parse_args()
+
+    codec = PayloadCodec.from_file(args.schema)
+    size = f"{codec.fixed_size} bytes" if codec.fixed_size is not None else "variable size"
+    print(f"layout 0x{codec.layout_id:04X} ({size}): {codec.layout}")
+    if args.board_out:
+        origin = "/".join(Path(args.schema).resolve().parts[-2:])
+        Path(args.board_out).write_text(codec.board_source(origin), encoding="utf-8")
+        print(f"wrote {args.board_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Exact-match cache for assistant replies.
+
+Installations hear the same few requests ("stop all", "spin faster") over and
+over.  ``ResponseCache`` remembers the structured reply to each one so a repeat
+can be answered without an LLM round trip.  An entry is only reused when all of
+these match:
+
+* the prompt after normalisation (case, spacing and punctuation ignored),
+* the assistant configuration (a hash of the instructions and schema), and
+* the device state the request was made in (the last published ``values``),
+  since "spin faster" means something different at every speed.
+
+Entries are evicted least-recently-used beyond ``max_entries`` and expire after
+``ttl`` seconds.  With ``path`` set, the cache is written to a JSON file after
+each insert and reloaded on start, so it survives restarts.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold a prompt to the form used in cache keys."""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def config_fingerprint(*parts: Any) -> str:
+    """Hash the assistant configuration (file paths, strings or JSON objects)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, Path):
+            try:
+                data = part.read_bytes()
+            except OSError:
+                data = b""
+        elif isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """Bounded LRU + TTL map from (prompt, config, device state) to a reply."""
+
+    def __init__(
+        self,
+        *,
+        fingerprint: str,
+        max_entries: int = 256,
+        ttl: float = 3600.0,
+        path: Optional[str] = None,
+    ) -> None:
+        self.fingerprint = fingerprint
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._load()
+
+    def key(self, prompt: str, device_state: Optional[Dict[str, Any]]) -> str:
+        state = json.dumps(device_state or {}, sort_keys=True, separators=(",", ":"))
+        raw = f"{self.fingerprint}\0{normalize_prompt(prompt)}\0{state}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, device_state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Return the cached reply for this prompt and state, or ``None``."""
+        key = self.key(prompt, device_state)
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self._entries[key]
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry["reply"])
+
+    def put(
+        self,
+        prompt: str,
+        device_state: Optional[Dict[str, Any]],
+        reply: Dict[str, Any],
+    ) -> bool:
+        """Store ``reply`` if it carries values; returns whether it was cached."""
+        values = reply.get("values")
+        if not isinstance(values, dict) or not values:
+            # Errors and clarifying questions must go back to the model.
+            return False
+
+        key = self.key(prompt, device_state)
+        self._entries[key] = {"reply": reply, "stored_at": time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._save()
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl > 0 and time.time() - entry["stored_at"] > self.ttl
+
+    def _load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            logging.error("Ignoring unreadable response cache %s: %s", self.path, exc)
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            # Instructions or schema changed; old replies no longer apply.
+            return
+        for key, entry in data.get("entries", []):
+            if not self._expired(entry):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        data = {"fingerprint": self.fingerprint, "entries": list(self._entries.items())}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logging.error("Unable to persist response cache to %s: %s", self.path, exc)
+
+
+__all__ = ["ResponseCache", "config_fingerprint", "normalize_prompt"]
@@ -0,0 +1,101 @@
+"""One model turn per session, where a newer prompt supersedes the older one.
+
+The CLI used to await every turn before reading the next input, so a visitor
+who rephrased or changed their mind mid-reply had to wait for the stale run
+to finish, and the stale ``values`` still reached the device.  The chat loop
+now hands each turn to ``RunSupervisor.submit`` and keeps listening.  When
+another prompt arrives for the same session while a turn is running, that
+turn's task is cancelled: the client module cancels the remote run (or
+closes its stream) on ``CancelledError`` and the turn publishes nothing.
+
+``stats()`` counts superseded turns and the seconds they had been running;
+the client modules report what the cancelled runs had already cost.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, NamedTuple, Optional
+
+
+class _Turn(NamedTuple):
+    task: asyncio.Task
+    started: float
+
+
+class RunSupervisor:
+    """Keeps at most one running turn per session key."""
+
+    def __init__(self) -> None:
+        self._turns: Dict[Any, _Turn] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.superseded = 0
+        self.superseded_seconds = 0.0
+
+    def submit(self, turn: Awaitable[Any], session: Any = None) -> asyncio.Task:
+        """Run ``turn`` for ``session``, cancelling the turn it replaces."""
+        self.supersede(session)
+        self.submitted += 1
+        task = asyncio.ensure_future(self._run(turn))
+        self._turns[session] = _Turn(task, time.monotonic())
+        task.add_done_callback(lambda done: self._forget(session, done))
+        return task
+
+    def supersede(self, session: Any = None) -> bool:
+        """Cancel the running turn of ``session``; True if there was one."""
+        current = self._turns.pop(session, None)
+        if current is None or current.task.done():
+            return False
+        current.task.cancel()
+        self.superseded += 1
+        self.superseded_seconds += time.monotonic() - current.started
+        return True
+
+    def busy(self, session: Any = None) -> bool:
+        current = self._turns.get(session)
+        return current is not None and not current.task.done()
+
+    async def wait(self, session: Any = None) -> None:
+        """Wait for the running turn of ``session``, if any, to end."""
+        current = self._turns.get(session)
+        if current is not None:
+            await asyncio.gather(current.task, return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        """Cancel every running turn and wait until they have stopped."""
+        tasks = [turn.task for turn in self._turns.values()]
+        for session in list(self._turns):
+            self.supersede(session)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "superseded": self.superseded,
+            "superseded_seconds": round(self.superseded_seconds, 2),
+            "running": sum(1 for turn in self._turns.values() if not turn.task.done()),
+        }
+
+    async def _run(self, turn: Awaitable[Any]) -> Optional[Any]:
+        try:
+            result = await turn
+        except asyncio.CancelledError:
+            return None
+        except Exception:
+            logging.exception("Turn failed")
+            return None
+        self.completed += 1
+        return result
+
+    def _forget(self, session: Any, task: asyncio.Task) -> None:
+        current = self._turns.get(session)
+        if current is not None and current.task is task:
+            del self._turns[session]
+
+
+__all__ = ["RunSupervisor"]
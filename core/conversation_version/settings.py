@@ -34,6 +34,23 @@ def _optional(name: str, default: str = "") -> str:
     return os.getenv(name, default)
 
 
+def _optional_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _optional_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Invalid number for {name}: {value}") from exc
+
+
 def _optional_int(name: str, default: int) -> int:
     value = os.getenv(name)
     if value is None:
@@ -51,7 +68,26 @@ settings = {
     "mqtt_password": _optional("MQTT_PASSWORD"),
     "client_id": _optional("MQTT_CLIENT_ID", "windmill-assistant"),
     "mqtt_port": _optional_int("MQTT_PORT", 1883),
+    # Payloads held per topic while the broker is unreachable; with coalescing
+    # a topic keeps only its newest state.
+    "mqtt_queue_depth": _optional_int("MQTT_QUEUE_DEPTH", 16),
+    "mqtt_coalesce": _optional_bool("MQTT_COALESCE", True),
+    # Send only the keys that changed, with a full state every N messages or
+    # S seconds so a board that missed one resynchronises.
+    "mqtt_delta": _optional_bool("MQTT_DELTA", False),
+    "mqtt_keyframe_every": _optional_int("MQTT_KEYFRAME_EVERY", 20),
+    "mqtt_keyframe_seconds": _optional_float("MQTT_KEYFRAME_SECONDS", 60.0),
+    # "binary" sends fixed-layout payloads derived from the response schema;
+    # the board needs the matching generated payload_codec.py.
+    "mqtt_payload_format": _optional("MQTT_PAYLOAD_FORMAT", "json").strip().lower(),
+    # The board acks each payload on <topic>/ack; unacked state is resent.
+    "mqtt_acks": _optional_bool("MQTT_ACKS", False),
+    "mqtt_ack_timeout": _optional_float("MQTT_ACK_TIMEOUT", 2.0),
+    "mqtt_ack_retries": _optional_int("MQTT_ACK_RETRIES", 3),
     "openAIToken": _require("OPENAI_API_KEY"),
+    "openai_max_connections": _optional_int("OPENAI_MAX_CONNECTIONS", 20),
+    "openai_max_keepalive": _optional_int("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10),
+    "openai_http2": _optional_bool("OPENAI_HTTP2", True),
     "assistant_id": _optional("OPENAI_ASSISTANT_ID"),
     "prompt_id": _optional("OPENAI_PROMPT_ID"),
     "prompt_instructions": _optional("PROMPT_INSTRUCTIONS"),
@@ -61,7 +97,6 @@ settings = {
         "schema": {
             "type": "object",
             "properties": {
-                "response": {"type": "string"},
                 "values": {
                     "type": "object",
                     "properties": {
@@ -82,8 +117,11 @@ settings = {
                     ],
                     "additionalProperties": False,
                 },
+                # "values" comes first so it can be published while the
+                # "response" text is still streaming.
+                "response": {"type": "string"},
             },
-            "required": ["response", "values"],
+            "required": ["values", "response"],
             "additionalProperties": False,
         },
     },
@@ -92,6 +130,23 @@ settings = {
     "telepotToken": _optional("TELEPOT_TOKEN"),
     "DB": _optional("SQLITE_DB"),
     "transcription_model": _optional("TRANSCRIPTION_MODEL", "gpt-4o-transcribe"),
+    "transcription_streaming": _optional_bool("TRANSCRIPTION_STREAMING", False),
+    "transcription_base_url": _optional("TRANSCRIPTION_BASE_URL").strip(),
+    "transcription_codec": _optional("TRANSCRIPTION_CODEC", "wav").strip().lower(),
+    "transcription_trim_silence": _optional_bool("TRANSCRIPTION_TRIM_SILENCE", False),
+    "intent_rules": _optional_bool("INTENT_RULES", True),
+    "intent_rules_file": _optional(
+        "ASSISTANT_RULES_FILE",
+        str(Path(__file__).resolve().parent / "assistant_rules.json"),
+    ),
+    "response_cache": _optional_bool("RESPONSE_CACHE", False),
+    "response_cache_size": _optional_int("RESPONSE_CACHE_SIZE", 256),
+    "response_cache_ttl": _optional_int("RESPONSE_CACHE_TTL", 3600),
+    "response_cache_file": _optional("RESPONSE_CACHE_FILE"),
+    "semantic_cache": _optional_bool("SEMANTIC_CACHE", False),
+    "semantic_cache_threshold": _optional_float("SEMANTIC_CACHE_THRESHOLD", 0.9),
+    "semantic_cache_size": _optional_int("SEMANTIC_CACHE_SIZE", 5000),
+    "semantic_cache_file": _optional("SEMANTIC_CACHE_FILE"),
     "Welcom_msg": _optional(
         "WELCOME_MESSAGE",
         "Hello! Ask a question to adjust the windmills.",
@@ -0,0 +1,234 @@
+"""Transcription backends that can receive audio while it is being spoken.
+
+The voice loop used to wait for the end of an utterance, build a WAV file and
+only then upload it, so the whole upload sat on the critical path.  A
+``TranscriptionStream`` is opened when speech starts, ``feed`` is called with
+16-bit mono PCM as it is captured, and ``finish`` returns the transcript once
+the endpointer closes the utterance (``cancel`` drops it instead).
+
+Backends:
+
+* ``BufferedTranscription`` collects the audio and hands a WAV file to an
+  ``async transcribe(wav_bytes)`` function at the end; this is the old
+  behaviour and the fallback.  With an ``encode(pcm, sample_rate)`` function
+  (e.g. ``audio_encoding.prepare_upload``) the utterance is compressed first
+  and ``transcribe(data, filename, content_type)`` receives the result.
+* ``UploadTranscription`` posts a ``multipart/form-data`` request to an
+  OpenAI-compatible ``/audio/transcriptions`` endpoint with a chunked body,
+  so the audio is already uploaded when the speaker stops.  The WAV header
+  declares an unknown length, as for any streamed WAV.  If the request fails
+  the collected audio is transcribed with the fallback instead.
+* ``LocalTranscription`` runs a ``local_whisper.LocalWhisper`` model on this
+  machine over the collected PCM (no WAV file) and records the real-time
+  factor of the utterance in ``rtf``.
+
+Any other backend only needs ``feed``, ``finish`` and ``cancel``.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import struct
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+# Data size used in streamed WAV headers when the final length is not known.
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def wav_header(sample_rate: int, data_size: Optional[int] = None) -> bytes:
+    """44-byte header for 16-bit mono PCM; ``None`` marks a streamed file."""
+    riff_size = _UNKNOWN_SIZE if data_size is None else 36 + data_size
+    data_size = _UNKNOWN_SIZE if data_size is None else data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_size,
+    )
+
+
+def pcm_to_wav(pcm_data: bytes, sample_rate: int) -> bytes:
+    """Wrap raw PCM data in a WAV container."""
+    return wav_header(sample_rate, len(pcm_data)) + pcm_data
+
+
+async def _transcribe_clip(transcribe, encode, pcm: bytes, sample_rate: int) -> Optional[str]:
+    if encode is None:
+        return await transcribe(pcm_to_wav(pcm, sample_rate))
+    # Compression takes milliseconds per second of audio; keep it off the loop.
+    return await transcribe(*await asyncio.to_thread(encode, pcm, sample_rate))
+
+
+class TranscriptionStream(abc.ABC):
+    """Base class: collects the fed audio so any backend can fall back on it."""
+
+    def __init__(self, sample_rate: int) -> None:
+        self.sample_rate = sample_rate
+        self.pcm = bytearray()
+        # Set by backends that transcribe locally: seconds spent and their
+        # ratio to the audio duration.
+        self.elapsed: Optional[float] = None
+        self.rtf: Optional[float] = None
+
+    def feed(self, pcm: bytes) -> None:
+        self.pcm += pcm
+
+    @abc.abstractmethod
+    async def finish(self) -> Optional[str]:
+        """Return the transcript of the fed audio, or None if there is none."""
+
+    def cancel(self) -> None:
+        """Abandon the utterance; ``finish`` will not be called."""
+
+
+class BufferedTranscription(TranscriptionStream):
+    """Transcribe the whole utterance in one request once it has ended."""
+
+    def __init__(
+        self,
+        transcribe: Callable[..., Awaitable[Optional[str]]],
+        sample_rate: int,
+        encode: Optional[Callable[[bytes, int], tuple]] = None,
+    ) -> None:
+        super().__init__(sample_rate)
+        self.transcribe = transcribe
+        self.encode = encode
+
+    async def finish(self) -> Optional[str]:
+        return await _transcribe_clip(self.transcribe, self.encode, bytes(self.pcm), self.sample_rate)
+
+
+class LocalTranscription(TranscriptionStream):
+    """Transcribe the utterance on this machine once it has ended."""
+
+    def __init__(self, model, sample_rate: int) -> None:
+        super().__init__(sample_rate)
+        self.model = model
+
+    async def finish(self) -> Optional[str]:
+        try:
+            result = await self.model.transcribe_pcm_async(bytes(self.pcm), self.sample_rate)
+        except Exception as exc:
+            logging.error("Local transcription failed: %s", exc)
+            return None
+        self.elapsed, self.rtf = result.elapsed, result.rtf
+        return result.text or None
+
+
+class UploadTranscription(TranscriptionStream):
+    """Upload audio to ``/audio/transcriptions`` while it is being captured.
+
+    The request is only opened once ``start_after`` bytes have been fed, so
+    short blips that the endpointer will discard never reach the server.
+    """
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        *,
+        base_url: str,
+        api_key: str,
+        model: str,
+        sample_rate: int,
+        language: Optional[str] = "en",
+        start_after: int = 0,
+        fallback: Optional[Callable[..., Awaitable[Optional[str]]]] = None,
+        encode: Optional[Callable[[bytes, int], tuple]] = None,
+        timeout: float = 60.0,
+    ) -> None:
+        super().__init__(sample_rate)
+        self.http_client = http_client
+        self.url = base_url.rstrip("/") + "/audio/transcriptions"
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.start_after = start_after
+        self.fallback = fallback
+        self.encode = encode
+        self.timeout = timeout
+        self._boundary = uuid.uuid4().hex
+        self._chunks: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def feed(self, pcm: bytes) -> None:
+        super().feed(pcm)
+        if self._task is None:
+            if len(self.pcm) < self.start_after:
+                return
+            # Everything buffered so far goes out as the first chunk.
+            self._chunks.put_nowait(bytes(self.pcm))
+            self._task = asyncio.create_task(self._upload())
+            return
+        self._chunks.put_nowait(pcm)
+
+    async def finish(self) -> Optional[str]:
+        if self._task is None:
+            # Shorter than start_after: a single buffered upload is just as fast.
+            return await self._transcribe_buffered()
+        self._chunks.put_nowait(None)
+        try:
+            return await self._task
+        except (httpx.HTTPError, OSError) as exc:
+            logging.error("Streaming transcription failed (%s); retrying with the full clip.", exc)
+            return await self._transcribe_buffered()
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _transcribe_buffered(self) -> Optional[str]:
+        if self.fallback is None:
+            return None
+        return await _transcribe_clip(self.fallback, self.encode, bytes(self.pcm), self.sample_rate)
+
+    def _field(self, name: str, value: str) -> bytes:
+        return (
+            f"--{self._boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode("utf-8")
+
+    async def _body(self):
+        yield self._field("model", self.model)
+        yield self._field("response_format", "text")
+        if self.language:
+            yield self._field("language", self.language)
+        yield (
+            f"--{self._boundary}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="speech.wav"\r\n'
+            "Content-Type: audio/wav\r\n\r\n"
+        ).encode("utf-8") + wav_header(self.sample_rate)
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        yield f"\r\n--{self._boundary}--\r\n".encode("utf-8")
+
+    async def _upload(self) -> Optional[str]:
+        response = await self.http_client.post(
+            self.url,
+            content=self._body(),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": f"multipart/form-data; boundary={self._boundary}",
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.text.strip() or None
+
+
+__all__ = [
+    "BufferedTranscription",
+    "LocalTranscription",
+    "TranscriptionStream",
+    "UploadTranscription",
+    "pcm_to_wav",
+    "wav_header",
+]
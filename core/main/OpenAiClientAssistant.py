@@ -1,17 +1,46 @@
 import asyncio
+import importlib.util
+import io
 import json
 import logging
 from pathlib import Path
 from typing import Any, Optional
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
+from audio_encoding import EncodedAudio, prepare_upload
+from local_whisper import get_model, is_local_model
 from settings import settings
+from streaming_payload import StreamingPayloadParser
+from thread_pool import ThreadPool
+from transcription import (
+    BufferedTranscription,
+    LocalTranscription,
+    TranscriptionStream,
+    UploadTranscription,
+)
+
+
+def _build_http_client() -> DefaultAsyncHttpxClient:
+    """Create the keep-alive connection pool shared by every API call."""
+    http2 = settings["openai_http2"] and importlib.util.find_spec("h2") is not None
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings["openai_max_connections"],
+            max_keepalive_connections=settings["openai_max_keepalive"],
+        ),
+    )
+
 
-# Initialize the OpenAI client
-client = OpenAI(
+_http_client = _build_http_client()
+
+# Initialize the OpenAI client (one per process, reused across turns)
+client = AsyncOpenAI(
     api_key=settings["openAIToken"],
     default_headers={"OpenAI-Beta": "assistants=v1"},
+    http_client=_http_client,
 )
 
 _state_path = Path(settings["assistant_state_file"])
@@ -20,9 +49,33 @@ _schema_path = Path(settings["assistant_schema_file"])
 _assistant_model = settings["assistant_model"]
 _assistant_name = settings["assistant_name"].strip() or None
 _assistant_description = settings["assistant_description"].strip() or None
+_run_mode = settings["run_mode"].strip().lower()
 
 _assistant_id: Optional[str] = None
 _assistant_lock = asyncio.Lock()
+# Streamed runs that returned their reply but are still draining run events.
+_pending_runs: dict[str, asyncio.Future] = {}
+# Run of the turn in progress per thread: {"id": ..., "creating": ...}; the
+# id is only known once the create request (or the first event) returns.
+_active_runs: dict[str, dict[str, Any]] = {}
+# What superseded runs had cost before they were cancelled.
+_cancelled_runs = {"runs": 0, "prompt_tokens": 0, "completion_tokens": 0, "finished_anyway": 0}
+
+# Messages requested per page when fetching a run's reply.
+_REPLY_PAGE_SIZE = 5
+
+# Audio collected before a streamed transcription upload is opened, so blips
+# the endpointer discards never reach the server.
+_STREAM_START_SECONDS = 0.35
+
+_RUN_TERMINAL_STATUSES = {"completed", "cancelled", "failed", "expired", "incomplete"}
+
+_RUN_FAILURE_EVENTS = {
+    "thread.run.failed",
+    "thread.run.cancelled",
+    "thread.run.expired",
+    "thread.run.incomplete",
+}
 
 
 def _load_text_file(path: Path) -> Optional[str]:
@@ -121,7 +174,7 @@ async def get_assistant_id() -> Optional[str]:
         }
 
         try:
-            assistant = await asyncio.to_thread(client.beta.assistants.create, **request)
+            assistant = await client.beta.assistants.create(**request)
         except Exception as exc:
             logging.error("Failed to create assistant: %s", exc)
             return None
@@ -132,30 +185,59 @@ async def get_assistant_id() -> Optional[str]:
         return _assistant_id
 
 
-async def create_new_thread():
-    """Create a new OpenAI thread."""
+async def _create_thread() -> Optional[str]:
     try:
-        thread = await asyncio.to_thread(client.beta.threads.create)
+        thread = await client.beta.threads.create()
         return thread.id
     except Exception as exc:
         logging.error("Error creating thread: %s", exc)
         return None
 
 
+async def _delete_thread(thread_id: str) -> None:
+    try:
+        await client.beta.threads.delete(thread_id)
+    except Exception as exc:
+        logging.warning("Could not delete unused thread %s: %s", thread_id, exc)
+
+
+_thread_pool = ThreadPool(
+    _create_thread,
+    size=settings["thread_pool_size"],
+    max_age=settings["thread_pool_max_age"],
+    discard=_delete_thread,
+)
+
+
+async def create_new_thread():
+    """Hand out a new OpenAI thread, created ahead of time when possible."""
+    return await _thread_pool.acquire()
+
+
+async def close_threads() -> None:
+    """Delete the spare pre-created threads; call once before exiting.
+
+    Also waits for superseded runs to finish cancelling, so none keeps
+    generating (and billing) after the program has exited.
+    """
+    await _thread_pool.close()
+    if _pending_runs:
+        await asyncio.gather(*_pending_runs.values(), return_exceptions=True)
+
+
 async def check_run(thread_id, run_id):
     """Wait until an OpenAI run finishes."""
     while True:
         try:
-            run = await asyncio.to_thread(
-                client.beta.threads.runs.retrieve,
+            run = await client.beta.threads.runs.retrieve(
                 thread_id=thread_id,
                 run_id=run_id,
             )
 
             if run.status == "completed":
                 break
-            if run.status == "expired":
-                logging.error("Run expired for thread %s", thread_id)
+            if run.status in ("expired", "failed", "cancelled", "incomplete"):
+                logging.error("Run %s for thread %s", run.status, thread_id)
                 break
             await asyncio.sleep(3)
         except Exception as exc:
@@ -163,11 +245,139 @@ async def check_run(thread_id, run_id):
             break
 
 
-async def GPT_response(thread_id, prompt):
-    """Send a prompt to the assistant and return the response payload."""
+async def _poll_run(thread_id, assistant_id, run_id=None):
+    """Start (or resume) a run, poll until it finishes and return the reply."""
+    if not run_id:
+        creating = asyncio.ensure_future(client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+        ))
+        run_ref = _active_runs.setdefault(thread_id, {"id": None})
+        run_ref["creating"] = creating
+        # Shielded so a superseded turn still learns the id it has to cancel.
+        run = await asyncio.shield(creating)
+        run_id = run_ref["id"] = run.id
+
+    await check_run(thread_id, run_id)
+    return await _fetch_run_reply(thread_id, run_id)
+
+
+async def _fetch_run_reply(thread_id, run_id):
+    """Return the assistant message written by ``run_id``.
+
+    Asks only for that run's messages, newest first, so the request stays the
+    same size however long the thread gets. If the filter finds nothing, walk
+    the thread backwards page by page and stop at the prompt that started the
+    run; everything older belongs to earlier turns.
+    """
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        run_id=run_id,
+        order="desc",
+        limit=_REPLY_PAGE_SIZE,
+    )
+    for message in page.data:
+        if message.role == "assistant":
+            return message
+
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order="desc",
+        limit=_REPLY_PAGE_SIZE,
+    )
+    while True:
+        for message in page.data:
+            if message.role == "user":
+                return None
+            if message.run_id == run_id:
+                return message
+        if not page.has_next_page():
+            return None
+        page = await page.get_next_page()
+
+
+async def _stream_run(thread_id, assistant_id, parser: Optional[StreamingPayloadParser] = None):
+    """Start a run with streamed events and return the reply message.
+
+    Resolves as soon as ``thread.message.completed`` arrives. Text deltas are
+    fed to ``parser`` as they stream in. The remaining events are drained in
+    a background task so the run can settle before the next message is
+    posted; if the stream breaks, the run is polled instead.
+    """
+    loop = asyncio.get_running_loop()
+    reply: asyncio.Future = loop.create_future()
+    run_ref = _active_runs.setdefault(thread_id, {"id": None})
+
+    def _resolve(message=None, exc: Optional[BaseException] = None) -> None:
+        if reply.done():
+            return
+        if exc is not None:
+            reply.set_exception(exc)
+        else:
+            reply.set_result(message)
+
+    async def _consume() -> None:
+        try:
+            stream = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                stream=True,
+            )
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.message.delta" and parser is not None:
+                        for block in event.data.delta.content or []:
+                            text_delta = getattr(getattr(block, "text", None), "value", None)
+                            if text_delta:
+                                parser.feed(text_delta)
+                    elif event.event == "thread.run.created":
+                        run_ref["id"] = event.data.id
+                    elif event.event == "thread.message.completed":
+                        _resolve(event.data)
+                    elif event.event in _RUN_FAILURE_EVENTS:
+                        # A superseded run being cancelled is expected.
+                        log = logging.info if run_ref.get("cancelling") else logging.error
+                        log("Run for thread %s ended with %s", thread_id, event.event)
+                        break
+        except Exception as exc:
+            _resolve(None, exc)
+        finally:
+            _resolve()
+
+    _pending_runs[thread_id] = asyncio.ensure_future(_consume())
     try:
-        await asyncio.to_thread(
-            client.beta.threads.messages.create,
+        return await reply
+    except Exception as exc:
+        logging.warning("Streamed run failed for thread %s; polling instead: %s", thread_id, exc)
+        await _wait_for_pending_run(thread_id)
+        return await _poll_run(thread_id, assistant_id, run_ref["id"])
+
+
+async def _wait_for_pending_run(thread_id) -> None:
+    """Let a previously streamed run finish before touching its thread."""
+    pending = _pending_runs.pop(thread_id, None)
+    if pending is not None:
+        try:
+            await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # Superseded while waiting; the next prompt has to wait instead.
+            _pending_runs.setdefault(thread_id, pending)
+            raise
+        except Exception as exc:
+            logging.error("Error draining run events: %s", exc)
+
+
+async def GPT_response(thread_id, prompt, on_values=None, on_text=None):
+    """Send a prompt to the assistant and return the response payload.
+
+    When streaming, ``on_values`` is called with the ``values`` object as soon
+    as it is complete and ``on_text`` with each decoded piece of ``response``,
+    both before this coroutine returns.
+    """
+    try:
+        await _wait_for_pending_run(thread_id)
+        _active_runs[thread_id] = {"id": None}
+        await client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt,
@@ -180,36 +390,101 @@ async def GPT_response(thread_id, prompt):
                 "values": {},
             }
 
-        run = await asyncio.to_thread(
-            client.beta.threads.runs.create,
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-
-        await check_run(thread_id, run.id)
-
-        messages = await asyncio.to_thread(
-            client.beta.threads.messages.list, thread_id=thread_id
-        )
-        if not messages.data:
+        if _run_mode == "poll":
+            message = await _poll_run(thread_id, assistant_id)
+        else:
+            parser = None
+            if on_values or on_text:
+                parser = StreamingPayloadParser(on_values, on_text)
+            message = await _stream_run(thread_id, assistant_id, parser)
+        if message is None:
             return {"response": "No response received", "values": {}}
 
-        assistant_message = messages.data[0].content[0].text.value
+        assistant_message = message.content[0].text.value
         try:
             return json.loads(assistant_message)
         except json.JSONDecodeError:
             return {"response": assistant_message, "values": {}}
+    except asyncio.CancelledError:
+        # Superseded by a newer prompt: stop the run before the thread is reused.
+        run_ref = _active_runs.pop(thread_id, None)
+        if run_ref is not None:
+            _pending_runs[thread_id] = asyncio.ensure_future(
+                _cancel_run(thread_id, run_ref, _pending_runs.get(thread_id))
+            )
+        raise
     except Exception as exc:
         logging.error("Error in GPT response: %s", exc)
         return {"response": "An error occurred while processing your request", "values": {}}
+    finally:
+        _active_runs.pop(thread_id, None)
+
 
+async def _cancel_run(thread_id, run_ref, drain=None) -> None:
+    """Cancel a superseded run and wait until it has stopped.
 
-async def transcribe_audio(audio_bytes: bytes) -> str | None:
-    """Transcribe WAV audio bytes using the configured OpenAI model."""
+    Runs on as a pending task of the thread, so the next prompt is only posted
+    once the run is no longer active. Records the tokens it had used.
+    """
+    run_ref["cancelling"] = True
+    if not run_ref["id"] and run_ref.get("creating") is not None:
+        try:
+            run_ref["id"] = (await run_ref["creating"]).id
+        except Exception:
+            pass
+    # A streamed run's id arrives with its first event.
+    for _ in range(100):
+        if run_ref["id"] or drain is None or drain.done():
+            break
+        await asyncio.sleep(0.05)
+    run_id = run_ref["id"]
+    if not run_id:
+        if drain is not None:
+            await asyncio.gather(drain, return_exceptions=True)
+        return
+
+    _cancelled_runs["runs"] += 1
+    try:
+        run = await client.beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
+        while run.status not in _RUN_TERMINAL_STATUSES:
+            await asyncio.sleep(0.25)
+            run = await client.beta.threads.runs.retrieve(run_id=run_id, thread_id=thread_id)
+    except Exception as exc:
+        # Usually the run finished before the cancel reached it.
+        logging.info("Could not cancel run %s: %s", run_id, exc)
+        run = None
+    if drain is not None:
+        await asyncio.gather(drain, return_exceptions=True)
+    if run is None:
+        return
+    if run.status == "completed":
+        _cancelled_runs["finished_anyway"] += 1
+    usage = getattr(run, "usage", None)
+    if usage is not None:
+        _cancelled_runs["prompt_tokens"] += usage.prompt_tokens or 0
+        _cancelled_runs["completion_tokens"] += usage.completion_tokens or 0
+
+
+def cancelled_run_stats() -> dict[str, int]:
+    """Runs cancelled because a newer prompt arrived, and their token usage."""
+    return dict(_cancelled_runs)
+
+
+async def transcribe_audio(
+    audio_bytes: bytes, filename: str = "speech.wav", content_type: str = "audio/wav"
+) -> str | None:
+    """Transcribe an utterance (WAV bytes unless another file type is given)."""
+    if is_local_model(settings["transcription_model"]):
+        try:
+            result = await get_model(settings["transcription_model"]).transcribe_file_async(io.BytesIO(audio_bytes))
+            return result.text or None
+        except Exception as exc:
+            logging.error("Error transcribing audio locally: %s", exc)
+            return None
     try:
-        result = client.audio.transcriptions.create(
+        result = await client.audio.transcriptions.create(
             model=settings["transcription_model"],
-            file=("speech.wav", audio_bytes, "audio/wav"),
+            file=(filename, audio_bytes, content_type),
             response_format="text",
             language="en",
         )
@@ -217,3 +492,40 @@ async def transcribe_audio(audio_bytes: bytes) -> str | None:
     except Exception as exc:
         logging.error("Error transcribing audio: %s", exc)
         return None
+
+
+def _encode_upload(pcm: bytes, sample_rate: int) -> EncodedAudio:
+    """Compress a finished utterance as configured before it is uploaded."""
+    return prepare_upload(
+        pcm,
+        sample_rate,
+        settings["transcription_codec"],
+        trim=settings["transcription_trim_silence"],
+    )
+
+
+def start_transcription(sample_rate: int) -> TranscriptionStream:
+    """Open a transcription for an utterance that is still being spoken."""
+    if is_local_model(settings["transcription_model"]):
+        return LocalTranscription(get_model(settings["transcription_model"]), sample_rate)
+    if not settings["transcription_streaming"]:
+        return BufferedTranscription(transcribe_audio, sample_rate, encode=_encode_upload)
+    return UploadTranscription(
+        _http_client,
+        base_url=settings["transcription_base_url"] or str(client.base_url),
+        api_key=client.api_key,
+        model=settings["transcription_model"],
+        sample_rate=sample_rate,
+        start_after=int(_STREAM_START_SECONDS * sample_rate) * 2,
+        fallback=transcribe_audio,
+        encode=_encode_upload,
+    )
+
+
+async def prepare_transcription() -> Optional[str]:
+    """Load and warm up a local transcription model; returns its name, if any."""
+    if not is_local_model(settings["transcription_model"]):
+        return None
+    model = get_model(settings["transcription_model"])
+    await model.warm_up()
+    return model.model_name
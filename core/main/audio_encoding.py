@@ -0,0 +1,119 @@
+"""Shrink an utterance before it is uploaded for transcription.
+
+Raw 16 kHz 16-bit PCM costs 32 KB per second of speech, up to about 320 KB
+for a 10 s request, and on a slow uplink the upload dominates the time to a
+transcript.  ``encode_audio`` turns the captured PCM into the upload body:
+
+* ``wav``  - the PCM as-is (the old behaviour, no extra dependency),
+* ``flac`` - lossless, typically 45-60 % of the WAV size,
+* ``opus`` - Ogg/Opus at speech bitrates, a small fraction of the WAV size.
+
+FLAC and Opus are written with ``soundfile`` (``pip install soundfile``,
+libsndfile 1.0.29+ for Opus); without it the WAV is sent and a warning is
+logged once.  ``trim_pauses`` optionally shortens long pauses inside the
+utterance before encoding, so hesitations are not uploaded either.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from audio_energy import frame_rms
+from transcription import pcm_to_wav
+
+CODECS = ("wav", "flac", "opus")
+
+# Quietest energy treated as speech when trimming pauses (same as the CLI gate).
+_MIN_SPEECH_ENERGY = 300
+
+_warned_missing = False
+
+
+class EncodedAudio(NamedTuple):
+    data: bytes
+    filename: str
+    content_type: str
+
+
+def trim_pauses(
+    pcm: bytes,
+    sample_rate: int,
+    *,
+    frame_ms: int = 30,
+    keep_ms: int = 300,
+    threshold: Optional[int] = None,
+) -> bytes:
+    """Cut every quiet stretch longer than ``keep_ms`` down to ``keep_ms``.
+
+    Half of ``keep_ms`` is kept on each side of a pause so word edges are not
+    clipped, and leading/trailing quiet is cut to half of ``keep_ms``.  Frames
+    below ``threshold`` count as quiet; by default that is twice the level of
+    the quietest tenth of the clip, which is the room noise in the pre- and
+    post-speech padding the endpointer adds.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    frame_size = sample_rate * frame_ms // 1000
+    count = samples.size // frame_size
+    if count < 2:
+        return pcm
+    energies = frame_rms(samples[:count * frame_size].reshape(count, frame_size))
+    if threshold is None:
+        threshold = max(_MIN_SPEECH_ENERGY, int(np.percentile(energies, 10) * 2))
+    quiet = energies < threshold
+    if quiet.all() or not quiet.any():
+        return pcm
+
+    half = max(1, keep_ms // frame_ms // 2)
+    keep = np.ones(count, dtype=bool)
+    # Boundaries of quiet runs: +1 where a run starts, -1 after it ends.
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    for start, stop in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        # Keep ``half`` frames next to speech on whichever sides have speech.
+        cut_from = start + half if start > 0 else 0
+        cut_to = stop - half if stop < count else count
+        if cut_to > cut_from:
+            keep[cut_from:cut_to] = False
+
+    frames = samples[:count * frame_size].reshape(count, frame_size)[keep]
+    return frames.tobytes() + samples[count * frame_size:].tobytes()
+
+
+def encode_audio(pcm: bytes, sample_rate: int, codec: str = "wav") -> EncodedAudio:
+    """Encode 16-bit mono PCM as ``codec``; falls back to WAV without soundfile."""
+    codec = codec.lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown audio codec {codec!r}; expected one of {', '.join(CODECS)}")
+    if codec != "wav":
+        try:
+            import soundfile
+        except ImportError:
+            global _warned_missing
+            if not _warned_missing:
+                logging.warning("soundfile is not installed; uploading %s audio as WAV instead.", codec)
+                _warned_missing = True
+            codec = "wav"
+
+    if codec == "wav":
+        return EncodedAudio(pcm_to_wav(pcm, sample_rate), "speech.wav", "audio/wav")
+
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    buffer = io.BytesIO()
+    if codec == "flac":
+        soundfile.write(buffer, samples, sample_rate, format="FLAC", subtype="PCM_16")
+        return EncodedAudio(buffer.getvalue(), "speech.flac", "audio/flac")
+    soundfile.write(buffer, samples, sample_rate, format="OGG", subtype="OPUS")
+    return EncodedAudio(buffer.getvalue(), "speech.ogg", "audio/ogg")
+
+
+def prepare_upload(pcm: bytes, sample_rate: int, codec: str = "wav", trim: bool = False) -> EncodedAudio:
+    """Optionally trim pauses, then encode; the upload body for one utterance."""
+    if trim:
+        pcm = trim_pauses(pcm, sample_rate)
+    return encode_audio(pcm, sample_rate, codec)
+
+
+__all__ = ["CODECS", "EncodedAudio", "encode_audio", "prepare_upload", "trim_pauses"]
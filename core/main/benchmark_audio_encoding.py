@@ -0,0 +1,137 @@
+"""Compare upload size and transcription latency per audio codec.
+
+Encodes utterances as WAV, FLAC and Opus (each with and without pause
+trimming), prints the bytes sent and the encoding time, then uploads every
+variant through ``transcribe_audio`` to ``mock_openai_server`` with a
+throttled uplink and reports the time from end of speech to transcript:
+
+    python benchmark_audio_encoding.py recordings/ --bandwidth 32000
+
+Without paths, speech-like synthetic utterances over room noise (some with a
+mid-sentence pause) are used.  Sizes on synthetic audio are only indicative;
+run it on real recordings, and check transcripts against the real API, before
+switching the default codec.  FLAC and Opus need ``pip install soundfile``.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from audio_encoding import CODECS, prepare_upload
+from mock_openai_server import MockOpenAIServer
+
+SAMPLE_RATE = 16000
+
+
+def load_wavs(paths):
+    clips = []
+    for path in paths:
+        files = sorted(Path(path).glob("*.wav")) if Path(path).is_dir() else [Path(path)]
+        for file in files:
+            with wave.open(str(file), "rb") as wf:
+                if (wf.getsampwidth(), wf.getnchannels(), wf.getframerate()) != (2, 1, SAMPLE_RATE):
+                    print(f"Skipping {file}: not 16 kHz 16-bit mono")
+                    continue
+                clips.append(wf.readframes(wf.getnframes()))
+    return clips
+
+
+def synthetic_clips(seed=5):
+    """0.2 s of room noise, 1.5-8 s of voiced sound (optionally a 1 s pause), 0.4 s of noise."""
+    rng = np.random.default_rng(seed)
+    clips = []
+    for seconds, pause in ((1.5, False), (3.0, True), (5.0, False), (8.0, True)):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        f0 = rng.uniform(100, 220) * (1 + 0.06 * np.sin(2 * np.pi * 3 * t))
+        phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        speech = sum(np.sin(k * phase) / k for k in range(1, 12))
+        speech *= (0.35 + 0.65 * np.abs(np.sin(2 * np.pi * 3.5 * t))) * 5000
+        if pause:
+            middle = speech.size // 2
+            speech[middle:middle + SAMPLE_RATE] = 0
+        audio = np.concatenate([np.zeros(int(0.2 * SAMPLE_RATE)), speech, np.zeros(int(0.4 * SAMPLE_RATE))])
+        audio += rng.standard_normal(audio.size) * 60
+        clips.append(audio.clip(-32768, 32767).astype(np.int16).tobytes())
+    return clips
+
+
+def _available_codecs():
+    try:
+        import soundfile  # noqa: F401
+    except ImportError:
+        print("soundfile is not installed: only WAV can be measured")
+        return ["wav"]
+    return list(CODECS)
+
+
+async def _run(args, clips, variants):
+    import OpenAiClientAssistant
+
+    print(f"\nuplink {args.bandwidth:.0f} B/s, rtt {args.rtt * 1000:.0f} ms, transcription {args.transcription_time:.2f} s")
+    print(f"{'codec':>12} {'mean s':>8} {'p95 s':>8}")
+    for name, uploads in variants.items():
+        samples = []
+        for _ in range(args.repeats):
+            for upload in uploads:
+                start = time.perf_counter()
+                if not await OpenAiClientAssistant.transcribe_audio(*upload):
+                    raise RuntimeError("No transcript returned")
+                samples.append(time.perf_counter() - start)
+        samples.sort()
+        print(f"{name:>12} {statistics.mean(samples):>8.2f} {samples[int(0.95 * (len(samples) - 1))]:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="WAV files or directories of WAV files")
+    parser.add_argument("--bandwidth", type=float, default=32000, help="uplink in bytes/s")
+    parser.add_argument("--rtt", type=float, default=0.05)
+    parser.add_argument("--transcription-time", type=float, default=0.4)
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    clips = load_wavs(args.paths) if args.paths else synthetic_clips()
+    if not clips:
+        parser.error("no usable WAV files")
+    speech_seconds = sum(len(clip) for clip in clips) / 2 / SAMPLE_RATE
+    print(f"{len(clips)} clips, {speech_seconds:.1f} s of audio")
+
+    print(f"\n{'codec':>12} {'bytes':>10} {'vs wav':>7} {'encode ms/s':>12}")
+    variants = {}
+    wav_bytes = None
+    for codec in _available_codecs():
+        for trim in (False, True):
+            name = codec + ("+trim" if trim else "")
+            start = time.perf_counter()
+            uploads = [prepare_upload(clip, SAMPLE_RATE, codec, trim=trim) for clip in clips]
+            encode_ms = (time.perf_counter() - start) * 1000 / speech_seconds
+            total = sum(len(upload.data) for upload in uploads)
+            wav_bytes = wav_bytes or total
+            print(f"{name:>12} {total:>10} {total / wav_bytes:>7.0%} {encode_ms:>12.2f}")
+            variants[name] = uploads
+
+    server = MockOpenAIServer(
+        rtt=args.rtt,
+        transcription_time=args.transcription_time,
+        upload_bandwidth=args.bandwidth,
+    )
+    # Settings are read at import time, so point them at the mock first.
+    os.environ["OPENAI_BASE_URL"] = server.start()
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    os.environ.setdefault("MQTT_BROKER", "localhost")
+    os.environ.setdefault("MQTT_TOPIC", "benchmark")
+    os.environ["TRANSCRIPTION_MODEL"] = "gpt-4o-transcribe"
+    try:
+        asyncio.run(_run(args, clips, variants))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare per-frame ``audioop.rms`` with the NumPy ``frame_rms`` front end.
+
+Reads 16 kHz mono 16-bit WAV files (or every ``*.wav`` in a directory), cuts
+them into 30 ms frames and times both ways of computing frame energies:
+
+* audioop: copy each frame to ``bytes`` and call ``audioop.rms`` (the old path),
+* numpy:   ``frame_rms`` over zero-copy ``(n, 480)`` views, ``n`` frames per block.
+
+    python benchmark_audio_energy.py recordings/ --blocks 1 8 64
+
+Without paths a minute of synthetic speech-like audio is used.  The audioop
+column is skipped on Python 3.13+, where the module no longer exists.
+"""
+
+import argparse
+import statistics
+import time
+import warnings
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from audio_energy import frame_rms
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 480
+
+
+def load_corpus(paths):
+    chunks = []
+    for path in paths:
+        files = sorted(Path(path).glob("*.wav")) if Path(path).is_dir() else [Path(path)]
+        for file in files:
+            with wave.open(str(file), "rb") as wf:
+                if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+                    print(f"Skipping {file}: not 16-bit mono")
+                    continue
+                chunks.append(wf.readframes(wf.getnframes()))
+    return b"".join(chunks)
+
+
+def synthetic_corpus(seconds):
+    rng = np.random.default_rng(3)
+    frames = seconds * SAMPLE_RATE // FRAME_SIZE
+    # Alternate quiet room noise with louder bursts, roughly like a session.
+    amplitudes = np.where(rng.random(frames) < 0.4, 4000.0, 60.0)
+    samples = rng.standard_normal((frames, FRAME_SIZE)) * amplitudes[:, None]
+    return samples.clip(-32768, 32767).astype(np.int16).tobytes()
+
+
+def time_best(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return min(samples), statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="WAV files or directories of WAV files")
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--seconds", type=int, default=60, help="length of the synthetic corpus")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    pcm = load_corpus(args.paths) if args.paths else synthetic_corpus(args.seconds)
+    frame_bytes = FRAME_SIZE * 2
+    frame_count = len(pcm) // frame_bytes
+    if not frame_count:
+        raise SystemExit("No audio frames to measure.")
+    samples = np.frombuffer(pcm, dtype=np.int16, count=frame_count * FRAME_SIZE).reshape(frame_count, FRAME_SIZE)
+    print(f"{frame_count} frames ({frame_count * FRAME_SIZE / SAMPLE_RATE:.1f} s of audio)")
+    print(f"{'path':<16} {'block':>6} {'best us/frame':>14} {'median us/frame':>16}")
+
+    if audioop is not None:
+        def run_audioop():
+            return [audioop.rms(pcm[i * frame_bytes:(i + 1) * frame_bytes], 2) for i in range(frame_count)]
+
+        reference = np.array(run_audioop())
+        best, median = time_best(run_audioop, args.repeats)
+        print(f"{'audioop':<16} {1:>6} {best / frame_count * 1e6:>14.2f} {median / frame_count * 1e6:>16.2f}")
+    else:
+        reference = None
+        print("audioop not available on this interpreter; skipping the baseline")
+
+    for block in args.blocks:
+        def run_numpy():
+            return np.concatenate([frame_rms(samples[i:i + block]) for i in range(0, frame_count, block)])
+
+        if reference is not None and not np.array_equal(run_numpy(), reference):
+            raise SystemExit(f"frame_rms disagrees with audioop.rms at block size {block}")
+        best, median = time_best(run_numpy, args.repeats)
+        print(f"{'numpy frame_rms':<16} {block:>6} {best / frame_count * 1e6:>14.2f} {median / frame_count * 1e6:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare per-turn latency and request count of the assistant backends.
+
+Runs a short conversation against ``mock_openai_server`` (no network, no API
+spend) through each backend and prints mean/p50/p95 turn latency and the
+number of HTTP requests a turn needs:
+
+* ``assistants-poll``   - messages.create + runs.create + runs.retrieve loop + messages.list
+* ``assistants-stream`` - messages.create + streamed runs.create
+* ``responses``         - one streamed responses.create
+
+    python benchmark_backends.py --turns 5 --rtt 0.08 --generation-time 0.8
+
+Polling sleeps 3 s between status checks, so that mode dominates the runtime.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from mock_openai_server import MockOpenAIServer
+
+# The SDK flags every Assistants call as deprecated; keep the table readable.
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+MODES = ("assistants-poll", "assistants-stream", "responses")
+
+
+def _configure_env(base_url: str, state_dir: str) -> None:
+    # Settings are read at import time, so point them at the mock first.
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    os.environ.setdefault("MQTT_BROKER", "localhost")
+    os.environ.setdefault("MQTT_TOPIC", "benchmark")
+    os.environ["OPENAI_ASSISTANT_STATE_FILE"] = str(Path(state_dir) / "assistant_state.json")
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run_mode(mode, server, turns):
+    import OpenAiClientAssistant
+    import OpenAiClientResponses
+
+    if mode == "responses":
+        backend = OpenAiClientResponses
+    else:
+        backend = OpenAiClientAssistant
+        backend._run_mode = "poll" if mode == "assistants-poll" else "stream"
+        # Resolve the assistant id outside the timed turns.
+        await backend.get_assistant_id()
+
+    thread_id = await backend.create_new_thread()
+    server.reset_counters()
+
+    first_values = []
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        values_at = []
+        reply = await backend.GPT_response(
+            thread_id,
+            "Spin the windmills a little faster.",
+            on_values=lambda values: values_at.append(time.perf_counter() - start),
+        )
+        latencies.append(time.perf_counter() - start)
+        first_values.append(values_at[0] if values_at else latencies[-1])
+        if not reply.get("values"):
+            print(f"{mode}: unexpected reply {reply!r}", file=sys.stderr)
+        if mode == "assistants-stream":
+            await backend._wait_for_pending_run(thread_id)
+
+    return {
+        "mean": statistics.fmean(latencies),
+        "p50": _percentile(latencies, 0.5),
+        "p95": _percentile(latencies, 0.95),
+        "values": statistics.fmean(first_values),
+        "requests": server.total_requests() / turns,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5, help="conversation turns per backend")
+    parser.add_argument("--rtt", type=float, default=0.08, help="simulated seconds of network per request")
+    parser.add_argument("--generation-time", type=float, default=0.8, help="simulated seconds to write a reply")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(rtt=args.rtt, generation_time=args.generation_time)
+    with tempfile.TemporaryDirectory() as state_dir:
+        _configure_env(server.start(), state_dir)
+        try:
+            print(f"turns={args.turns} rtt={args.rtt}s generation={args.generation_time}s")
+            print(f"{'backend':>18} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'values s':>9} {'req/turn':>9}")
+            for mode in args.modes:
+                result = await _run_mode(mode, server, args.turns)
+                print(
+                    f"{mode:>18} {result['mean']:>8.3f} {result['p50']:>8.3f} {result['p95']:>8.3f} "
+                    f"{result['values']:>9.3f} {result['requests']:>9.1f}"
+                )
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""Measure offline transcription speed per Whisper model size.
+
+Loads each model with ``local_whisper`` (faster-whisper, int8 on the CPU),
+transcribes every 16 kHz mono 16-bit WAV file given (or every ``*.wav`` in a
+directory) from in-memory PCM, and prints the load time and the real-time
+factor (processing time / audio duration) per utterance:
+
+    python benchmark_local_stt.py recordings/ --models tiny.en base.en small.en
+
+Without paths, a few seconds of synthetic tone are used, which only measures
+speed.  Pick the largest model whose p95 real-time factor stays well below
+1.0 on the machine that runs the assistant.
+"""
+
+import argparse
+import os
+import statistics
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from local_whisper import SAMPLE_RATE, LocalWhisper
+
+
+def load_wavs(paths):
+    clips = []
+    for path in paths:
+        files = sorted(Path(path).glob("*.wav")) if Path(path).is_dir() else [Path(path)]
+        for file in files:
+            with wave.open(str(file), "rb") as wf:
+                if (wf.getsampwidth(), wf.getnchannels(), wf.getframerate()) != (2, 1, SAMPLE_RATE):
+                    print(f"Skipping {file}: not 16 kHz 16-bit mono")
+                    continue
+                clips.append((file.name, wf.readframes(wf.getnframes())))
+    return clips
+
+
+def synthetic_clips():
+    clips = []
+    for seconds in (1.5, 3.0, 6.0):
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        tone = np.sin(2 * np.pi * 180 * t) * np.abs(np.sin(2 * np.pi * 3 * t)) * 6000
+        clips.append((f"tone {seconds:.1f} s", tone.astype(np.int16).tobytes()))
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="WAV files or directories of WAV files")
+    parser.add_argument("--models", nargs="+", default=["tiny.en", "base.en"])
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads (0 = library default)")
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    clips = load_wavs(args.paths) if args.paths else synthetic_clips()
+    if not clips:
+        parser.error("no usable WAV files")
+    print(f"{len(clips)} clips, {os.cpu_count()} CPUs, compute type {args.compute_type}")
+
+    for name in args.models:
+        model = LocalWhisper(name, compute_type=args.compute_type, cpu_threads=args.threads)
+        start = time.perf_counter()
+        model.load()
+        print(f"\n{name}: loaded in {time.perf_counter() - start:.1f} s")
+        model.transcribe_pcm(clips[0][1])  # warm-up, not counted
+
+        rtfs = []
+        for label, pcm in clips:
+            results = [model.transcribe_pcm(pcm) for _ in range(args.repeats)]
+            best = min(results, key=lambda result: result.elapsed)
+            rtfs.extend(result.rtf for result in results)
+            print(f"  {label:<24} {best.audio_seconds:5.1f} s audio  {best.elapsed:5.2f} s  "
+                  f"RTF {best.rtf:.2f}  {best.text[:40]!r}")
+        rtfs.sort()
+        print(f"  RTF mean {statistics.mean(rtfs):.2f}, p95 {rtfs[int(0.95 * (len(rtfs) - 1))]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
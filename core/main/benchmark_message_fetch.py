@@ -0,0 +1,92 @@
+"""Show that fetching a run's reply costs the same however long the thread is.
+
+Seeds threads of increasing length on ``mock_openai_server``, finishes one
+more run on each and times three ways of getting its reply:
+
+* ``list``     - the old ``messages.list(thread_id=...)`` call (API default page)
+* ``run``      - ``_fetch_run_reply`` with the ``run_id`` filter
+* ``fallback`` - ``_fetch_run_reply`` against a server that ignores ``run_id``,
+  so it pages back from the newest message instead
+
+    python benchmark_message_fetch.py --turns 10 100 500 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+from mock_openai_server import MockOpenAIServer
+
+# The SDK flags every Assistants call as deprecated; keep the table readable.
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def _configure_env(base_url: str, state_dir: str) -> None:
+    # Settings are read at import time, so point them at the mock first.
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    os.environ.setdefault("MQTT_BROKER", "localhost")
+    os.environ.setdefault("MQTT_TOPIC", "benchmark")
+    os.environ["OPENAI_ASSISTANT_STATE_FILE"] = str(Path(state_dir) / "assistant_state.json")
+
+
+async def _timed(repeat, fetch):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        message = await fetch()
+        samples.append(time.perf_counter() - start)
+        assert message is not None, "reply not found"
+    return statistics.median(samples) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    parser.add_argument("--repeat", type=int, default=20, help="fetches per measurement (median is shown)")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(rtt=0.0, generation_time=0.0)
+    with tempfile.TemporaryDirectory() as state_dir:
+        _configure_env(server.start(), state_dir)
+        import OpenAiClientAssistant as backend
+
+        try:
+            print(f"{'turns':>6} {'list ms':>8} {'list KB':>8} {'run ms':>7} {'run KB':>7} "
+                  f"{'fallback ms':>12} {'fallback KB':>12}")
+            for turns in args.turns:
+                thread_id = await backend.create_new_thread()
+                server.seed_thread(thread_id, turns)
+                await backend.client.beta.threads.messages.create(
+                    thread_id=thread_id, role="user", content="one more"
+                )
+                run = await backend.client.beta.threads.runs.create(
+                    thread_id=thread_id, assistant_id="asst_mock"
+                )
+                await backend.check_run(thread_id, run.id)
+
+                row = []
+                for run_filter, fetch in (
+                    (True, lambda: backend.client.beta.threads.messages.list(thread_id=thread_id)),
+                    (True, lambda: backend._fetch_run_reply(thread_id, run.id)),
+                    (False, lambda: backend._fetch_run_reply(thread_id, run.id)),
+                ):
+                    server.run_filter = run_filter
+                    server.reset_counters()
+                    elapsed = await _timed(args.repeat, fetch)
+                    row.append((elapsed, server.bytes_sent / args.repeat / 1024))
+
+                (list_ms, list_kb), (run_ms, run_kb), (fb_ms, fb_kb) = row
+                print(f"{turns:>6} {list_ms:>8.2f} {list_kb:>8.1f} {run_ms:>7.2f} {run_kb:>7.1f} "
+                      f"{fb_ms:>12.2f} {fb_kb:>12.1f}")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
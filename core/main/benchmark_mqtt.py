@@ -0,0 +1,186 @@
+"""MQTT publish throughput and latency: paho's thread vs ``MQTTTransport``.
+
+Publishes windmill-sized payloads through the old ``loop_start`` client and
+through the asyncio transport, and measures them with a subscriber on the
+same broker:
+
+* burst: ``--messages`` handed to the client at once; messages/s is counted
+  until the last one has reached the subscriber, and "call p99" is how long
+  the ``publish`` call took (the asyncio transport makes callers wait when
+  ``max_pending`` messages are already in flight);
+* paced: ``--rate`` messages/s for ``--seconds``; p50/p99 of the time from
+  the ``publish`` call to the subscriber receiving the message.
+
+Without ``--broker`` an in-process ``mock_mqtt_broker`` is used; point it at
+the real broker (``--broker 192.168.1.10:1883``) to measure the network too.
+
+    python benchmark_mqtt.py --messages 5000 --rate 200
+"""
+
+import argparse
+import asyncio
+import json
+import struct
+import time
+
+import paho.mqtt.client as mqtt
+
+from mock_mqtt_broker import MockMQTTBroker
+from mqtt_transport import MQTTTransport
+
+TOPIC = "benchmark/windmills"
+VALUES = {"speed_para": 0.6, "dir_para": 1, "speed_old": 0.5, "dir_old": -1, "speed_reg": 0.7, "dir_reg": 1}
+
+
+def make_payload(seq):
+    # Sequence number and send time first, then a realistic values payload.
+    return struct.pack("!Id", seq, time.perf_counter()) + json.dumps(VALUES).encode("utf-8")
+
+
+class ThreadedPublisher:
+    """The previous MQTTClient: paho's network loop on a background thread."""
+
+    name = "paho thread"
+
+    def __init__(self, qos):
+        self.qos = qos
+        self.client = mqtt.Client(client_id="bench-thread", callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+
+    async def connect(self, host, port):
+        self.client.connect(host, port, keepalive=60)
+        self.client.loop_start()
+        while not self.client.is_connected():
+            await asyncio.sleep(0.01)
+
+    async def publish(self, payload):
+        self.client.publish(TOPIC, payload, qos=self.qos)
+        return True
+
+    async def disconnect(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class AsyncPublisher:
+    name = "asyncio"
+
+    def __init__(self, qos):
+        self.qos = qos
+        self.transport = MQTTTransport(client_id="bench-async")
+
+    async def connect(self, host, port):
+        await self.transport.connect(host, port)
+
+    async def publish(self, payload):
+        return await self.transport.publish(TOPIC, payload, qos=self.qos)
+
+    async def disconnect(self):
+        await self.transport.disconnect()
+
+
+class Receiver:
+    def __init__(self):
+        self.arrivals = {}
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    def reset(self, expected):
+        self.arrivals.clear()
+        self.expected = expected
+        self.done.clear()
+
+    def on_message(self, topic, payload):
+        seq, sent = struct.unpack_from("!Id", payload)
+        self.arrivals[seq] = time.perf_counter() - sent
+        if len(self.arrivals) >= self.expected:
+            self.done.set()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def burst(publisher, receiver, count):
+    receiver.reset(count)
+    call_times = []
+
+    async def publish(seq):
+        before = time.perf_counter()
+        await publisher.publish(make_payload(seq))
+        call_times.append(time.perf_counter() - before)
+
+    start = time.perf_counter()
+    # Every message is handed over at once, as concurrent turns would;
+    # the asyncio transport keeps at most max_pending of them in flight.
+    await asyncio.gather(*(publish(seq) for seq in range(count)))
+    await asyncio.wait_for(receiver.done.wait(), 60)
+    return count / (time.perf_counter() - start), percentile(call_times, 0.99)
+
+
+async def paced(publisher, receiver, rate, seconds):
+    count = int(rate * seconds)
+    receiver.reset(count)
+    start = time.perf_counter()
+    for seq in range(count):
+        await publisher.publish(make_payload(seq))
+        delay = start + (seq + 1) / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    try:
+        await asyncio.wait_for(receiver.done.wait(), 10)
+    except asyncio.TimeoutError:
+        pass
+    latencies = list(receiver.arrivals.values())
+    lost = count - len(latencies)
+    return percentile(latencies, 0.5), percentile(latencies, 0.99), lost
+
+
+async def run(args, host, port):
+    receiver = Receiver()
+    subscriber = MQTTTransport(client_id="bench-subscriber")
+    await subscriber.connect(host, port)
+    await subscriber.subscribe(TOPIC, receiver.on_message)
+
+    print(f"broker {host}:{port}, QoS {args.qos}, {len(make_payload(0))}-byte payloads")
+    print(f"{'client':>12} {'burst msg/s':>12} {'call p99 ms':>12} {'p50 ms':>8} {'p99 ms':>8} {'lost':>5}")
+    for publisher_class in (ThreadedPublisher, AsyncPublisher):
+        publisher = publisher_class(args.qos)
+        await publisher.connect(host, port)
+        throughput, call_p99 = await burst(publisher, receiver, args.messages)
+        # Let the burst drain before measuring latency at a steady rate.
+        await asyncio.sleep(0.5)
+        p50, p99, lost = await paced(publisher, receiver, args.rate, args.seconds)
+        await publisher.disconnect()
+        print(
+            f"{publisher.name:>12} {throughput:>12.0f} {call_p99 * 1000:>12.3f} "
+            f"{p50 * 1000:>8.2f} {p99 * 1000:>8.2f} {lost:>5}"
+        )
+    await subscriber.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker", help="host:port of a real broker (default: in-process mock)")
+    parser.add_argument("--messages", type=int, default=5000, help="messages in the burst")
+    parser.add_argument("--rate", type=float, default=200, help="messages/s in the paced run")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    args = parser.parse_args()
+
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        port = int(port or 1883)
+    else:
+        broker = MockMQTTBroker()
+        host, port = broker.start()
+    try:
+        asyncio.run(run(args, host, port))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Board-side decode cost of JSON vs binary payloads, per schema.
+
+For every schema, a representative ``values`` payload is built (``--items``
+entries for variable-length arrays such as ``sequence`` or ``steps``) and
+decoded ``--rounds`` times by what the board would run:
+
+* ``json``: ``json.loads`` of the text payload;
+* ``binary``: ``loads`` of the CircuitPython module ``payload_codec.py``
+  generates for the schema, on a ``bytearray`` as minimqtt delivers it.
+
+Sizes are bytes on the wire; RAM is the peak heap allocated while decoding
+one payload (``tracemalloc``).  The numbers come from CPython on the host,
+not from a board: compare the ratio between the columns rather than the
+absolute values.
+
+    python benchmark_payload_codec.py
+    python benchmark_payload_codec.py ../../examples/circuitpython/buzzer/schema.json --items 64
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from payload_codec import PayloadCodec, values_schema
+
+HERE = Path(__file__).resolve().parent
+
+
+def default_schemas():
+    schemas = [HERE / "assistant_response_schema.json"]
+    schemas.extend(sorted((HERE.parent.parent / "examples" / "circuitpython").glob("*/schema.json")))
+    return [path for path in schemas if path.exists()]
+
+
+def sample(schema, items):
+    """A plausible value for ``schema``, with ``items`` entries per open-ended array."""
+    kind = schema.get("type")
+    if kind == "number":
+        return 0.75
+    if kind == "integer":
+        return max(0, schema.get("exclusiveMinimum", -1) + 1) + 1
+    if kind == "boolean":
+        return True
+    if kind == "string":
+        return "sample"
+    if kind == "array":
+        count = schema.get("maxItems") if schema.get("minItems") == schema.get("maxItems") else items
+        return [sample(schema.get("items", {}), items) for _ in range(count)]
+    return {key: sample(value, items) for key, value in schema.get("properties", {}).items()}
+
+
+def board_module(codec):
+    namespace = {}
+    exec(compile(codec.board_source(), "payload_codec.py", "exec"), namespace)
+    return namespace
+
+
+def per_call_us(function, payload, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(payload)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def peak_bytes(function, payload):
+    tracemalloc.start()
+    try:
+        function(payload)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("schemas", nargs="*", type=Path, help="schema files (default: every schema in the repo)")
+    parser.add_argument("--items", type=int, default=16, help="entries in variable-length arrays")
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'schema':<30} {'bytes':>11} {'decode us':>15} {'peak RAM B':>13}")
+    print(f"{'':<30} {'json':>5} {'bin':>5} {'json':>7} {'bin':>7} {'json':>6} {'bin':>6}")
+    for path in args.schemas or default_schemas():
+        schema = json.loads(path.read_text(encoding="utf-8"))
+        codec = PayloadCodec(schema)
+        values = sample(values_schema(schema), args.items)
+        text = json.dumps(values, separators=(",", ":"))
+        binary = bytearray(codec.encode(values))
+        loads = board_module(codec)["loads"]
+
+        name = path.parent.name if path.name == "schema.json" else path.name
+        print(
+            f"{name:<30} {len(text):>5} {len(binary):>5} "
+            f"{per_call_us(json.loads, text, args.rounds):>7.2f} {per_call_us(loads, binary, args.rounds):>7.2f} "
+            f"{peak_bytes(json.loads, text):>6} {peak_bytes(loads, binary):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measure SemanticCache lookup latency as the index grows.
+
+Fills one namespace with synthetic windmill/LED prompts and times lookups of
+paraphrases (filler words and punctuation added) at each size.  The hit rate
+counts paraphrases that were answered from the cache.  The false-hit rate
+counts near-misses that must not be: the same prompt with one number, colour
+or direction swapped ("speed 3" -> "speed 8", "faster" -> "slower"):
+
+    python benchmark_semantic_cache.py --sizes 1000 10000 100000 --lookups 500
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from semantic_cache import SemanticCache
+
+VERBS = ["spin", "turn", "set", "make", "rotate", "switch", "reverse", "stop", "slow", "speed up"]
+TARGETS = ["the top one", "the old windmill", "all windmills", "the light", "the led", "the regular one", "everything"]
+MODIFIERS = [
+    "red", "blue", "green", "faster", "slower", "clockwise", "backwards", "to half speed", "off", "on",
+    "to speed 3", "to 40 percent",
+]
+EXTRAS = ["", "a bit", "a lot", "slowly", "right away", "for a while", "again", "gently"]
+FILLER = ["please ", "could you ", "hey, ", "ok ", ""]
+# Each word and the one a near-miss swaps it for.
+SWAPS = {
+    "red": "blue", "blue": "green", "green": "red", "faster": "slower", "slower": "faster",
+    "clockwise": "anticlockwise", "backwards": "forwards", "half": "full", "off": "on", "on": "off",
+    "up": "down", "3": "8", "40": "50",
+}
+
+
+def synthetic_prompts(count, rng):
+    """``(prompt, modifier)`` pairs; the modifier stands for the reply's values."""
+    combos = list(itertools.product(VERBS, TARGETS, MODIFIERS, EXTRAS))
+    rng.shuffle(combos)
+    prompts = []
+    for n in range(count):
+        verb, target, modifier, extra = combos[n % len(combos)]
+        suffix = f" #{n // len(combos)}" if n >= len(combos) else ""
+        prompt = f"{verb} {target} {modifier} {extra}".strip() + suffix
+        prompts.append((prompt, modifier))
+    return prompts
+
+
+def near_miss(prompt, modifier):
+    """``(prompt, modifier)`` with one word of the modifier swapped, or None."""
+    words = modifier.split()
+    for i, word in enumerate(words):
+        if word in SWAPS:
+            swapped = " ".join(words[:i] + [SWAPS[word]] + words[i + 1:])
+            # The modifier always follows the target, which never ends in a modifier word.
+            head, _, tail = prompt.rpartition(f" {modifier}")
+            return f"{head} {swapped}{tail}", swapped
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"dim={args.dim} threshold={args.threshold} lookups={args.lookups}")
+    print(f"{'entries':>8} {'insert us':>10} {'p50 ms':>8} {'p95 ms':>8} {'hit rate':>9} {'false hits':>11} {'matrix MB':>10}")
+    for size in args.sizes:
+        cache = SemanticCache(threshold=args.threshold, max_entries=size, dim=args.dim)
+        prompts = synthetic_prompts(size, rng)
+
+        start = time.perf_counter()
+        for prompt, modifier in prompts:
+            cache.add("bench", prompt, None, {"values": {"modifier": modifier}, "response": "ok"})
+        insert_us = (time.perf_counter() - start) / size * 1e6
+
+        samples = []
+        hits = false_hits = near_misses = 0
+        for prompt, modifier in rng.sample(prompts, min(args.lookups, size)):
+            paraphrase = f"{rng.choice(FILLER)}{prompt}{rng.choice(['', '!', '?', ' now'])}"
+            start = time.perf_counter()
+            hits += cache.lookup("bench", paraphrase) is not None
+            samples.append((time.perf_counter() - start) * 1000)
+            variant = near_miss(prompt, modifier)
+            if variant is not None:
+                # A hit is false when it was made for another modifier; the
+                # variant itself may well be a stored prompt.
+                near_misses += 1
+                hit = cache.lookup("bench", variant[0])
+                false_hits += hit is not None and hit.reply["values"]["modifier"] != variant[1]
+
+        samples.sort()
+        table = cache._namespaces["bench"]
+        print(
+            f"{size:>8} {insert_us:>10.1f} {statistics.median(samples):>8.3f} "
+            f"{samples[int(0.95 * (len(samples) - 1))]:>8.3f} {hits / len(samples):>9.0%} "
+            f"{false_hits / max(1, near_misses):>11.1%} "
+            f"{table.vectors.nbytes / 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measure how long a transcript takes after the speaker stops.
+
+Plays synthetic utterances into both transcription backends in real time
+(one 30 ms frame at a time, like the microphone) against
+``mock_openai_server`` and times the gap between the end of speech and the
+transcript arriving:
+
+* ``buffered`` - the whole WAV is uploaded after the utterance ends,
+* ``stream``   - audio is uploaded in chunks while it is "spoken".
+
+    python benchmark_transcription.py --seconds 1 3 6 --bandwidth 32000
+
+``--bandwidth`` is the uplink in bytes/s (32000 is about 256 kbit/s, a busy
+venue Wi-Fi); 16 kHz mono PCM needs 32000 bytes per second of speech.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from mock_openai_server import MockOpenAIServer
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+
+def _configure_env(base_url: str, streaming: bool) -> None:
+    # Settings are read at import time, so point them at the mock first.
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock-key"
+    os.environ.setdefault("MQTT_BROKER", "localhost")
+    os.environ.setdefault("MQTT_TOPIC", "benchmark")
+    os.environ["TRANSCRIPTION_STREAMING"] = "true" if streaming else "false"
+
+
+async def _utterance(start_transcription, seconds):
+    """Feed ``seconds`` of audio in real time; return end-of-speech -> transcript."""
+    transcription = start_transcription(SAMPLE_RATE)
+    frame = b"\x10\x00" * (FRAME_BYTES // 2)
+    for _ in range(int(seconds * 1000 / FRAME_MS)):
+        transcription.feed(frame)
+        await asyncio.sleep(FRAME_MS / 1000)
+    start = time.perf_counter()
+    transcript = await transcription.finish()
+    if not transcript:
+        raise RuntimeError("No transcript returned")
+    return time.perf_counter() - start
+
+
+async def _run(args):
+    import OpenAiClientAssistant
+    from OpenAiClientAssistant import settings
+
+    print(f"uplink {args.bandwidth} B/s, rtt {args.rtt * 1000:.0f} ms, transcription {args.transcription_time:.2f} s")
+    print(f"{'speech s':>8} {'mode':>9} {'mean s':>8} {'best s':>8}")
+    for seconds in args.seconds:
+        for mode in ("buffered", "stream"):
+            settings["transcription_streaming"] = mode == "stream"
+            samples = [await _utterance(OpenAiClientAssistant.start_transcription, seconds) for _ in range(args.repeats)]
+            print(f"{seconds:>8.1f} {mode:>9} {statistics.mean(samples):>8.2f} {min(samples):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[1.0, 3.0, 6.0])
+    parser.add_argument("--bandwidth", type=float, default=32000)
+    parser.add_argument("--rtt", type=float, default=0.05)
+    parser.add_argument("--transcription-time", type=float, default=0.4)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        rtt=args.rtt,
+        transcription_time=args.transcription_time,
+        upload_bandwidth=args.bandwidth,
+    )
+    _configure_env(server.start(), streaming=False)
+    try:
+        asyncio.run(_run(args))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Adaptive start/end-of-speech decisions for the voice loop.
+
+The one-shot recorder measured the room once at startup, gated speech at
+twice that level and always waited 0.9 s of silence before sending.  In a
+space where the crowd gets louder and quieter all day that either triggers on
+background chatter or leaves long tails after every request.  ``Endpointer``
+instead:
+
+* tracks the ambient level continuously with an exponential moving average of
+  frame energy over non-speech frames (a running mean during the first
+  ``warmup_frames``, so no separate calibration pass is needed),
+* re-bases that level when no frame has dropped below the speech gate for
+  ``stuck_frames`` (speech always has gaps; a room that stays loud is noise),
+* shortens the silence tail from ``max_tail_frames`` towards
+  ``min_tail_frames`` as confidence in the utterance grows, i.e. when speech
+  is well above the ambient level and VAD marked most frames voiced.
+
+It only decides; the caller owns the audio.  ``push`` is called once per
+frame and returns ``START`` (keep the last ``pre_frames`` frames, which
+include this one), ``SPEECH`` (keep this frame), ``END`` (keep this frame if
+it was voiced plus the last ``post_frames`` frames, and send the utterance),
+``DISCARD`` (drop the utterance) or ``None``.  ``stats()`` reports the
+decisions made so far.
+"""
+
+from __future__ import annotations
+
+import collections
+import math
+from typing import Any, Dict, Optional
+
+START = "start"
+SPEECH = "speech"
+END = "end"
+DISCARD = "discard"
+
+# SNR (dB of speech energy over the noise floor) mapped onto 0..1 confidence.
+_SNR_LOW_DB = 6.0
+_SNR_HIGH_DB = 18.0
+
+
+class Endpointer:
+    """Frame-by-frame speech segmentation with an adaptive noise floor."""
+
+    def __init__(
+        self,
+        *,
+        frame_ms: int,
+        energy_threshold: int,
+        pre_speech_frames: int,
+        post_speech_frames: int,
+        min_tail_frames: int,
+        max_tail_frames: int,
+        max_frames: int,
+        min_voice_frames: int,
+        floor_time_constant: float = 2.0,
+        warmup_frames: Optional[int] = None,
+        stuck_frames: Optional[int] = None,
+        adaptive: bool = True,
+    ) -> None:
+        self.frame_ms = frame_ms
+        self.energy_threshold = energy_threshold
+        self.pre_speech_frames = pre_speech_frames
+        self.post_speech_frames = post_speech_frames
+        self.min_tail_frames = min(min_tail_frames, max_tail_frames)
+        self.max_tail_frames = max_tail_frames
+        self.max_frames = max_frames
+        self.min_voice_frames = min_voice_frames
+        self.adaptive = adaptive
+        self.alpha = min(1.0, frame_ms / (floor_time_constant * 1000))
+        self.warmup_frames = warmup_frames if warmup_frames is not None else max(1, 1000 // frame_ms)
+        self.stuck_frames = stuck_frames if stuck_frames is not None else max(1, 2000 // frame_ms)
+
+        self.noise_floor = float(energy_threshold // 2)
+        # Decision outputs for the caller, valid right after ``push`` returns.
+        self.pre_frames = 0
+        self.post_frames = 0
+
+        self._ambient_frames = 0
+        self._loud_run = 0
+        self._loud_min = 0
+        self._recent_energies: collections.deque = collections.deque(maxlen=pre_speech_frames)
+        self._counters = collections.Counter()
+        self._tail_total = 0
+        self.last_segment: Dict[str, Any] = {}
+        self.reset()
+
+    @property
+    def threshold(self) -> int:
+        """Energy a frame needs before VAD is asked about it."""
+        return max(self.energy_threshold, int(self.noise_floor * 2))
+
+    def reset(self) -> None:
+        """Abandon any utterance in progress; the noise floor is kept."""
+        self._recent_energies.clear()
+        self._frames_seen = 0
+        self._triggered = False
+        self._segment_frames = 0
+        self._speech_frames = 0
+        self._speech_energy = 0
+        self._voiced_count = 0
+        self._energy_sum = 0
+        self._silence_frames = 0
+
+    # ------------------------------------------------------------------
+    # Noise floor
+    # ------------------------------------------------------------------
+
+    def observe(self, energy: int) -> None:
+        """Feed a frame that is not being segmented (e.g. in text mode)."""
+        self._counters["frames"] += 1
+        self._track_floor(energy, energy >= self.threshold)
+
+    def _track_floor(self, energy: int, loud: bool) -> None:
+        if self._ambient_frames < self.warmup_frames:
+            # Startup calibration: plain running mean over the first second.
+            self._ambient_frames += 1
+            self._update_floor(energy, max(self.alpha, 1.0 / self._ambient_frames))
+            return
+        if not self.adaptive:
+            return
+
+        if not loud:
+            self._loud_run = 0
+            self._update_floor(energy, self.alpha)
+            return
+        self._loud_min = min(self._loud_min, energy) if self._loud_run else energy
+        self._loud_run += 1
+        if self._loud_run >= self.stuck_frames:
+            # Nothing quiet for stuck_frames: the room itself got louder.
+            self._update_floor(self._loud_min, 1.0)
+            self._loud_run = 0
+            self._counters["floor_rebases"] += 1
+
+    def _update_floor(self, energy: float, alpha: float) -> None:
+        floor = self.noise_floor + alpha * (energy - self.noise_floor)
+        self.noise_floor = max(floor, float(self.energy_threshold // 2))
+
+    # ------------------------------------------------------------------
+    # Segmentation
+    # ------------------------------------------------------------------
+
+    def confidence(self) -> float:
+        """0..1 confidence in the utterance so far (SNR times voiced ratio)."""
+        if not self._speech_frames or not self._segment_frames:
+            return 0.0
+        speech_level = self._speech_energy / self._speech_frames
+        snr_db = 20 * math.log10(max(speech_level, 1.0) / max(self.noise_floor, 1.0))
+        snr_score = min(1.0, max(0.0, (snr_db - _SNR_LOW_DB) / (_SNR_HIGH_DB - _SNR_LOW_DB)))
+        return snr_score * (self._speech_frames / self._segment_frames)
+
+    def tail_limit(self) -> int:
+        """Silent frames after which the current utterance ends."""
+        if not self.adaptive:
+            return self.max_tail_frames
+        span = self.max_tail_frames - self.min_tail_frames
+        return self.max_tail_frames - int(round(span * self.confidence()))
+
+    def push(self, energy: int, is_voiced: bool) -> Optional[str]:
+        """Advance one frame; ``is_voiced`` is the energy gate and VAD combined."""
+        self._counters["frames"] += 1
+
+        if not self._triggered:
+            self._recent_energies.append(energy)
+            self._frames_seen += 1
+            if not is_voiced:
+                self._track_floor(energy, energy >= self.threshold)
+                return None
+            self._triggered = True
+            self._counters["triggers"] += 1
+            self.pre_frames = min(self.pre_speech_frames, self._frames_seen)
+            self._voiced_count = len(self._recent_energies)
+            self._energy_sum = sum(self._recent_energies)
+            self._recent_energies.clear()
+            self._segment_frames = self._speech_frames = 1
+            self._speech_energy = energy
+            self._silence_frames = 0
+            return START
+
+        self._segment_frames += 1
+        if is_voiced:
+            self._voiced_count += 1
+            self._energy_sum += energy
+            self._speech_frames += 1
+            self._speech_energy += energy
+            self._silence_frames = 0
+            if self._voiced_count > self.max_frames:
+                return self._finish("max_length")
+            return SPEECH
+
+        self._track_floor(energy, energy >= self.threshold)
+        self._silence_frames += 1
+        if self._silence_frames > self.tail_limit():
+            return self._finish("silence")
+        if self._voiced_count > self.max_frames:
+            return self._finish("max_length")
+        return None
+
+    def _finish(self, cause: str) -> str:
+        self.post_frames = min(self._silence_frames, self.post_speech_frames)
+        frames = self._voiced_count + self.post_frames
+        threshold = self.threshold
+        confidence = self.confidence()
+
+        if frames < self.min_voice_frames or not self._voiced_count:
+            verdict = "too_short"
+        elif self._energy_sum / self._voiced_count < threshold * 1.1:
+            verdict = "too_quiet"
+        else:
+            verdict = "accepted"
+
+        self._counters[verdict] += 1
+        self._tail_total += self._silence_frames
+        self.last_segment = {
+            "cause": cause,
+            "verdict": verdict,
+            "frames": frames,
+            "tail_ms": self._silence_frames * self.frame_ms,
+            "confidence": round(confidence, 2),
+            "threshold": threshold,
+        }
+        self.reset()
+        return END if verdict == "accepted" else DISCARD
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._counters["accepted"] + self._counters["too_short"] + self._counters["too_quiet"]
+        return {
+            "frames": self._counters["frames"],
+            "noise_floor": int(self.noise_floor),
+            "threshold": self.threshold,
+            "triggers": self._counters["triggers"],
+            "accepted": self._counters["accepted"],
+            "too_short": self._counters["too_short"],
+            "too_quiet": self._counters["too_quiet"],
+            "floor_rebases": self._counters["floor_rebases"],
+            "mean_tail_ms": self._tail_total * self.frame_ms / segments if segments else 0.0,
+            "last_segment": dict(self.last_segment),
+        }
+
+
+__all__ = ["DISCARD", "END", "Endpointer", "SPEECH", "START"]
@@ -0,0 +1,174 @@
+"""Minimal MQTT 3.1.1 broker for benchmarks and local experiments.
+
+Implements what the windmill runtime and the boards use: CONNECT, PUBLISH at
+QoS 0/1/2 (acknowledged as the protocol requires), SUBSCRIBE/UNSUBSCRIBE with
+``+`` and ``#`` wildcards, PINGREQ and DISCONNECT.  Messages are forwarded to
+matching subscribers at QoS 0; there are no retained messages, sessions or
+authentication.  It runs its own event loop on a background thread, so it can
+sit next to an asyncio client in the same process:
+
+    broker = MockMQTTBroker()
+    host, port = broker.start()
+    ...
+    broker.stop()
+
+``drop_clients()`` closes every connection, to exercise reconnect logic, and
+``packet_counts`` counts packets by type.
+"""
+
+import asyncio
+import collections
+import struct
+import threading
+from typing import Optional
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+_PACKET_NAMES = {
+    CONNECT: "connect", PUBLISH: "publish", PUBREL: "pubrel", SUBSCRIBE: "subscribe",
+    UNSUBSCRIBE: "unsubscribe", PINGREQ: "pingreq", DISCONNECT: "disconnect",
+}
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or (part != "+" and part != topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+class MockMQTTBroker:
+    """Threaded asyncio MQTT broker listening on localhost."""
+
+    def __init__(self, *, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.packet_counts: collections.Counter = collections.Counter()
+        self._subscriptions: dict[asyncio.StreamWriter, set[str]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> tuple[str, int]:
+        """Start listening; returns the (host, port) to connect to."""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.host, self.port
+
+    def stop(self) -> None:
+        async def shutdown() -> None:
+            self._server.close()
+            self._close_all()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def drop_clients(self) -> None:
+        """Close every client connection (the broker keeps listening)."""
+        self._loop.call_soon_threadsafe(self._close_all)
+
+    def _close_all(self) -> None:
+        for writer in list(self._subscriptions):
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subscriptions[writer] = set()
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                packet_type, flags = header[0] >> 4, header[0] & 0x0F
+                self.packet_counts[_PACKET_NAMES.get(packet_type, str(packet_type))] += 1
+                if packet_type == DISCONNECT:
+                    break
+                self._dispatch(writer, packet_type, flags, body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._subscriptions.pop(writer, None)
+            writer.close()
+
+    def _dispatch(self, writer: asyncio.StreamWriter, packet_type: int, flags: int, body: bytes) -> None:
+        if packet_type == CONNECT:
+            writer.write(_packet(CONNACK, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            (topic_length,) = struct.unpack_from("!H", body)
+            topic = body[2:2 + topic_length].decode("utf-8")
+            offset = 2 + topic_length
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                writer.write(_packet(PUBACK if qos == 1 else PUBREC, packet_id))
+            self._forward(topic, body[offset:])
+        elif packet_type == PUBREL:
+            writer.write(_packet(PUBCOMP, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            granted = bytearray()
+            offset = 2
+            while offset < len(body):
+                (topic_length,) = struct.unpack_from("!H", body, offset)
+                topic_filter = body[offset + 2:offset + 2 + topic_length].decode("utf-8")
+                offset += 2 + topic_length + 1
+                self._subscriptions[writer].add(topic_filter)
+                granted.append(0)
+            writer.write(_packet(SUBACK, body[:2] + bytes(granted)))
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                (topic_length,) = struct.unpack_from("!H", body, offset)
+                self._subscriptions[writer].discard(body[offset + 2:offset + 2 + topic_length].decode("utf-8"))
+                offset += 2 + topic_length
+            writer.write(_packet(UNSUBACK, body[:2]))
+        elif packet_type == PINGREQ:
+            writer.write(_packet(PINGRESP, b""))
+
+    def _forward(self, topic: str, payload: bytes) -> None:
+        encoded_topic = topic.encode("utf-8")
+        message = _packet(PUBLISH, struct.pack("!H", len(encoded_topic)) + encoded_topic + payload)
+        for subscriber, filters in self._subscriptions.items():
+            if any(topic_matches(topic_filter, topic) for topic_filter in filters):
+                subscriber.write(message)
+
+
+__all__ = ["MockMQTTBroker", "topic_matches"]
@@ -0,0 +1,401 @@
+"""Local stand-in for the OpenAI endpoints used by the windmill runtime.
+
+Used by the benchmark scripts in this directory so backends can be compared
+without network access or API spend.  It implements just enough of the
+Assistants (assistants, threads, messages, runs, including streamed runs) and
+Responses APIs for ``OpenAiClientAssistant`` and ``OpenAiClientResponses``,
+plus ``/audio/transcriptions`` (plain or chunked uploads) for ``transcription``.
+
+Latency is simulated with a few knobs: ``rtt`` is added to every request (the
+network round trip), ``generation_time`` is how long the "model" takes to
+write a reply, ``transcription_time`` how long transcribing takes once the
+upload is complete and ``upload_bandwidth`` (bytes/s, 0 for unlimited) how
+fast request bodies are read.  Every request is counted so scripts can report
+calls per turn.
+"""
+
+import collections
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_REPLY = {
+    "values": {
+        "speed_para": 0.6,
+        "dir_para": 1,
+        "speed_old": 0.5,
+        "dir_old": -1,
+        "speed_reg": 0.7,
+        "dir_reg": 1,
+    },
+    "response": "All three windmills are turning now. Want them faster?",
+}
+
+
+class MockOpenAIServer:
+    """Threaded HTTP server that mimics the OpenAI REST API."""
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rtt: float = 0.05,
+        generation_time: float = 0.8,
+        reply: Optional[dict[str, Any]] = None,
+        chunk_size: int = 8,
+        run_filter: bool = True,
+        transcription_time: float = 0.4,
+        upload_bandwidth: float = 0.0,
+        transcript: str = "make the windmills spin faster",
+    ) -> None:
+        self.rtt = rtt
+        self.generation_time = generation_time
+        self.transcription_time = transcription_time
+        self.upload_bandwidth = upload_bandwidth
+        self.transcript = transcript
+        self.reply_text = json.dumps(reply or DEFAULT_REPLY)
+        self.chunk_size = chunk_size
+        # Set to False to emulate an API that ignores messages.list(run_id=...).
+        self.run_filter = run_filter
+        self.request_counts: collections.Counter = collections.Counter()
+        self.bytes_sent = 0
+        self.threads: dict[str, list[dict[str, Any]]] = {}
+        self.runs: dict[str, dict[str, Any]] = {}
+        # One entry per transcription request: bytes received and whether chunked.
+        self.uploads: list[dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.request_counts.clear()
+            self.bytes_sent = 0
+            self.uploads.clear()
+
+    def total_requests(self) -> int:
+        return sum(self.request_counts.values())
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids)}"
+
+    def seed_thread(self, thread_id: str, turns: int) -> None:
+        """Fill a thread with ``turns`` user/assistant exchanges."""
+        messages = self.threads.setdefault(thread_id, [])
+        for _ in range(turns):
+            run_id = self.new_id("run")
+            messages.append(self._message(thread_id, "user", "make them spin", None))
+            messages.append(self._message(thread_id, "assistant", self.reply_text, run_id))
+
+    def _message(self, thread_id: str, role: str, text: str, run_id: Optional[str]) -> dict:
+        return {
+            "id": self.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "run_id": run_id,
+            "assistant_id": "asst_mock" if role == "assistant" else None,
+            "status": "completed",
+            "attachments": [],
+            "metadata": {},
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        }
+
+
+def _make_handler(server: MockOpenAIServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; don't let Nagle delay the body.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002 - keep stdout quiet
+            return
+
+        # -- plumbing ---------------------------------------------------
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            raw = self.rfile.read(length)
+            try:
+                return json.loads(raw)
+            except json.JSONDecodeError:
+                return {}
+
+        def _send_json(self, payload: Any, status: int = 200) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            with server._lock:
+                server.bytes_sent += len(data)
+
+        def _start_sse(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _sse(self, event: Optional[str], data: Any) -> None:
+            lines = f"event: {event}\n" if event else ""
+            lines += f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+            chunk = lines.encode("utf-8")
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            with server._lock:
+                server.bytes_sent += len(chunk)
+
+        def _end_sse(self) -> None:
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _count(self, name: str) -> None:
+            with server._lock:
+                server.request_counts[name] += 1
+            time.sleep(server.rtt)
+
+        def _chunks(self) -> list[str]:
+            text = server.reply_text
+            return [text[i:i + server.chunk_size] for i in range(0, len(text), server.chunk_size)]
+
+        # -- routing ----------------------------------------------------
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")[1:]
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            if len(parts) == 3 and parts[0] == "threads" and parts[2] == "messages":
+                self._count("messages.list")
+                return self._list_messages(parts[1], query)
+            if len(parts) == 4 and parts[0] == "threads" and parts[2] == "runs":
+                self._count("runs.retrieve")
+                return self._send_json(self._run_state(parts[3]))
+            self._send_json({"error": {"message": f"unknown route {url.path}"}}, 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")[1:]
+            if parts == ["audio", "transcriptions"]:
+                self._count("audio.transcriptions")
+                return self._transcribe()
+            body = self._body()
+
+            if parts == ["assistants"]:
+                self._count("assistants.create")
+                return self._send_json({"id": "asst_mock", "object": "assistant", "created_at": 0,
+                                        "model": body.get("model"), "tools": [], "name": body.get("name")})
+            if len(parts) == 2 and parts[0] == "assistants":
+                self._count("assistants.update")
+                return self._send_json({"id": parts[1], "object": "assistant", "created_at": 0,
+                                        "model": body.get("model"), "tools": [], "name": body.get("name")})
+            if parts == ["threads"]:
+                self._count("threads.create")
+                thread_id = server.new_id("thread")
+                server.threads[thread_id] = []
+                return self._send_json({"id": thread_id, "object": "thread", "created_at": int(time.time()),
+                                        "metadata": {}})
+            if len(parts) == 3 and parts[0] == "threads" and parts[2] == "messages":
+                self._count("messages.create")
+                content = body.get("content")
+                text = content if isinstance(content, str) else json.dumps(content)
+                message = server._message(parts[1], "user", text, None)
+                server.threads.setdefault(parts[1], []).append(message)
+                return self._send_json(message)
+            if len(parts) == 3 and parts[0] == "threads" and parts[2] == "runs":
+                self._count("runs.create")
+                return self._create_run(parts[1], bool(body.get("stream")))
+            if len(parts) == 5 and parts[0] == "threads" and parts[4] == "cancel":
+                self._count("runs.cancel")
+                run = server.runs.get(parts[3], {})
+                run["cancelled"] = True
+                return self._send_json(self._run_state(parts[3]))
+            if parts == ["responses"]:
+                self._count("responses.create")
+                return self._create_response(body)
+            self._send_json({"error": {"message": f"unknown route {url.path}"}}, 404)
+
+        def do_DELETE(self):
+            parts = urlparse(self.path).path.strip("/").split("/")[1:]
+            if len(parts) == 2 and parts[0] == "threads":
+                self._count("threads.delete")
+                server.threads.pop(parts[1], None)
+                return self._send_json({"id": parts[1], "object": "thread.deleted", "deleted": True})
+            self._send_json({"error": {"message": f"unknown route {self.path}"}}, 404)
+
+        # -- assistants -------------------------------------------------
+
+        def _run_object(self, run_id: str, status: str) -> dict:
+            run = server.runs[run_id]
+            return {"id": run_id, "object": "thread.run", "created_at": int(run["created"]),
+                    "thread_id": run["thread_id"], "assistant_id": "asst_mock", "status": status,
+                    "model": "mock", "instructions": "", "tools": [], "metadata": {}, "parallel_tool_calls": True}
+
+        def _run_state(self, run_id: str) -> dict:
+            run = server.runs.get(run_id)
+            if run is None:
+                return {"id": run_id, "object": "thread.run", "status": "expired"}
+            if run.get("cancelled"):
+                return self._run_object(run_id, "cancelled")
+            if time.monotonic() - run["created"] >= server.generation_time:
+                self._finish_run(run_id)
+                return self._run_object(run_id, "completed")
+            return self._run_object(run_id, "in_progress")
+
+        def _finish_run(self, run_id: str) -> dict:
+            run = server.runs[run_id]
+            if run.get("message") is None:
+                message = server._message(run["thread_id"], "assistant", server.reply_text, run_id)
+                server.threads.setdefault(run["thread_id"], []).append(message)
+                run["message"] = message
+            return run["message"]
+
+        def _create_run(self, thread_id: str, stream: bool) -> None:
+            run_id = server.new_id("run")
+            server.runs[run_id] = {"thread_id": thread_id, "created": time.monotonic(), "message": None}
+            if not stream:
+                return self._send_json(self._run_object(run_id, "queued"))
+
+            self._start_sse()
+            self._sse("thread.run.created", self._run_object(run_id, "queued"))
+            chunks = self._chunks()
+            pause = server.generation_time / max(len(chunks), 1)
+            for chunk in chunks:
+                time.sleep(pause)
+                if server.runs[run_id].get("cancelled"):
+                    self._sse("thread.run.cancelled", self._run_object(run_id, "cancelled"))
+                    self._sse(None, "[DONE]")
+                    return self._end_sse()
+                self._sse("thread.message.delta", {
+                    "id": "msg_delta", "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": chunk}}]},
+                })
+            server.runs[run_id]["created"] -= server.generation_time
+            self._sse("thread.message.completed", self._finish_run(run_id))
+            self._sse("thread.run.completed", self._run_object(run_id, "completed"))
+            self._sse(None, "[DONE]")
+            self._end_sse()
+
+        def _list_messages(self, thread_id: str, query: dict) -> None:
+            messages = list(server.threads.get(thread_id, []))
+            if query.get("order", "desc") == "desc":
+                messages.reverse()
+            if query.get("run_id") and server.run_filter:
+                messages = [m for m in messages if m["run_id"] == query["run_id"]]
+            if query.get("after"):
+                ids = [m["id"] for m in messages]
+                if query["after"] in ids:
+                    messages = messages[ids.index(query["after"]) + 1:]
+            limit = int(query.get("limit", 20))
+            page = messages[:limit]
+            self._send_json({
+                "object": "list",
+                "data": page,
+                "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None,
+                "has_more": len(messages) > limit,
+            })
+
+        # -- responses --------------------------------------------------
+
+        def _response_object(self, response_id: str, status: str, text: str) -> dict:
+            output = []
+            if text:
+                output.append({"id": "msg_out", "type": "message", "role": "assistant", "status": "completed",
+                               "content": [{"type": "output_text", "text": text, "annotations": []}]})
+            return {"id": response_id, "object": "response", "created_at": int(time.time()), "status": status,
+                    "model": "mock", "output": output, "parallel_tool_calls": True, "tool_choice": "auto",
+                    "tools": []}
+
+        def _create_response(self, body: dict) -> None:
+            response_id = server.new_id("resp")
+            if not body.get("stream"):
+                time.sleep(server.generation_time)
+                return self._send_json(self._response_object(response_id, "completed", server.reply_text))
+
+            self._start_sse()
+            self._sse("response.created", {"type": "response.created", "sequence_number": 0,
+                                           "response": self._response_object(response_id, "in_progress", "")})
+            chunks = self._chunks()
+            pause = server.generation_time / max(len(chunks), 1)
+            for index, chunk in enumerate(chunks, start=1):
+                time.sleep(pause)
+                self._sse("response.output_text.delta", {
+                    "type": "response.output_text.delta", "sequence_number": index, "item_id": "msg_out",
+                    "output_index": 0, "content_index": 0, "delta": chunk, "logprobs": [],
+                })
+            self._sse("response.completed", {
+                "type": "response.completed", "sequence_number": len(chunks) + 1,
+                "response": self._response_object(response_id, "completed", server.reply_text),
+            })
+            self._end_sse()
+
+        # -- audio ------------------------------------------------------
+
+        def _read_throttled(self, size: int) -> bytes:
+            data = self.rfile.read(size)
+            if server.upload_bandwidth:
+                time.sleep(len(data) / server.upload_bandwidth)
+            return data
+
+        def _read_upload(self) -> tuple[bytes, bool]:
+            if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                remaining = int(self.headers.get("Content-Length") or 0)
+                parts = []
+                while remaining:
+                    parts.append(self._read_throttled(min(remaining, 4096)))
+                    remaining -= len(parts[-1])
+                return b"".join(parts), False
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return b"".join(parts), True
+                parts.append(self._read_throttled(size))
+                self.rfile.readline()
+
+        def _transcribe(self) -> None:
+            data, chunked = self._read_upload()
+            with server._lock:
+                server.uploads.append({"bytes": len(data), "chunked": chunked, "completed_at": time.perf_counter()})
+            # WAV, FLAC or Ogg (Opus) container magic.
+            if b'name="file"' not in data or not any(magic in data for magic in (b"RIFF", b"fLaC", b"OggS")):
+                return self._send_json({"error": {"message": "missing audio file"}}, 400)
+            time.sleep(server.transcription_time)
+            text = server.transcript.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(text)))
+            self.end_headers()
+            self.wfile.write(text)
+
+    return Handler
+
+
+__all__ = ["MockOpenAIServer", "DEFAULT_REPLY"]
@@ -0,0 +1,190 @@
+"""Replay recorded audio through the fixed and the adaptive endpointer.
+
+Runs 16 kHz mono 16-bit WAV files (or every ``*.wav`` in a directory) through
+the same energy gate + webrtcvad + ``Endpointer`` path the voice loop uses,
+once with the old behaviour (noise floor measured during the first second,
+fixed 0.9 s silence tail) and once adaptive, and prints what each decided:
+
+    python replay_endpointing.py sessions/
+
+Without paths a synthetic gallery session is generated: speech-like requests
+over room noise that rises from quiet to a loud crowd of background voices and
+back.  Because the true speech spans are known there, it also reports false
+triggers, missed requests and end-of-speech latency (time from the end of
+speech to the utterance being sent).  For recordings, latency is measured from
+the last voiced frame instead.
+"""
+
+import argparse
+import statistics
+import wave
+from pathlib import Path
+
+import numpy as np
+import webrtcvad
+
+from audio_energy import frame_rms
+from endpointer import DISCARD, END, START, Endpointer
+
+SAMPLE_RATE = 16000
+FRAME_DURATION_MS = 30
+FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
+SILENCE_FRAMES_LIMIT = int(0.9 / (FRAME_DURATION_MS / 1000))
+MIN_SILENCE_FRAMES = int(0.45 / (FRAME_DURATION_MS / 1000))
+MAX_FRAMES = int(10 / (FRAME_DURATION_MS / 1000))
+PRE_SPEECH_FRAMES = int(0.18 / (FRAME_DURATION_MS / 1000))
+ENERGY_THRESHOLD = 300
+MIN_VOICE_FRAMES = int(0.35 / (FRAME_DURATION_MS / 1000))
+POST_SPEECH_FRAMES = int(0.4 / (FRAME_DURATION_MS / 1000))
+
+
+def build_endpointer(adaptive):
+    return Endpointer(
+        frame_ms=FRAME_DURATION_MS,
+        energy_threshold=ENERGY_THRESHOLD,
+        pre_speech_frames=PRE_SPEECH_FRAMES,
+        post_speech_frames=POST_SPEECH_FRAMES,
+        min_tail_frames=MIN_SILENCE_FRAMES,
+        max_tail_frames=SILENCE_FRAMES_LIMIT,
+        max_frames=MAX_FRAMES,
+        min_voice_frames=MIN_VOICE_FRAMES,
+        adaptive=adaptive,
+    )
+
+
+def load_wavs(paths):
+    chunks = []
+    for path in paths:
+        files = sorted(Path(path).glob("*.wav")) if Path(path).is_dir() else [Path(path)]
+        for file in files:
+            with wave.open(str(file), "rb") as wf:
+                if (wf.getsampwidth(), wf.getnchannels(), wf.getframerate()) != (2, 1, SAMPLE_RATE):
+                    print(f"Skipping {file}: not 16 kHz 16-bit mono")
+                    continue
+                chunks.append(np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+
+
+def _voice(rng, samples, f0, amplitude):
+    """Harmonic signal with pitch and syllable-rate loudness movement."""
+    t = np.arange(samples) / SAMPLE_RATE
+    pitch = f0 * (1 + 0.06 * np.sin(2 * np.pi * rng.uniform(2, 4) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    wave_ = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = 0.35 + 0.65 * np.abs(np.sin(2 * np.pi * rng.uniform(2.5, 4.5) * t))
+    return wave_ * syllables * amplitude
+
+
+def synthetic_session(seconds, seed):
+    """Requests over changing room noise; returns (samples, true speech spans)."""
+    rng = np.random.default_rng(seed)
+    total = seconds * SAMPLE_RATE
+    audio = np.zeros(total)
+
+    # Ambient level per quarter: quiet room, murmur, loud crowd, quieter again.
+    levels = [120, 700, 1500, 300]
+    edges = np.linspace(0, total, len(levels) + 1).astype(int)
+    for level, start, stop in zip(levels, edges, edges[1:]):
+        length = stop - start
+        audio[start:stop] += rng.standard_normal(length) * level * 0.5
+        for _ in range(5):
+            # Background talkers: voiced, so VAD alone cannot reject them.
+            audio[start:stop] += _voice(rng, length, rng.uniform(90, 260), level * 0.35)
+
+    spans = []
+    position = int(2.0 * SAMPLE_RATE)
+    while True:
+        length = int(rng.uniform(1.0, 3.0) * SAMPLE_RATE)
+        if position + length >= total - 2 * SAMPLE_RATE:
+            break
+        speech = _voice(rng, length, rng.uniform(100, 220), rng.uniform(4500, 7000))
+        if rng.random() < 0.5:
+            # A short hesitation mid-request must not end the utterance.
+            pause = int(0.25 * SAMPLE_RATE)
+            middle = length // 2
+            speech[middle:middle + pause] = 0
+        audio[position:position + length] += speech
+        spans.append((position // FRAME_SIZE, (position + length) // FRAME_SIZE))
+        position += length + int(rng.uniform(4.0, 8.0) * SAMPLE_RATE)
+
+    return audio.clip(-32768, 32767).astype(np.int16), spans
+
+
+def replay(samples, endpointer):
+    """Segment ``samples``; returns (start, decided, last_voiced, accepted) tuples."""
+    vad = webrtcvad.Vad(3)
+    frame_count = samples.size // FRAME_SIZE
+    frames = samples[:frame_count * FRAME_SIZE].reshape(frame_count, FRAME_SIZE)
+    energies = frame_rms(frames).tolist()
+
+    # Learn the room first, as the CLI does before voice mode is enabled.
+    for energy in energies[:endpointer.warmup_frames]:
+        endpointer.observe(energy)
+
+    segments = []
+    start = last_voiced = 0
+    for index in range(endpointer.warmup_frames, frame_count):
+        energy = energies[index]
+        is_voiced = energy >= endpointer.threshold and vad.is_speech(frames[index].tobytes(), SAMPLE_RATE)
+        if is_voiced:
+            last_voiced = index
+        action = endpointer.push(energy, is_voiced)
+        if action is START:
+            start = index - endpointer.pre_frames + 1
+        elif action is END or action is DISCARD:
+            segments.append((start, index, last_voiced, action is END))
+    return segments
+
+
+def summarize(name, segments, endpointer, spans):
+    accepted = [segment for segment in segments if segment[3]]
+    sent_seconds = sum(decided - start + 1 for start, decided, _, _ in accepted) * FRAME_DURATION_MS / 1000
+    stats = endpointer.stats()
+    print(f"\n{name}")
+    print(f"  triggers {stats['triggers']}, sent {len(accepted)}, discarded {len(segments) - len(accepted)}, "
+          f"audio sent {sent_seconds:.1f} s, final noise floor {stats['noise_floor']}")
+
+    if spans is None:
+        tails = [(decided - last_voiced) * FRAME_DURATION_MS for _, decided, last_voiced, _ in accepted]
+        if tails:
+            print(f"  end latency after last voiced frame: mean {statistics.mean(tails):.0f} ms, "
+                  f"p95 {sorted(tails)[int(0.95 * (len(tails) - 1))]:.0f} ms")
+        return
+
+    latencies = []
+    false_triggers = 0
+    found = set()
+    for start, decided, _, _ in accepted:
+        overlapping = [i for i, (s, e) in enumerate(spans) if start <= e and decided >= s]
+        if not overlapping:
+            false_triggers += 1
+            continue
+        found.update(overlapping)
+        latencies.append((decided - spans[overlapping[-1]][1]) * FRAME_DURATION_MS)
+    print(f"  requests {len(spans)}, detected {len(found)}, missed {len(spans) - len(found)}, "
+          f"false triggers {false_triggers}")
+    if latencies:
+        print(f"  end-of-speech latency: mean {statistics.mean(latencies):.0f} ms, "
+              f"median {statistics.median(latencies):.0f} ms, p95 {sorted(latencies)[int(0.95 * (len(latencies) - 1))]:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="WAV files or directories of WAV files")
+    parser.add_argument("--seconds", type=int, default=240, help="length of the synthetic session")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    if args.paths:
+        samples, spans = load_wavs(args.paths), None
+    else:
+        samples, spans = synthetic_session(args.seconds, args.seed)
+    print(f"{samples.size / SAMPLE_RATE:.0f} s of audio")
+
+    for name, adaptive in (("fixed (one-shot calibration, 0.9 s tail)", False), ("adaptive", True)):
+        endpointer = build_endpointer(adaptive)
+        summarize(name, replay(samples, endpointer), endpointer, spans)
+
+
+if __name__ == "__main__":
+    main()
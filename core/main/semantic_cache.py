@@ -0,0 +1,271 @@
+"""Local nearest-neighbour cache for paraphrased prompts.
+
+Complements ``response_cache``: where that one needs the exact same words,
+``SemanticCache`` also answers "could you spin the windmills faster please"
+from a stored "spin the windmills faster".  Prompts are turned into hashed n-gram vectors (word unigrams
+and bigrams plus character 3-5-grams, folded into ``dim`` buckets with a
+stable CRC so vectors are identical across runs) and compared with a NumPy
+cosine search.  Everything runs on the CPU; no service or model is needed.
+The vectors capture shared wording, not meaning: "speed 3" and "speed 4"
+score about 0.96, "faster" and "slower" about 0.9.  So a match must also
+carry exactly the same numbers, colour words and direction words as the
+stored prompt (``slot_words``), whatever its score.
+
+Entries live in per-assistant namespaces (see ``namespace_for``) so replies
+for one schema profile are never offered to another, and a match must also
+come from the same device state.  Each namespace keeps at most
+``max_entries`` prompts and evicts the least recently used one when full.
+
+Requires NumPy.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from response_cache import normalize_prompt
+
+# Words that change how polite a request is, not what it asks for.
+_FILLER_WORDS = frozenset(
+    "please pls can could would will you u the a an now just kindly hey hi ok okay".split()
+)
+# Words that pick a device value: a prompt differing in one of these needs
+# another reply, however similar the rest of it is.
+_COLOUR_WORDS = frozenset(
+    "red green blue white black yellow orange purple pink cyan magenta violet "
+    "turquoise teal amber gold warm cold cool".split()
+)
+_DIRECTION_WORDS = frozenset(
+    "faster slower fast slow quicker quick up down left right clockwise counterclockwise "
+    "anticlockwise backwards backward forwards forward reverse on off stop start "
+    "brighter dimmer bright dim higher lower high low more less increase decrease "
+    "half full max maximum min minimum double".split()
+)
+_NUMBER_WORDS = frozenset(
+    "zero one two three four five six seven eight nine ten eleven twelve twenty "
+    "thirty forty fifty hundred percent".split()
+)
+_WORD_WEIGHT = 2.0
+_BIGRAM_WEIGHT = 1.0
+_CHAR_WEIGHT = 0.5
+
+
+class SemanticHit(NamedTuple):
+    reply: Dict[str, Any]
+    score: float
+    prompt: str
+
+
+class HashedNgramEncoder:
+    """Map text to an L2-normalised, fixed-size vector of hashed n-grams."""
+
+    def __init__(self, dim: int = 256, char_ngrams: tuple = (3, 4, 5)) -> None:
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    def features(self, text: str) -> List[tuple]:
+        words = [w for w in normalize_prompt(text).split() if w not in _FILLER_WORDS]
+        features = [(f"w:{w}", _WORD_WEIGHT) for w in words]
+        features += [(f"b:{a} {b}", _BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            for n in self.char_ngrams:
+                features += [(f"c:{padded[i:i + n]}", _CHAR_WEIGHT) for i in range(len(padded) - n + 1)]
+        return features
+
+    def encode(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            # Low bits pick the bucket, the top bit the sign, so collisions cancel.
+            vector[digest % self.dim] += -weight if digest & 0x80000000 else weight
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector
+
+
+def slot_words(text: str) -> tuple:
+    """The numbers, colour and direction words of ``text``, in order."""
+    return tuple(
+        word
+        for word in normalize_prompt(text).split()
+        if word.isdigit() or word in _NUMBER_WORDS or word in _COLOUR_WORDS or word in _DIRECTION_WORDS
+    )
+
+
+def namespace_for(schema: Dict[str, Any], fingerprint: str) -> str:
+    """Namespace for one assistant profile: schema name plus config hash."""
+    return f"{schema.get('name', 'default')}:{fingerprint}"
+
+
+def _digest(value: Any) -> int:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def _state_id(device_state: Optional[Dict[str, Any]]) -> int:
+    return _digest(device_state or {})
+
+
+def _slot_id(prompt: str) -> int:
+    return _digest(slot_words(prompt))
+
+
+class _Namespace:
+    """Fixed-capacity vector table for one assistant profile."""
+
+    def __init__(self, capacity: int, dim: int) -> None:
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.state_ids = np.zeros(capacity, dtype=np.int64)
+        self.slot_ids = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.prompts: List[str] = [""] * capacity
+        self.states: List[Dict[str, Any]] = [{}] * capacity
+        self.replies: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.size = 0
+
+    def best(self, vector: np.ndarray, state_id: int, slot_id: int) -> tuple:
+        if not self.size:
+            return -1, 0.0
+        scores = self.vectors[:self.size] @ vector
+        scores[self.state_ids[:self.size] != state_id] = -1.0
+        scores[self.slot_ids[:self.size] != slot_id] = -1.0
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def slot_for_insert(self) -> tuple:
+        """Return a free slot, or the least recently used one and True."""
+        if self.size < len(self.replies):
+            self.size += 1
+            return self.size - 1, False
+        return int(np.argmin(self.last_used)), True
+
+
+class SemanticCache:
+    """Cosine-similarity lookup of past prompt -> reply pairs."""
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.9,
+        max_entries: int = 5000,
+        dim: int = 256,
+        path: Optional[str] = None,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.encoder = HashedNgramEncoder(dim)
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._load()
+
+    def lookup(
+        self,
+        namespace: str,
+        prompt: str,
+        device_state: Optional[Dict[str, Any]] = None,
+    ) -> Optional[SemanticHit]:
+        """Return the closest stored reply with the same slot words if it clears ``threshold``."""
+        table = self._namespaces.get(namespace)
+        index, score = (-1, 0.0)
+        if table is not None:
+            index, score = table.best(self.encoder.encode(prompt), _state_id(device_state), _slot_id(prompt))
+        if index < 0 or score < self.threshold:
+            self.misses += 1
+            return None
+        table.last_used[index] = time.time()
+        self.hits += 1
+        return SemanticHit(dict(table.replies[index]), score, table.prompts[index])
+
+    def add(
+        self,
+        namespace: str,
+        prompt: str,
+        device_state: Optional[Dict[str, Any]],
+        reply: Dict[str, Any],
+    ) -> bool:
+        """Store ``reply`` if it carries values; returns whether it was stored."""
+        values = reply.get("values")
+        if not isinstance(values, dict) or not values:
+            return False
+
+        self._insert(namespace, prompt, device_state, reply, time.time())
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(table.size for table in self._namespaces.values()),
+            "namespaces": len(self._namespaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        self._namespaces.clear()
+
+    def save(self) -> None:
+        """Write prompts and replies to ``path``; vectors are rebuilt on load."""
+        if not self.path:
+            return
+        data = {
+            name: [
+                [table.prompts[i], table.states[i], table.replies[i], table.last_used[i]]
+                for i in range(table.size)
+            ]
+            for name, table in self._namespaces.items()
+        }
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logging.error("Unable to persist semantic cache to %s: %s", self.path, exc)
+
+    def _load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as exc:
+            logging.error("Ignoring unreadable semantic cache %s: %s", self.path, exc)
+            return
+        for name, entries in data.items():
+            # Oldest first, so the newest survive if max_entries shrank.
+            for prompt, state, reply, last_used in sorted(entries, key=lambda e: e[3]):
+                self._insert(name, prompt, state, reply, last_used)
+        self.evictions = 0
+
+    def _insert(self, namespace, prompt, device_state, reply, last_used) -> None:
+        # Callers add after a lookup miss, so there is no near-duplicate to replace.
+        table = self._namespaces.get(namespace)
+        if table is None:
+            table = self._namespaces[namespace] = _Namespace(self.max_entries, self.encoder.dim)
+
+        index, evicted = table.slot_for_insert()
+        self.evictions += evicted
+        table.vectors[index] = self.encoder.encode(prompt)
+        table.state_ids[index] = _state_id(device_state)
+        table.slot_ids[index] = _slot_id(prompt)
+        table.last_used[index] = last_used
+        table.prompts[index] = prompt
+        table.states[index] = dict(device_state or {})
+        table.replies[index] = reply
+
+__all__ = ["HashedNgramEncoder", "SemanticCache", "SemanticHit", "namespace_for", "slot_words"]
@@ -30,6 +30,11 @@ def _resolve_path(value: str) -> str:
     return str(path)
 
 
+def _optional_path(name: str) -> str:
+    value = os.getenv(name, "")
+    return _resolve_path(value) if value else ""
+
+
 def _require(name: str) -> str:
     value = os.getenv(name)
     if not value:
@@ -41,6 +46,23 @@ def _optional(name: str, default: str = "") -> str:
     return os.getenv(name, default)
 
 
+def _optional_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _optional_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Invalid number for {name}: {value}") from exc
+
+
 def _optional_int(name: str, default: int) -> int:
     value = os.getenv(name)
     if value is None:
@@ -58,13 +80,40 @@ settings = {
     "mqtt_password": _optional("MQTT_PASSWORD"),
     "client_id": _optional("MQTT_CLIENT_ID", "windmill-assistant"),
     "mqtt_port": _optional_int("MQTT_PORT", 1883),
+    # Payloads held per topic while the broker is unreachable; with coalescing
+    # a topic keeps only its newest state.
+    "mqtt_queue_depth": _optional_int("MQTT_QUEUE_DEPTH", 16),
+    "mqtt_coalesce": _optional_bool("MQTT_COALESCE", True),
+    # Send only the keys that changed, with a full state every N messages or
+    # S seconds so a board that missed one resynchronises.
+    "mqtt_delta": _optional_bool("MQTT_DELTA", False),
+    "mqtt_keyframe_every": _optional_int("MQTT_KEYFRAME_EVERY", 20),
+    "mqtt_keyframe_seconds": _optional_float("MQTT_KEYFRAME_SECONDS", 60.0),
+    # "binary" sends fixed-layout payloads derived from the response schema;
+    # the board needs the matching generated payload_codec.py.
+    "mqtt_payload_format": _optional("MQTT_PAYLOAD_FORMAT", "json").strip().lower(),
+    # The board acks each payload on <topic>/ack; unacked state is resent.
+    "mqtt_acks": _optional_bool("MQTT_ACKS", False),
+    "mqtt_ack_timeout": _optional_float("MQTT_ACK_TIMEOUT", 2.0),
+    "mqtt_ack_retries": _optional_int("MQTT_ACK_RETRIES", 3),
     "openAIToken": _require("OPENAI_API_KEY"),
+    "openai_max_connections": _optional_int("OPENAI_MAX_CONNECTIONS", 20),
+    "openai_max_keepalive": _optional_int("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10),
+    "openai_http2": _optional_bool("OPENAI_HTTP2", True),
     "transcription_model": _optional("TRANSCRIPTION_MODEL", "gpt-4o-transcribe"),
+    "transcription_streaming": _optional_bool("TRANSCRIPTION_STREAMING", False),
+    "transcription_base_url": _optional("TRANSCRIPTION_BASE_URL").strip(),
+    "transcription_codec": _optional("TRANSCRIPTION_CODEC", "wav").strip().lower(),
+    "transcription_trim_silence": _optional_bool("TRANSCRIPTION_TRIM_SILENCE", False),
     "Welcom_msg": _optional(
         "WELCOME_MESSAGE",
         "Hello! Ask a question to adjust the windmills.",
     ),
     "assistant_model": _optional("OPENAI_ASSISTANT_MODEL", "gpt-4o-mini"),
+    "backend": _optional("OPENAI_BACKEND", "assistants").strip().lower(),
+    "run_mode": _optional("OPENAI_RUN_MODE", "stream"),
+    "thread_pool_size": _optional_int("THREAD_POOL_SIZE", 2),
+    "thread_pool_max_age": _optional_float("THREAD_POOL_MAX_AGE", 3600.0),
     "assistant_name": _optional("OPENAI_ASSISTANT_NAME", "Windmill Assistant"),
     "assistant_description": _optional(
         "OPENAI_ASSISTANT_DESCRIPTION", "Controls windmill presets via MQTT."
@@ -78,4 +127,16 @@ settings = {
     "assistant_state_file": _resolve_path(
         _optional("OPENAI_ASSISTANT_STATE_FILE", "assistant_state.json")
     ),
+    "intent_rules": _optional_bool("INTENT_RULES", True),
+    "intent_rules_file": _resolve_path(
+        _optional("ASSISTANT_RULES_FILE", "assistant_rules.json")
+    ),
+    "response_cache": _optional_bool("RESPONSE_CACHE", False),
+    "response_cache_size": _optional_int("RESPONSE_CACHE_SIZE", 256),
+    "response_cache_ttl": _optional_int("RESPONSE_CACHE_TTL", 3600),
+    "response_cache_file": _optional_path("RESPONSE_CACHE_FILE"),
+    "semantic_cache": _optional_bool("SEMANTIC_CACHE", False),
+    "semantic_cache_threshold": _optional_float("SEMANTIC_CACHE_THRESHOLD", 0.9),
+    "semantic_cache_size": _optional_int("SEMANTIC_CACHE_SIZE", 5000),
+    "semantic_cache_file": _optional_path("SEMANTIC_CACHE_FILE"),
 }
@@ -1,18 +1,47 @@
 import asyncio
 import hashlib
+import importlib.util
+import io
 import json
 import logging
 from pathlib import Path
 from typing import Any, Optional
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
+from audio_encoding import EncodedAudio, prepare_upload
+from local_whisper import get_model, is_local_model
 from settings import settings
+from streaming_payload import StreamingPayloadParser
+from thread_pool import ThreadPool
+from transcription import (
+    BufferedTranscription,
+    LocalTranscription,
+    TranscriptionStream,
+    UploadTranscription,
+)
+
+
+def _build_http_client() -> DefaultAsyncHttpxClient:
+    """Create the keep-alive connection pool shared by every API call."""
+    http2 = settings["openai_http2"] and importlib.util.find_spec("h2") is not None
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings["openai_max_connections"],
+            max_keepalive_connections=settings["openai_max_keepalive"],
+        ),
+    )
 
-# Initialize the OpenAI client
-client = OpenAI(
+
+_http_client = _build_http_client()
+
+# Initialize the OpenAI client (one per process, reused across turns)
+client = AsyncOpenAI(
     api_key=settings["openAIToken"],
     default_headers={"OpenAI-Beta": "assistants=v1"},
+    http_client=_http_client,
 )
 
 _state_path = Path(settings["assistant_state_file"])
@@ -21,10 +50,41 @@ _schema_path = Path(settings["assistant_schema_file"])
 _assistant_model = settings["assistant_model"]
 _assistant_name = settings["assistant_name"].strip() or None
 _assistant_description = settings["assistant_description"].strip() or None
+_run_mode = settings["run_mode"].strip().lower()
 
 _assistant_id: Optional[str] = None
 _assistant_lock = asyncio.Lock()
-_cached_signature: Optional[tuple[str, str, str]] = None
+_cached_signature: Optional[tuple[str, ...]] = None
+_config_watch_interval = settings["config_watch_interval"]
+# mtime/size of the config files when they were last read.
+_loaded_stamp: Optional[tuple] = None
+# Held while a changed config is read, so a concurrent check waits for its sync.
+_reload_lock = asyncio.Lock()
+_sync_task: Optional[asyncio.Task] = None
+_watch_task: Optional[asyncio.Task] = None
+# Streamed runs that returned their reply but are still draining run events.
+_pending_runs: dict[str, asyncio.Future] = {}
+# Run of the turn in progress per thread: {"id": ..., "creating": ...}; the
+# id is only known once the create request (or the first event) returns.
+_active_runs: dict[str, dict[str, Any]] = {}
+# What superseded runs had cost before they were cancelled.
+_cancelled_runs = {"runs": 0, "prompt_tokens": 0, "completion_tokens": 0, "finished_anyway": 0}
+
+# Messages requested per page when fetching a run's reply.
+_REPLY_PAGE_SIZE = 5
+
+# Audio collected before a streamed transcription upload is opened, so blips
+# the endpointer discards never reach the server.
+_STREAM_START_SECONDS = 0.35
+
+_RUN_TERMINAL_STATUSES = {"completed", "cancelled", "failed", "expired", "incomplete"}
+
+_RUN_FAILURE_EVENTS = {
+    "thread.run.failed",
+    "thread.run.cancelled",
+    "thread.run.expired",
+    "thread.run.incomplete",
+}
 
 
 def _load_text_file(path: Path) -> Optional[str]:
@@ -98,38 +158,59 @@ def _persist_assistant_state(state: dict[str, Any]) -> None:
         logging.error("Unable to persist assistant ID to %s: %s", _state_path, exc)
 
 
-async def get_assistant_id() -> Optional[str]:
-    global _assistant_id
+def _config_stamp() -> tuple:
+    """Modification time and size of the instructions and schema files."""
+    stamp = []
+    for path in (_instructions_path, _schema_path):
+        try:
+            stat = path.stat()
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
 
-    instructions = await asyncio.to_thread(_load_text_file, _instructions_path)
+def _load_config() -> Optional[dict[str, Any]]:
+    """Read and hash the instructions and schema (runs off the event loop)."""
+    instructions = _load_text_file(_instructions_path)
     if not instructions:
         logging.error("Assistant instructions are required to create or update.")
         return None
 
-    schema = await asyncio.to_thread(_load_json_file, _schema_path)
+    schema = _load_json_file(_schema_path)
     if not schema:
         logging.error("Assistant JSON schema is required to create or update.")
         return None
 
     instructions_hash = _hash_text(instructions)
     schema_hash = _hash_json(schema)
-    name_signature = (_assistant_name or "").strip()
-    description_signature = (_assistant_description or "").strip()
-    signature = (
-        instructions_hash,
-        schema_hash,
-        _assistant_model,
-        name_signature,
-        description_signature,
-    )
+    return {
+        "instructions": instructions,
+        "schema": schema,
+        "instructions_hash": instructions_hash,
+        "schema_hash": schema_hash,
+        "signature": (
+            instructions_hash,
+            schema_hash,
+            _assistant_model,
+            (_assistant_name or "").strip(),
+            (_assistant_description or "").strip(),
+        ),
+    }
+
+
+async def _sync_assistant(config: dict[str, Any]) -> Optional[str]:
+    """Make the remote assistant match ``config``, creating it if needed."""
+    global _assistant_id, _cached_signature
+
+    instructions = config["instructions"]
+    signature = config["signature"]
 
     async with _assistant_lock:
-        global _cached_signature
-
         if _assistant_id and _cached_signature == signature:
             return _assistant_id
 
-        cached_state = _read_assistant_state()
+        cached_state = await asyncio.to_thread(_read_assistant_state)
         cached_id = cached_state.get("assistant_id") if cached_state else None
         stored_signature = None
         if cached_state:
@@ -140,19 +221,18 @@ async def get_assistant_id() -> Optional[str]:
                 (cached_state.get("name") or "").strip(),
                 (cached_state.get("description") or "").strip(),
             )
-        else:
-            _assistant_id = None
-            _cached_signature = None
 
         def _persist_from_assistant(assistant_obj) -> None:
+            global _cached_signature
+
             assistant_name = (getattr(assistant_obj, "name", None) or "").strip()
             assistant_description = (
                 getattr(assistant_obj, "description", None) or ""
             ).strip()
             state = {
                 "assistant_id": assistant_obj.id,
-                "instructions_hash": instructions_hash,
-                "schema_hash": schema_hash,
+                "instructions_hash": config["instructions_hash"],
+                "schema_hash": config["schema_hash"],
                 "model": _assistant_model,
             }
             if assistant_name:
@@ -162,7 +242,7 @@ async def get_assistant_id() -> Optional[str]:
             _persist_assistant_state(state)
             _cached_signature = signature
 
-        response_format = {"type": "json_schema", "json_schema": schema}
+        response_format = {"type": "json_schema", "json_schema": config["schema"]}
 
         if cached_id and stored_signature == signature:
             _assistant_id = cached_id
@@ -183,8 +263,7 @@ async def get_assistant_id() -> Optional[str]:
                 update_request["description"] = _assistant_description
 
             try:
-                assistant = await asyncio.to_thread(
-                    client.beta.assistants.update,
+                assistant = await client.beta.assistants.update(
                     target_id,
                     **update_request,
                 )
@@ -210,12 +289,11 @@ async def get_assistant_id() -> Optional[str]:
             create_request["description"] = _assistant_description
 
         try:
-            assistant = await asyncio.to_thread(
-                client.beta.assistants.create, **create_request
-            )
+            assistant = await client.beta.assistants.create(**create_request)
         except Exception as exc:
+            # Keep serving the previous assistant, if there is one.
             logging.error("Failed to create assistant: %s", exc)
-            return None
+            return _assistant_id
 
         _assistant_id = assistant.id
         _persist_from_assistant(assistant)
@@ -223,30 +301,108 @@ async def get_assistant_id() -> Optional[str]:
         return _assistant_id
 
 
-async def create_new_thread():
-    """Create a new OpenAI thread."""
+async def _reload_config() -> None:
+    """Re-read the config files if they changed and sync the assistant."""
+    global _loaded_stamp, _sync_task
+
+    async with _reload_lock:
+        stamp = _config_stamp()
+        if stamp == _loaded_stamp:
+            return
+        _loaded_stamp = stamp
+
+        config = await asyncio.to_thread(_load_config)
+        if config is None or (_assistant_id and config["signature"] == _cached_signature):
+            return
+        # The update runs in the background; get_assistant_id waits for it.
+        _sync_task = asyncio.create_task(_sync_assistant(config))
+
+
+async def _watch_config() -> None:
+    while True:
+        await asyncio.sleep(_config_watch_interval)
+        try:
+            await _reload_config()
+        except Exception as exc:
+            logging.error("Error reloading assistant configuration: %s", exc)
+
+
+async def get_assistant_id() -> Optional[str]:
+    """Return the assistant id for the current instructions and schema.
+
+    The files are read, hashed and synced once; afterwards a background task
+    watches their mtimes and re-syncs only when they change.  Each call also
+    compares the mtimes itself (two ``stat`` calls), so an edit saved just
+    before a turn is not missed between two polls of the watcher.
+    """
+    global _watch_task, _loaded_stamp
+
+    if _watch_task is None:
+        _watch_task = asyncio.create_task(_watch_config())
+    if _assistant_id is None and (_sync_task is None or _sync_task.done()):
+        # First turn, or the last sync failed: load and sync now.
+        _loaded_stamp = None
+    await _reload_config()
+
+    if _sync_task is not None and not _sync_task.done():
+        # An edited file takes effect on the next turn.
+        await asyncio.shield(_sync_task)
+    return _assistant_id
+
+
+async def _create_thread() -> Optional[str]:
     try:
-        thread = await asyncio.to_thread(client.beta.threads.create)
+        thread = await client.beta.threads.create()
         return thread.id
     except Exception as exc:
         logging.error("Error creating thread: %s", exc)
         return None
 
 
+async def _delete_thread(thread_id: str) -> None:
+    try:
+        await client.beta.threads.delete(thread_id)
+    except Exception as exc:
+        logging.warning("Could not delete unused thread %s: %s", thread_id, exc)
+
+
+_thread_pool = ThreadPool(
+    _create_thread,
+    size=settings["thread_pool_size"],
+    max_age=settings["thread_pool_max_age"],
+    discard=_delete_thread,
+)
+
+
+async def create_new_thread():
+    """Hand out a new OpenAI thread, created ahead of time when possible."""
+    return await _thread_pool.acquire()
+
+
+async def close_threads() -> None:
+    """Delete the spare pre-created threads; call once before exiting.
+
+    Also waits for superseded runs to finish cancelling, so none keeps
+    generating (and billing) after the program has exited.
+    """
+    await _thread_pool.close()
+    if _pending_runs:
+        await asyncio.gather(*_pending_runs.values(), return_exceptions=True)
+
+
 async def check_run(thread_id, run_id):
     """Wait until an OpenAI run finishes."""
     while True:
         try:
-            run = await asyncio.to_thread(
-                client.beta.threads.runs.retrieve,
+            run = await client.beta.threads.runs.retrieve(
                 thread_id=thread_id,
                 run_id=run_id,
             )
 
             if run.status == "completed":
                 break
-            if run.status == "expired":
-                logging.error("Run expired for thread %s", thread_id)
+            if run.status in ("expired", "failed", "cancelled", "incomplete"):
+                logging.error("Run %s for thread %s", run.status, thread_id)
                 break
             await asyncio.sleep(3)
         except Exception as exc:
@@ -254,11 +410,160 @@ async def check_run(thread_id, run_id):
             break
 
 
-async def GPT_response(thread_id, prompt):
-    """Send a prompt to the assistant and return the response payload."""
+def _extract_message_payload(message) -> tuple[Optional[dict[str, Any]], Optional[str]]:
+    """Return the JSON payload or raw text carried by an assistant message."""
+    assistant_text: Optional[str] = None
+
+    for part in getattr(message, "content", []):
+        part_type = getattr(part, "type", None)
+
+        if part_type == "output_json":
+            payload = getattr(part, "output_json", None)
+            if isinstance(payload, dict):
+                return payload, None
+            if payload is not None:
+                return None, json.dumps(payload)
+
+        text_block = getattr(part, "text", None)
+        if text_block and getattr(text_block, "value", None):
+            assistant_text = text_block.value
+
+    return None, assistant_text
+
+
+async def _poll_run(thread_id, assistant_id, run_id=None):
+    """Start (or resume) a run, poll until it finishes and return the reply."""
+    if not run_id:
+        creating = asyncio.ensure_future(client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+        ))
+        run_ref = _active_runs.setdefault(thread_id, {"id": None})
+        run_ref["creating"] = creating
+        # Shielded so a superseded turn still learns the id it has to cancel.
+        run = await asyncio.shield(creating)
+        run_id = run_ref["id"] = run.id
+
+    await check_run(thread_id, run_id)
+    return await _fetch_run_reply(thread_id, run_id)
+
+
+async def _fetch_run_reply(thread_id, run_id):
+    """Return the assistant message with a payload written by ``run_id``.
+
+    Asks only for that run's messages, newest first, so the request stays the
+    same size however long the thread gets. If the filter finds nothing, walk
+    the thread backwards page by page and stop at the prompt that started the
+    run; everything older belongs to earlier turns.
+    """
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        run_id=run_id,
+        order="desc",
+        limit=_REPLY_PAGE_SIZE,
+    )
+    for message in page.data:
+        if getattr(message, "role", None) == "assistant" and any(_extract_message_payload(message)):
+            return message
+
+    page = await client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order="desc",
+        limit=_REPLY_PAGE_SIZE,
+    )
+    while True:
+        for message in page.data:
+            if getattr(message, "role", None) == "user":
+                return None
+            if getattr(message, "run_id", None) == run_id and any(_extract_message_payload(message)):
+                return message
+        if not page.has_next_page():
+            return None
+        page = await page.get_next_page()
+
+
+async def _stream_run(thread_id, assistant_id, parser: Optional[StreamingPayloadParser] = None):
+    """Start a run with streamed events and return the reply message.
+
+    Resolves as soon as ``thread.message.completed`` arrives. Text deltas are
+    fed to ``parser`` as they stream in. The remaining events are drained in
+    a background task so the run can settle before the next message is
+    posted; if the stream breaks, the run is polled instead.
+    """
+    loop = asyncio.get_running_loop()
+    reply: asyncio.Future = loop.create_future()
+    run_ref = _active_runs.setdefault(thread_id, {"id": None})
+
+    def _resolve(message=None, exc: Optional[BaseException] = None) -> None:
+        if reply.done():
+            return
+        if exc is not None:
+            reply.set_exception(exc)
+        else:
+            reply.set_result(message)
+
+    async def _consume() -> None:
+        try:
+            stream = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                stream=True,
+            )
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.message.delta" and parser is not None:
+                        for block in event.data.delta.content or []:
+                            text_delta = getattr(getattr(block, "text", None), "value", None)
+                            if text_delta:
+                                parser.feed(text_delta)
+                    elif event.event == "thread.run.created":
+                        run_ref["id"] = event.data.id
+                    elif event.event == "thread.message.completed":
+                        _resolve(event.data)
+                    elif event.event in _RUN_FAILURE_EVENTS:
+                        # A superseded run being cancelled is expected.
+                        log = logging.info if run_ref.get("cancelling") else logging.error
+                        log("Run for thread %s ended with %s", thread_id, event.event)
+                        break
+        except Exception as exc:
+            _resolve(None, exc)
+        finally:
+            _resolve()
+
+    _pending_runs[thread_id] = asyncio.ensure_future(_consume())
     try:
-        await asyncio.to_thread(
-            client.beta.threads.messages.create,
+        return await reply
+    except Exception as exc:
+        logging.warning("Streamed run failed for thread %s; polling instead: %s", thread_id, exc)
+        await _wait_for_pending_run(thread_id)
+        return await _poll_run(thread_id, assistant_id, run_ref["id"])
+
+
+async def _wait_for_pending_run(thread_id) -> None:
+    """Let a previously streamed run finish before touching its thread."""
+    pending = _pending_runs.pop(thread_id, None)
+    if pending is not None:
+        try:
+            await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # Superseded while waiting; the next prompt has to wait instead.
+            _pending_runs.setdefault(thread_id, pending)
+            raise
+        except Exception as exc:
+            logging.error("Error draining run events: %s", exc)
+
+
+async def GPT_response(thread_id, prompt, on_values=None, on_text=None):
+    """Send a prompt to the assistant and return the response payload.
+
+    When streaming, ``on_values`` is called with the ``values`` object as soon
+    as it is complete and ``on_text`` with each decoded piece of ``response``,
+    both before this coroutine returns.
+    """
+    try:
+        await _wait_for_pending_run(thread_id)
+        _active_runs[thread_id] = {"id": None}
+        await client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=prompt,
@@ -271,51 +576,17 @@ async def GPT_response(thread_id, prompt):
                 "values": {},
             }
 
-        run = await asyncio.to_thread(
-            client.beta.threads.runs.create,
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-
-        await check_run(thread_id, run.id)
-
-        messages = await asyncio.to_thread(
-            client.beta.threads.messages.list, thread_id=thread_id
-        )
-        if not messages.data:
-            return {"response": "No response received", "values": {}}
-
-        assistant_payload: Optional[dict[str, Any]] = None
-        assistant_text: Optional[str] = None
-
-        ordered_messages = sorted(
-            messages.data,
-            key=lambda msg: getattr(msg, "created_at", 0),
-            reverse=True,
-        )
-
-        for message in ordered_messages:
-            if getattr(message, "role", None) != "assistant":
-                continue
-
-            for part in getattr(message, "content", []):
-                part_type = getattr(part, "type", None)
-
-                if part_type == "output_json":
-                    payload = getattr(part, "output_json", None)
-                    if isinstance(payload, dict):
-                        assistant_payload = payload
-                        break
-                    if payload is not None:
-                        assistant_text = json.dumps(payload)
-                        break
-
-                text_block = getattr(part, "text", None)
-                if text_block and getattr(text_block, "value", None):
-                    assistant_text = text_block.value
+        if _run_mode == "poll":
+            message = await _poll_run(thread_id, assistant_id)
+        else:
+            parser = None
+            if on_values or on_text:
+                parser = StreamingPayloadParser(on_values, on_text)
+            message = await _stream_run(thread_id, assistant_id, parser)
+        if message is None:
+            return {"response": "No assistant response", "values": {}}
 
-            if assistant_payload or assistant_text:
-                break
+        assistant_payload, assistant_text = _extract_message_payload(message)
 
         if assistant_payload is not None:
             return assistant_payload
@@ -330,17 +601,86 @@ async def GPT_response(thread_id, prompt):
             return {"response": assistant_text, "values": {}}
 
         return {"response": "No assistant response", "values": {}}
+    except asyncio.CancelledError:
+        # Superseded by a newer prompt: stop the run before the thread is reused.
+        run_ref = _active_runs.pop(thread_id, None)
+        if run_ref is not None:
+            _pending_runs[thread_id] = asyncio.ensure_future(
+                _cancel_run(thread_id, run_ref, _pending_runs.get(thread_id))
+            )
+        raise
     except Exception as exc:
         logging.error("Error in GPT response: %s", exc)
         return {"response": "An error occurred while processing your request", "values": {}}
+    finally:
+        _active_runs.pop(thread_id, None)
+
 
+async def _cancel_run(thread_id, run_ref, drain=None) -> None:
+    """Cancel a superseded run and wait until it has stopped.
 
-async def transcribe_audio(audio_bytes: bytes) -> str | None:
-    """Transcribe WAV audio bytes using the configured OpenAI model."""
+    Runs on as a pending task of the thread, so the next prompt is only posted
+    once the run is no longer active. Records the tokens it had used.
+    """
+    run_ref["cancelling"] = True
+    if not run_ref["id"] and run_ref.get("creating") is not None:
+        try:
+            run_ref["id"] = (await run_ref["creating"]).id
+        except Exception:
+            pass
+    # A streamed run's id arrives with its first event.
+    for _ in range(100):
+        if run_ref["id"] or drain is None or drain.done():
+            break
+        await asyncio.sleep(0.05)
+    run_id = run_ref["id"]
+    if not run_id:
+        if drain is not None:
+            await asyncio.gather(drain, return_exceptions=True)
+        return
+
+    _cancelled_runs["runs"] += 1
     try:
-        result = client.audio.transcriptions.create(
+        run = await client.beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
+        while run.status not in _RUN_TERMINAL_STATUSES:
+            await asyncio.sleep(0.25)
+            run = await client.beta.threads.runs.retrieve(run_id=run_id, thread_id=thread_id)
+    except Exception as exc:
+        # Usually the run finished before the cancel reached it.
+        logging.info("Could not cancel run %s: %s", run_id, exc)
+        run = None
+    if drain is not None:
+        await asyncio.gather(drain, return_exceptions=True)
+    if run is None:
+        return
+    if run.status == "completed":
+        _cancelled_runs["finished_anyway"] += 1
+    usage = getattr(run, "usage", None)
+    if usage is not None:
+        _cancelled_runs["prompt_tokens"] += usage.prompt_tokens or 0
+        _cancelled_runs["completion_tokens"] += usage.completion_tokens or 0
+
+
+def cancelled_run_stats() -> dict[str, int]:
+    """Runs cancelled because a newer prompt arrived, and their token usage."""
+    return dict(_cancelled_runs)
+
+
+async def transcribe_audio(
+    audio_bytes: bytes, filename: str = "speech.wav", content_type: str = "audio/wav"
+) -> str | None:
+    """Transcribe an utterance (WAV bytes unless another file type is given)."""
+    if is_local_model(settings["transcription_model"]):
+        try:
+            result = await get_model(settings["transcription_model"]).transcribe_file_async(io.BytesIO(audio_bytes))
+            return result.text or None
+        except Exception as exc:
+            logging.error("Error transcribing audio locally: %s", exc)
+            return None
+    try:
+        result = await client.audio.transcriptions.create(
             model=settings["transcription_model"],
-            file=("speech.wav", audio_bytes, "audio/wav"),
+            file=(filename, audio_bytes, content_type),
             response_format="text",
             language="en",
         )
@@ -348,3 +688,40 @@ async def transcribe_audio(audio_bytes: bytes) -> str | None:
     except Exception as exc:
         logging.error("Error transcribing audio: %s", exc)
         return None
+
+
+def _encode_upload(pcm: bytes, sample_rate: int) -> EncodedAudio:
+    """Compress a finished utterance as configured before it is uploaded."""
+    return prepare_upload(
+        pcm,
+        sample_rate,
+        settings["transcription_codec"],
+        trim=settings["transcription_trim_silence"],
+    )
+
+
+def start_transcription(sample_rate: int) -> TranscriptionStream:
+    """Open a transcription for an utterance that is still being spoken."""
+    if is_local_model(settings["transcription_model"]):
+        return LocalTranscription(get_model(settings["transcription_model"]), sample_rate)
+    if not settings["transcription_streaming"]:
+        return BufferedTranscription(transcribe_audio, sample_rate, encode=_encode_upload)
+    return UploadTranscription(
+        _http_client,
+        base_url=settings["transcription_base_url"] or str(client.base_url),
+        api_key=client.api_key,
+        model=settings["transcription_model"],
+        sample_rate=sample_rate,
+        start_after=int(_STREAM_START_SECONDS * sample_rate) * 2,
+        fallback=transcribe_audio,
+        encode=_encode_upload,
+    )
+
+
+async def prepare_transcription() -> Optional[str]:
+    """Load and warm up a local transcription model; returns its name, if any."""
+    if not is_local_model(settings["transcription_model"]):
+        return None
+    model = get_model(settings["transcription_model"])
+    await model.warm_up()
+    return model.model_name
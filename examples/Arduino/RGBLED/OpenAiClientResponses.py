@@ -0,0 +1,260 @@
+"""Single-round-trip backend built on the OpenAI Responses API.
+
+Drop-in alternative to ``OpenAiClientAssistant`` (select it with
+``OPENAI_BACKEND=responses``).  Each turn is one ``responses.create`` call that
+carries the instructions from ``assistant_instructions.md`` and the schema from
+``assistant_response_schema.json``, instead of ``messages.create`` +
+``runs.create`` + run polling + ``messages.list`` on a server-side thread.
+Conversation context is chained through ``previous_response_id``; "threads"
+are local identifiers, so creating one costs no request at all.
+"""
+
+import asyncio
+import importlib.util
+import io
+import json
+import logging
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from audio_encoding import EncodedAudio, prepare_upload
+from local_whisper import get_model, is_local_model
+from settings import settings
+from streaming_payload import StreamingPayloadParser
+from transcription import (
+    BufferedTranscription,
+    LocalTranscription,
+    TranscriptionStream,
+    UploadTranscription,
+)
+
+
+def _build_http_client() -> DefaultAsyncHttpxClient:
+    """Create the keep-alive connection pool shared by every API call."""
+    http2 = settings["openai_http2"] and importlib.util.find_spec("h2") is not None
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings["openai_max_connections"],
+            max_keepalive_connections=settings["openai_max_keepalive"],
+        ),
+    )
+
+
+_http_client = _build_http_client()
+
+# Initialize the OpenAI client (one per process, reused across turns)
+client = AsyncOpenAI(
+    api_key=settings["openAIToken"],
+    http_client=_http_client,
+)
+
+_instructions_path = Path(settings["assistant_instructions_file"])
+_schema_path = Path(settings["assistant_schema_file"])
+_model = settings["assistant_model"]
+
+# Audio collected before a streamed transcription upload is opened, so blips
+# the endpointer discards never reach the server.
+_STREAM_START_SECONDS = 0.35
+
+_TERMINAL_STREAM_EVENTS = {
+    "response.completed",
+    "response.incomplete",
+    "response.failed",
+}
+
+_request_config: Optional[dict[str, Any]] = None
+# Latest response id per local thread, fed back as previous_response_id.
+_previous_response_ids: dict[str, Optional[str]] = {}
+# Turns superseded by a newer prompt while their response was being generated.
+_cancelled_runs = {"runs": 0}
+
+
+def _load_request_config() -> Optional[dict[str, Any]]:
+    """Read the instructions and schema once and shape them for the API."""
+    global _request_config
+
+    if _request_config is not None:
+        return _request_config
+
+    try:
+        instructions = _instructions_path.read_text(encoding="utf-8").strip()
+        schema = json.loads(_schema_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        logging.error("Unable to load assistant instructions/schema: %s", exc)
+        return None
+
+    if not instructions or not isinstance(schema, dict):
+        logging.error("Assistant instructions and a JSON schema object are required.")
+        return None
+
+    _request_config = {
+        "instructions": instructions,
+        "text": {
+            "format": {
+                "type": "json_schema",
+                "name": schema.get("name", "structured_payload"),
+                "schema": schema.get("schema", {}),
+                "strict": schema.get("strict", False),
+            }
+        },
+    }
+    return _request_config
+
+
+async def create_new_thread():
+    """Start a local conversation; no request is needed with this backend."""
+    thread_id = f"local_{uuid.uuid4().hex}"
+    _previous_response_ids[thread_id] = None
+    return thread_id
+
+
+async def close_threads() -> None:
+    """Nothing to clean up: conversations are local identifiers."""
+
+
+async def _stream_response(request: dict[str, Any], parser: StreamingPayloadParser):
+    """Stream one turn, feeding text deltas to ``parser`` as they arrive."""
+    final_response = None
+    stream = await client.responses.create(stream=True, **request)
+    async with stream:
+        async for event in stream:
+            event_type = getattr(event, "type", None)
+            if event_type == "response.output_text.delta":
+                parser.feed(event.delta)
+            elif event_type in _TERMINAL_STREAM_EVENTS:
+                final_response = event.response
+    return final_response
+
+
+def _extract_output_text(response: Any) -> str:
+    chunks: list[str] = []
+    for item in getattr(response, "output", []) or []:
+        if getattr(item, "type", None) != "message":
+            continue
+        for content in getattr(item, "content", []) or []:
+            if getattr(content, "type", None) == "output_text" and content.text:
+                chunks.append(content.text)
+    return "".join(chunks).strip()
+
+
+async def GPT_response(thread_id, prompt, on_values=None, on_text=None):
+    """Send a prompt in a single request and return the response payload.
+
+    ``on_values`` / ``on_text`` behave as in ``OpenAiClientAssistant``: when
+    given, the reply is streamed and the callbacks fire while it arrives.
+    """
+    config = _load_request_config()
+    if not config:
+        return {
+            "response": "Assistant configuration is incomplete. Check server logs.",
+            "values": {},
+        }
+
+    request: dict[str, Any] = {
+        "model": _model,
+        "input": [{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
+        **config,
+    }
+    previous_response_id = _previous_response_ids.get(thread_id)
+    if previous_response_id:
+        request["previous_response_id"] = previous_response_id
+
+    try:
+        if on_values or on_text:
+            response = await _stream_response(
+                request, StreamingPayloadParser(on_values, on_text)
+            )
+        else:
+            response = await client.responses.create(**request)
+    except asyncio.CancelledError:
+        # Superseded: closing the request stops generation, and the next turn
+        # chains from the last completed response, without this prompt.
+        _cancelled_runs["runs"] += 1
+        raise
+    except Exception as exc:
+        logging.error("Error in GPT response: %s", exc)
+        return {"response": "An error occurred while processing your request", "values": {}}
+
+    if response is None:
+        return {"response": "No response received", "values": {}}
+
+    _previous_response_ids[thread_id] = getattr(response, "id", None)
+
+    assistant_message = _extract_output_text(response)
+    if not assistant_message:
+        return {"response": "No response received", "values": {}}
+    try:
+        return json.loads(assistant_message)
+    except json.JSONDecodeError:
+        return {"response": assistant_message, "values": {}}
+
+
+def cancelled_run_stats() -> dict[str, int]:
+    """Responses abandoned because a newer prompt arrived."""
+    return dict(_cancelled_runs)
+
+
+async def transcribe_audio(
+    audio_bytes: bytes, filename: str = "speech.wav", content_type: str = "audio/wav"
+) -> str | None:
+    """Transcribe an utterance (WAV bytes unless another file type is given)."""
+    if is_local_model(settings["transcription_model"]):
+        try:
+            result = await get_model(settings["transcription_model"]).transcribe_file_async(io.BytesIO(audio_bytes))
+            return result.text or None
+        except Exception as exc:
+            logging.error("Error transcribing audio locally: %s", exc)
+            return None
+    try:
+        result = await client.audio.transcriptions.create(
+            model=settings["transcription_model"],
+            file=(filename, audio_bytes, content_type),
+            response_format="text",
+            language="en",
+        )
+        return result if isinstance(result, str) else getattr(result, "text", None)
+    except Exception as exc:
+        logging.error("Error transcribing audio: %s", exc)
+        return None
+
+
+def _encode_upload(pcm: bytes, sample_rate: int) -> EncodedAudio:
+    """Compress a finished utterance as configured before it is uploaded."""
+    return prepare_upload(
+        pcm,
+        sample_rate,
+        settings["transcription_codec"],
+        trim=settings["transcription_trim_silence"],
+    )
+
+
+def start_transcription(sample_rate: int) -> TranscriptionStream:
+    """Open a transcription for an utterance that is still being spoken."""
+    if is_local_model(settings["transcription_model"]):
+        return LocalTranscription(get_model(settings["transcription_model"]), sample_rate)
+    if not settings["transcription_streaming"]:
+        return BufferedTranscription(transcribe_audio, sample_rate, encode=_encode_upload)
+    return UploadTranscription(
+        _http_client,
+        base_url=settings["transcription_base_url"] or str(client.base_url),
+        api_key=client.api_key,
+        model=settings["transcription_model"],
+        sample_rate=sample_rate,
+        start_after=int(_STREAM_START_SECONDS * sample_rate) * 2,
+        fallback=transcribe_audio,
+        encode=_encode_upload,
+    )
+
+
+async def prepare_transcription() -> Optional[str]:
+    """Load and warm up a local transcription model; returns its name, if any."""
+    if not is_local_model(settings["transcription_model"]):
+        return None
+    model = get_model(settings["transcription_model"])
+    await model.warm_up()
+    return model.model_name
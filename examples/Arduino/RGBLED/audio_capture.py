@@ -0,0 +1,227 @@
+"""Long-lived microphone capture with VAD-based utterance segmentation.
+
+Opening a PortAudio stream for every utterance costs startup latency and
+clips the first syllable.  ``MicrophoneCapture`` opens one callback-driven
+``RawInputStream`` for the whole session.  The audio callback only copies
+samples into a preallocated int16 ring buffer and wakes the event loop;
+frames are then segmented on the loop.  Where an utterance starts and ends
+(the pre/post-speech padding, the silence tail, the energy gate and the noise
+floor behind it) is decided by an ``endpointer.Endpointer``; this class only
+assembles the audio.
+
+Frame energies come from ``audio_energy.frame_rms`` over a NumPy view of the
+ring, one block of frames at a time, and speech is assembled in a preallocated
+array rather than lists of ``bytes``.  Complete utterances are put on
+``utterances``, an ``asyncio.Queue``, as ``Utterance(pcm, transcription)``:
+the raw 16-bit mono PCM plus, when a ``transcriber`` is set, the
+``transcription.TranscriptionStream`` that was opened when speech started and
+has been fed every frame since, so the upload overlaps the speaking.  Frames
+are only segmented while ``listening`` is true; otherwise they just keep the
+noise floor current.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import sounddevice as sd
+
+from audio_energy import frame_rms
+from endpointer import DISCARD, END, SPEECH, START, Endpointer
+from transcription import TranscriptionStream
+
+
+class Utterance(NamedTuple):
+    pcm: bytes
+    transcription: Optional[TranscriptionStream]
+
+
+class MicrophoneCapture:
+    """Keep one input stream open and hand out complete utterances."""
+
+    def __init__(
+        self,
+        vad,
+        endpointer: Endpointer,
+        *,
+        sample_rate: int,
+        frame_size: int,
+        ring_seconds: float = 5.0,
+        transcriber: Optional[Callable[[int], TranscriptionStream]] = None,
+    ) -> None:
+        self.vad = vad
+        self.endpointer = endpointer
+        self.transcriber = transcriber
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+
+        self.utterances: asyncio.Queue = asyncio.Queue()
+        self.overruns = 0
+
+        # A whole number of frames, so frames never straddle the wrap point.
+        history = endpointer.pre_speech_frames + endpointer.post_speech_frames + 1
+        ring_frames = max(history, int(ring_seconds * sample_rate / frame_size))
+        self._ring = np.zeros(ring_frames * frame_size, dtype=np.int16)
+        # Monotonic sample counters; written only by the audio thread / the loop.
+        self._written = 0
+        self._read = 0
+
+        # Longest utterance: max_frames + 1 voiced frames plus the post padding.
+        segment_frames = endpointer.max_frames + endpointer.post_speech_frames + 2
+        self._segment = np.zeros(segment_frames * frame_size, dtype=np.int16)
+        self._segment_samples = 0
+        self._transcription: Optional[TranscriptionStream] = None
+
+        self._stream: Optional[sd.RawInputStream] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drain_scheduled = False
+        self._listening = False
+
+    # ------------------------------------------------------------------
+    # Stream lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Open the input stream; raises ``sd.PortAudioError`` if unavailable."""
+        if self._stream is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stream = sd.RawInputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.frame_size,
+            dtype="int16",
+            channels=1,
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    def stop(self) -> None:
+        if self._stream is None:
+            return
+        self._stream.stop()
+        self._stream.close()
+        self._stream = None
+
+    @property
+    def listening(self) -> bool:
+        return self._listening
+
+    @listening.setter
+    def listening(self, value: bool) -> None:
+        if value and not self._listening:
+            # Start fresh: no half-captured speech or stale utterances.
+            self._read = self._written - self._written % self.frame_size
+            self._drop_segment()
+            self.endpointer.reset()
+            while not self.utterances.empty():
+                stale = self.utterances.get_nowait()
+                if stale.transcription is not None:
+                    stale.transcription.cancel()
+        self._listening = value
+
+    async def calibrate(self, duration: float = 1.0) -> int:
+        """Let the endpointer learn the room for ``duration`` seconds."""
+        await asyncio.sleep(duration)
+        return int(self.endpointer.noise_floor)
+
+    # ------------------------------------------------------------------
+    # Audio thread
+    # ------------------------------------------------------------------
+
+    def _callback(self, indata, frames, time_info, status) -> None:
+        samples = np.frombuffer(indata, dtype=np.int16)
+        size = samples.size
+        capacity = self._ring.size
+        offset = self._written % capacity
+        first = min(size, capacity - offset)
+        self._ring[offset:offset + first] = samples[:first]
+        if first < size:
+            self._ring[:size - first] = samples[first:]
+        self._written += size
+
+        if not self._drain_scheduled and self._loop is not None:
+            self._drain_scheduled = True
+            self._loop.call_soon_threadsafe(self._drain)
+
+    # ------------------------------------------------------------------
+    # Event loop
+    # ------------------------------------------------------------------
+
+    def _drain(self) -> None:
+        self._drain_scheduled = False
+        capacity = self._ring.size
+        frame_size = self.frame_size
+        if self._written - self._read > capacity:
+            # The loop fell behind a full ring; skip to the oldest intact frame.
+            self.overruns += 1
+            lag = self._written - self._read - capacity
+            self._read += -(-lag // frame_size) * frame_size
+
+        while self._written - self._read >= frame_size:
+            # Every whole frame up to the wrap point, as one (n, frame_size) view.
+            offset = self._read % capacity
+            count = min((self._written - self._read) // frame_size, (capacity - offset) // frame_size)
+            block = self._ring[offset:offset + count * frame_size].reshape(count, frame_size)
+            energies = frame_rms(block).tolist()
+
+            if not self._listening:
+                for energy in energies:
+                    self.endpointer.observe(energy)
+                self._read += count * frame_size
+                continue
+
+            for frame, energy in zip(block, energies):
+                self._read += frame_size
+                self._process_frame(frame, energy)
+
+    def _recent(self, count: int) -> np.ndarray:
+        """The last ``count`` frames processed, oldest first, as one array."""
+        capacity = self._ring.size
+        start = (self._read - count * self.frame_size) % capacity
+        stop = start + count * self.frame_size
+        if stop <= capacity:
+            return self._ring[start:stop]
+        return np.concatenate((self._ring[start:], self._ring[:stop - capacity]))
+
+    def _append(self, samples: np.ndarray) -> None:
+        end = self._segment_samples + samples.size
+        self._segment[self._segment_samples:end] = samples
+        self._segment_samples = end
+        if self._transcription is not None and samples.size:
+            self._transcription.feed(samples.tobytes())
+
+    def _drop_segment(self) -> None:
+        self._segment_samples = 0
+        if self._transcription is not None:
+            self._transcription.cancel()
+            self._transcription = None
+
+    def _process_frame(self, frame: np.ndarray, energy: int) -> None:
+        endpointer = self.endpointer
+        is_voiced = energy >= endpointer.threshold and self.vad.is_speech(
+            memoryview(frame).cast("B"), self.sample_rate
+        )
+        action = endpointer.push(energy, is_voiced)
+
+        if action is START:
+            if self.transcriber is not None:
+                self._transcription = self.transcriber(self.sample_rate)
+            # The pre-speech padding is still in the ring; no need to buffer it.
+            self._append(self._recent(endpointer.pre_frames))
+        elif action is SPEECH:
+            self._append(frame)
+        elif action is END:
+            if is_voiced:
+                self._append(frame)
+            self._append(self._recent(endpointer.post_frames))
+            pcm = self._segment[:self._segment_samples].tobytes()
+            self.utterances.put_nowait(Utterance(pcm, self._transcription))
+            self._segment_samples = 0
+            self._transcription = None
+        elif action is DISCARD:
+            self._drop_segment()
+
+
+__all__ = ["MicrophoneCapture", "Utterance"]
@@ -0,0 +1,152 @@
+"""Offline speech-to-text on the CPU with a Whisper-family model.
+
+Setting ``TRANSCRIPTION_MODEL=local:<size>`` (for example ``local:tiny.en``,
+``local:base.en`` or a path to a converted model directory) transcribes voice
+input on this machine with faster-whisper instead of calling the API, so
+voice keeps working when the venue network drops.  The model is loaded once
+per process (``get_model``) and kept in memory; ``warm_up`` runs one short
+inference at startup so the first utterance is not slowed by lazy setup.
+
+Audio from the microphone is passed as the in-memory 16 kHz PCM samples, with
+no WAV encoding.  Every call returns the real-time factor (processing time
+divided by audio duration) so the model size can be chosen per machine:
+below 1.0 the model keeps up with speech, and lower means shorter waits.
+
+Requires ``pip install faster-whisper``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+LOCAL_PREFIX = "local:"
+SAMPLE_RATE = 16000
+
+
+class LocalTranscript(NamedTuple):
+    text: str
+    audio_seconds: float
+    elapsed: float
+    rtf: float
+
+
+def is_local_model(name: str) -> bool:
+    return name.strip().lower().startswith(LOCAL_PREFIX)
+
+
+class LocalWhisper:
+    """A faster-whisper model that stays loaded between utterances."""
+
+    def __init__(
+        self,
+        model: str,
+        *,
+        compute_type: str = "int8",
+        cpu_threads: int = 0,
+        language: Optional[str] = "en",
+        beam_size: int = 1,
+    ) -> None:
+        self.model_name = model
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.language = language
+        self.beam_size = beam_size
+        self.load_seconds: Optional[float] = None
+        self.history: list[LocalTranscript] = []
+        self._model = None
+        # CTranslate2 inference is already multi-threaded; run one at a time.
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self._lock:
+            if self._model is not None:
+                return
+            from faster_whisper import WhisperModel
+
+            start = time.perf_counter()
+            self._model = WhisperModel(
+                self.model_name,
+                device="cpu",
+                compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+            )
+            self.load_seconds = time.perf_counter() - start
+            logging.info("Loaded local transcription model %s in %.1f s", self.model_name, self.load_seconds)
+
+    async def warm_up(self) -> None:
+        """Load the model and run one inference so the first real one is fast."""
+        await asyncio.to_thread(self.load)
+        await asyncio.to_thread(self._run, np.zeros(SAMPLE_RATE // 2, dtype=np.float32), SAMPLE_RATE // 2 / SAMPLE_RATE)
+
+    def transcribe_pcm(self, pcm, sample_rate: int = SAMPLE_RATE) -> LocalTranscript:
+        """Transcribe 16-bit mono PCM (bytes or an int16 array) at 16 kHz."""
+        if sample_rate != SAMPLE_RATE:
+            raise ValueError(f"Local transcription needs {SAMPLE_RATE} Hz audio, got {sample_rate} Hz")
+        samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+        audio = samples.astype(np.float32) / 32768.0
+        return self._record(self._run(audio, samples.size / SAMPLE_RATE))
+
+    def transcribe_file(self, audio_file) -> LocalTranscript:
+        """Transcribe an audio file path or binary file object (OGG, WAV, ...)."""
+        return self._record(self._run(audio_file, None))
+
+    async def transcribe_pcm_async(self, pcm, sample_rate: int = SAMPLE_RATE) -> LocalTranscript:
+        return await asyncio.to_thread(self.transcribe_pcm, pcm, sample_rate)
+
+    async def transcribe_file_async(self, audio_file) -> LocalTranscript:
+        return await asyncio.to_thread(self.transcribe_file, audio_file)
+
+    def stats(self) -> Dict[str, Any]:
+        rtfs = [result.rtf for result in self.history]
+        return {
+            "model": self.model_name,
+            "load_seconds": self.load_seconds,
+            "utterances": len(rtfs),
+            "last_rtf": rtfs[-1] if rtfs else None,
+            "mean_rtf": sum(rtfs) / len(rtfs) if rtfs else None,
+        }
+
+    def _run(self, audio, audio_seconds: Optional[float]) -> LocalTranscript:
+        self.load()
+        with self._lock:
+            start = time.perf_counter()
+            segments, info = self._model.transcribe(
+                audio,
+                language=self.language,
+                beam_size=self.beam_size,
+                condition_on_previous_text=False,
+            )
+            # Segments are generated lazily; joining them runs the decoder.
+            text = "".join(segment.text for segment in segments).strip()
+            elapsed = time.perf_counter() - start
+        duration = audio_seconds if audio_seconds is not None else float(info.duration)
+        return LocalTranscript(text, duration, elapsed, elapsed / duration if duration else 0.0)
+
+    def _record(self, result: LocalTranscript) -> LocalTranscript:
+        self.history.append(result)
+        del self.history[:-100]
+        logging.info(
+            "Local transcription: %.1f s of audio in %.2f s (RTF %.2f)",
+            result.audio_seconds, result.elapsed, result.rtf,
+        )
+        return result
+
+
+_models: Dict[str, LocalWhisper] = {}
+
+
+def get_model(name: str, **options: Any) -> LocalWhisper:
+    """Shared model for ``local:<size>``; created on first use, then reused."""
+    model = name.strip()[len(LOCAL_PREFIX):] if is_local_model(name) else name.strip()
+    if model not in _models:
+        _models[model] = LocalWhisper(model, **options)
+    return _models[model]
+
+
+__all__ = ["LOCAL_PREFIX", "LocalTranscript", "LocalWhisper", "get_model", "is_local_model"]
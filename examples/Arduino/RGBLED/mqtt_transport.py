@@ -0,0 +1,368 @@
+"""MQTT client that runs on the application's asyncio event loop.
+
+``paho``'s ``loop_start`` runs the network loop on a thread of its own: its
+callbacks fire on that thread (setting an ``asyncio.Event`` from there is not
+thread-safe) and ``publish`` merely queues bytes for it.  ``MQTTTransport``
+uses paho's external-loop hooks instead: the socket is registered with the
+running loop (``add_reader`` / ``add_writer``), so reads, writes and every
+callback happen on the loop, and each operation can be awaited:
+
+* ``connect`` checks the broker is reachable without blocking, then waits
+  for its CONNACK;
+* ``publish`` returns once the message has been written to the socket
+  (QoS 0) or acknowledged by the broker (QoS 1/2).  At most ``max_pending``
+  publishes are outstanding; further callers wait for a slot, so a slow
+  broker or network pushes back on the producer instead of growing a queue;
+* ``subscribe`` waits for the SUBACK and hands messages to a callback;
+  subscriptions are renewed after every reconnect;
+* after an unexpected disconnect the client reconnects with exponential
+  backoff; ``wait_connected`` waits for that.  ``connect(retry=True)`` does
+  the same when the broker is not reachable at startup.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+MessageCallback = Callable[[str, bytes], Any]
+
+
+def _expire(delivered: asyncio.Future) -> None:
+    if not delivered.done():
+        delivered.set_result(None)
+
+
+class MQTTTransport:
+    """paho-mqtt client driven by the running asyncio loop."""
+
+    # Packets read per readable event before yielding to other callbacks.
+    READ_BATCH = 64
+
+    def __init__(
+        self,
+        *,
+        client_id: str = "",
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        keepalive: int = 60,
+        max_pending: int = 100,
+        reconnect_delay: Tuple[float, float] = (1.0, 30.0),
+        on_connect: Optional[Callable[[int], Any]] = None,
+        on_disconnect: Optional[Callable[[int], Any]] = None,
+    ) -> None:
+        self.client = mqtt.Client(
+            client_id=client_id,
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+        )
+        if username:
+            self.client.username_pw_set(username, password=password)
+        # Let paho keep as many QoS 1/2 messages in flight as we allow callers.
+        self.client.max_inflight_messages_set(max_pending)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self.keepalive = keepalive
+        self.min_delay, self.max_delay = reconnect_delay
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.connected = asyncio.Event()
+        self.published = 0
+        self.failed = 0
+        self.reconnects = 0
+
+        self._slots = asyncio.Semaphore(max_pending)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host: Optional[str] = None
+        self._port = 1883
+        self._address: Optional[Tuple[str, int]] = None
+        self._connack: Optional[asyncio.Future] = None
+        self._closed = asyncio.Event()
+        self._closing = False
+        # Publishes awaiting confirmation and SUBACK futures, by message id.
+        self._deliveries: Dict[int, Tuple[mqtt.MQTTMessageInfo, asyncio.Future]] = {}
+        self._acks: Dict[int, asyncio.Future] = {}
+        self._subscriptions: Dict[str, Tuple[MessageCallback, int]] = {}
+        self._misc_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    async def connect(
+        self,
+        host: str,
+        port: int = 1883,
+        *,
+        timeout: float = 5.0,
+        retry: bool = False,
+    ) -> bool:
+        """Connect and wait for the broker to accept the session.
+
+        Returns False when the broker refuses the connection.  Raises
+        ``asyncio.TimeoutError`` when it does not answer within ``timeout``
+        seconds and ``OSError`` when it cannot be reached.
+
+        With ``retry``, a broker that cannot be reached or refuses is not an
+        error: False is returned and the client keeps trying in the
+        background with the reconnect backoff, setting ``connected`` once it
+        gets through.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._closing = False
+        self._host, self._port, self._address = host, port, None
+        if self._misc_task is None:
+            self._misc_task = self._loop.create_task(self._misc_loop())
+        try:
+            code = await asyncio.wait_for(self._open(), timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            if not retry:
+                await self.disconnect()
+                raise
+            logging.info("MQTT broker unreachable, retrying in the background: %s", exc or "timed out")
+            code = None
+        except BaseException:
+            await self.disconnect()
+            raise
+        if code == 0:
+            return True
+        if retry:
+            self._start_reconnect()
+        else:
+            await self.disconnect()
+        return False
+
+    async def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def publish(
+        self,
+        topic: str,
+        payload: Any,
+        *,
+        qos: int = 0,
+        retain: bool = False,
+        timeout: float = 10.0,
+    ) -> bool:
+        """Publish and wait until the message is on the wire (or acknowledged)."""
+        if not self.connected.is_set():
+            return False
+        async with self._slots:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                logging.warning("MQTT publish to %s failed: %s", topic, mqtt.error_string(info.rc))
+                self.failed += 1
+                return False
+            delivered = self._loop.create_future()
+            self._deliveries[info.mid] = (info, delivered)
+            # A bare timer instead of wait_for, which costs an extra future and
+            # callbacks per message in a burst.
+            expiry = self._loop.call_later(timeout, _expire, delivered)
+            try:
+                ok = await delivered
+            finally:
+                expiry.cancel()
+                self._deliveries.pop(info.mid, None)
+            if ok is None:
+                logging.warning("MQTT publish to %s not confirmed after %.1f s", topic, timeout)
+                ok = False
+        if ok:
+            self.published += 1
+        else:
+            self.failed += 1
+        return ok
+
+    async def subscribe(
+        self,
+        topic: str,
+        callback: MessageCallback,
+        *,
+        qos: int = 0,
+        timeout: float = 5.0,
+    ) -> bool:
+        """Call ``callback(topic, payload)`` for messages matching ``topic``.
+
+        The subscription is kept across reconnects.  Returns True once the
+        broker has granted it, False if it refused or is not connected (the
+        subscription is then sent with the next connection).
+        """
+        self._subscriptions[topic] = (callback, qos)
+        self.client.message_callback_add(topic, lambda _client, _userdata, message: callback(message.topic, message.payload))
+        if not self.connected.is_set():
+            return False
+        result, mid = self.client.subscribe(topic, qos)
+        if result != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        granted = self._loop.create_future()
+        self._acks[mid] = granted
+        try:
+            return await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._acks.pop(mid, None)
+
+    async def disconnect(self) -> None:
+        """Stop reconnecting, send DISCONNECT and close the socket."""
+        self._closing = True
+        for task in (self._reconnect_task, self._misc_task):
+            if task is not None:
+                task.cancel()
+        self._reconnect_task = self._misc_task = None
+        if self.client.socket() is None:
+            return
+        self.client.disconnect()
+        try:
+            # Closed once the DISCONNECT packet has been written.
+            await asyncio.wait_for(self._closed.wait(), 1.0)
+        except asyncio.TimeoutError:
+            logging.warning("MQTT socket did not close cleanly")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected.is_set(),
+            "published": self.published,
+            "failed": self.failed,
+            "pending": len(self._deliveries),
+            "reconnects": self.reconnects,
+        }
+
+    async def _open(self) -> int:
+        """Open a connection to ``_address``; returns the CONNACK code."""
+        if self._address is None:
+            # Resolve once; reconnects go straight to the same address.
+            infos = await self._loop.getaddrinfo(self._host, self._port, type=socket.SOCK_STREAM)
+            self._address = (infos[0][4][0], self._port)
+        host, port = self._address
+        # socket.create_connection inside paho blocks; make sure the broker
+        # answers first so the blocking part is a single local round trip.
+        _, writer = await asyncio.open_connection(host, port)
+        writer.close()
+        self._connack = self._loop.create_future()
+        self._closed.clear()
+        self.client.connect(host, port, keepalive=self.keepalive)
+        return await self._connack
+
+    async def _reconnect(self) -> None:
+        delay = self.min_delay
+        while not self._closing and not self.connected.is_set():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+            try:
+                code = await asyncio.wait_for(self._open(), 10.0)
+            except (OSError, asyncio.TimeoutError) as exc:
+                logging.info("MQTT reconnect failed: %s", exc or "timed out")
+                continue
+            if code == 0:
+                self.reconnects += 1
+
+    def _start_reconnect(self) -> None:
+        if not self._closing and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    # -- paho callbacks (all run on the event loop) -------------------------
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        code = getattr(reason_code, "value", reason_code)
+        if code == 0:
+            self.connected.set()
+            # Clean sessions forget subscriptions; renew them.
+            for topic, (_, qos) in self._subscriptions.items():
+                client.subscribe(topic, qos)
+        else:
+            self.connected.clear()
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(code)
+        if self.on_connect is not None:
+            self.on_connect(code)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
+        code = getattr(reason_code, "value", reason_code)
+        self.connected.clear()
+        self._closed.set()
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(code or mqtt.MQTT_ERR_CONN_LOST)
+        # paho drops unsent QoS 0 messages when it reconnects; QoS 1/2 are resent.
+        for info, delivered in self._deliveries.values():
+            if info.qos == 0 and not delivered.done():
+                delivered.set_result(False)
+        if self.on_disconnect is not None:
+            self.on_disconnect(code)
+        self._start_reconnect()
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        granted = self._acks.get(mid)
+        if granted is not None and not granted.done():
+            granted.set_result(all(getattr(code, "value", code) < 128 for code in reason_codes))
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.add_reader(sock, self._read, sock)
+
+    def _read(self, sock):
+        self._drain(sock)
+        self._settle()
+
+    def _drain(self, sock):
+        # loop_read handles a single packet per call while nothing is in
+        # flight (e.g. QoS 0 subscriptions); keep reading what the socket
+        # already holds instead of spending a loop iteration per message.
+        for _ in range(self.READ_BATCH):
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.client.socket() is not sock:
+                return
+            try:
+                if not sock.recv(1, socket.MSG_PEEK):
+                    return
+            except (BlockingIOError, InterruptedError):
+                return
+            except (OSError, ValueError):
+                # Closed, or a TLS socket (no MSG_PEEK): the next event reads on.
+                return
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        # Write on the next loop iteration, batching every packet queued until
+        # then; wait for writability only if the socket buffer is full.
+        self._loop.call_soon(self._write, sock)
+
+    def _write(self, sock):
+        if self.client.socket() is not sock:
+            return
+        self.client.loop_write()
+        self._settle()
+        if self.client.want_write():
+            self._loop.add_writer(sock, self._write, sock)
+
+    def _settle(self):
+        # paho marks a message published once written (QoS 0) or acknowledged
+        # (QoS 1/2).  Checking after each read or write resolves a whole batch
+        # at once; an on_publish callback would build a PUBACK reason code and
+        # properties object for every QoS 0 message.
+        for info, delivered in self._deliveries.values():
+            if not delivered.done() and info.is_published():
+                delivered.set_result(True)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self) -> None:
+        # Keepalive pings and retries of unacknowledged QoS 1/2 messages.
+        while True:
+            await asyncio.sleep(1)
+            if self.client.socket() is not None:
+                self.client.loop_misc()
+
+
+__all__ = ["MQTTTransport"]
@@ -1,19 +1,41 @@
 import asyncio
-import collections
+import atexit
 import json
-import select
 import sys
-import time
-import wave
-from io import BytesIO
+import threading
+from pathlib import Path
 
-import audioop
-import paho.mqtt.client as mqtt
-import sounddevice as sd
 import webrtcvad
 
 from settings import settings
-from OpenAiClientAssistant import create_new_thread, GPT_response, transcribe_audio
+from audio_capture import MicrophoneCapture
+from endpointer import Endpointer
+from intent_rules import IntentMatcher
+from mqtt_transport import MQTTTransport
+from outbound_queue import OutboundQueue
+from response_cache import ResponseCache, config_fingerprint
+from run_supervisor import RunSupervisor
+from state_shadow import StateShadow
+
+if settings["backend"] == "responses":
+    # One request per turn; context is chained with previous_response_id.
+    from OpenAiClientResponses import (
+        cancelled_run_stats,
+        close_threads,
+        create_new_thread,
+        GPT_response,
+        prepare_transcription,
+        start_transcription,
+    )
+else:
+    from OpenAiClientAssistant import (
+        cancelled_run_stats,
+        close_threads,
+        create_new_thread,
+        GPT_response,
+        prepare_transcription,
+        start_transcription,
+    )
 
 broker = settings["broker"]
 port = settings.get("mqtt_port", 1883)
@@ -25,75 +47,179 @@ current_thread_id = None
 input_mode = "text"
 voice_prompt_displayed = False
 dev_mode = False
+# Last values sent to the LED; part of the response cache key.
+device_state = {}
+# Set when a rule or cache answered, so the model hasn't seen device_state.
+model_state_stale = False
+# Runs one turn at a time; a newer prompt cancels the turn still running.
+supervisor = RunSupervisor()
 SAMPLE_RATE = 16000
 FRAME_DURATION_MS = 30
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
 SILENCE_FRAMES_LIMIT = int(0.9 / (FRAME_DURATION_MS / 1000))
+MIN_SILENCE_FRAMES = int(0.45 / (FRAME_DURATION_MS / 1000))
 MAX_FRAMES = int(10 / (FRAME_DURATION_MS / 1000))
 PRE_SPEECH_FRAMES = int(0.18 / (FRAME_DURATION_MS / 1000))
-VOICE_WAIT_TIMEOUT = 8
+VOICE_POLL_INTERVAL = 0.25
 ENERGY_THRESHOLD = 300
 MIN_VOICE_FRAMES = int(0.35 / (FRAME_DURATION_MS / 1000))
 POST_SPEECH_FRAMES = int(0.4 / (FRAME_DURATION_MS / 1000))
 
 vad = webrtcvad.Vad(3)
-noise_floor = ENERGY_THRESHOLD
+microphone = None
+
+
+def build_microphone():
+    """Create the session-long microphone stream; started in ``main()``."""
+    endpointer = Endpointer(
+        frame_ms=FRAME_DURATION_MS,
+        energy_threshold=ENERGY_THRESHOLD,
+        pre_speech_frames=PRE_SPEECH_FRAMES,
+        post_speech_frames=POST_SPEECH_FRAMES,
+        min_tail_frames=MIN_SILENCE_FRAMES,
+        max_tail_frames=SILENCE_FRAMES_LIMIT,
+        max_frames=MAX_FRAMES,
+        min_voice_frames=MIN_VOICE_FRAMES,
+    )
+    return MicrophoneCapture(
+        vad,
+        endpointer,
+        sample_rate=SAMPLE_RATE,
+        frame_size=FRAME_SIZE,
+        transcriber=start_transcription,
+    )
+
+
+CONFIG_FILES = (Path(settings["assistant_instructions_file"]), Path(settings["assistant_schema_file"]))
+
+
+def config_stamp():
+    """Modification time and size of the instructions and schema files."""
+    stamp = []
+    for path in CONFIG_FILES:
+        try:
+            stat = path.stat()
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+# Changes whenever the instructions or schema do, invalidating cached replies.
+config_stamp_loaded = config_stamp()
+config_hash = config_fingerprint(*CONFIG_FILES)
+
+
+def build_response_cache():
+    if not settings["response_cache"]:
+        return None
+    return ResponseCache(
+        fingerprint=config_hash,
+        max_entries=settings["response_cache_size"],
+        ttl=settings["response_cache_ttl"],
+        path=settings["response_cache_file"] or None,
+    )
+
+
+def semantic_namespace_for_config():
+    from semantic_cache import namespace_for
+
+    try:
+        schema = json.loads(Path(settings["assistant_schema_file"]).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        schema = {}
+    return namespace_for(schema, config_hash)
+
+
+def build_semantic_cache():
+    if not settings["semantic_cache"]:
+        return None, None
+    try:
+        from semantic_cache import SemanticCache
+    except ImportError as exc:
+        print(f"Semantic cache disabled ({exc}). Install numpy to use it.")
+        return None, None
+
+    cache = SemanticCache(
+        threshold=settings["semantic_cache_threshold"],
+        max_entries=settings["semantic_cache_size"],
+        path=settings["semantic_cache_file"] or None,
+    )
+    atexit.register(cache.save)
+    return cache, semantic_namespace_for_config()
+
+
+intent_matcher = None
+if settings["intent_rules"]:
+    # Commands like "stop" or "faster" are answered from assistant_rules.json.
+    intent_matcher = IntentMatcher.from_file(settings["intent_rules_file"])
+response_cache = build_response_cache()
+semantic_cache, semantic_namespace = build_semantic_cache()
+
+
+def build_state_shadow():
+    """Create the opt-in device state shadow for delta payloads (``MQTT_DELTA=true``)."""
+    if not settings["mqtt_delta"]:
+        return None
+    return StateShadow(
+        keyframe_every=settings["mqtt_keyframe_every"],
+        keyframe_seconds=settings["mqtt_keyframe_seconds"],
+    )
 
 
 class MQTTClient:
     """Async-friendly MQTT helper that publishes LED payloads."""
 
     def __init__(self):
-        self.client = mqtt.Client(
+        # Runs on the application's event loop and reconnects by itself.
+        self.transport = MQTTTransport(
             client_id=settings["client_id"],
-            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            username=mqtt_user,
+            password=mqtt_password,
+            on_connect=self.on_connect,
+            on_disconnect=self.on_disconnect,
         )
-        if mqtt_user:
-            self.client.username_pw_set(mqtt_user, password=mqtt_password)
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.connected = asyncio.Event()
-
-    def on_connect(self, client, userdata, flags, reason_code, properties=None):
-        code = getattr(reason_code, "value", reason_code)
+        self.connected = self.transport.connected
+        # Held while the broker is unreachable and flushed on reconnect.
+        self.outbox = OutboundQueue(
+            self.transport,
+            depth=settings["mqtt_queue_depth"],
+            coalesce=settings["mqtt_coalesce"],
+            shadow=build_state_shadow(),
+        )
+
+    def on_connect(self, code):
         if code == 0:
             print("\nConnected to MQTT broker.")
-            self.connected.set()
         else:
             print(f"\nMQTT connection failed with code {code}.")
-            self.connected.clear()
 
-    def on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
-        code = getattr(reason_code, "value", reason_code)
+    def on_disconnect(self, code):
         if code not in (0, None):
             print(f"\nMQTT disconnected unexpectedly (code {code}).")
-        self.connected.clear()
 
     async def connect(self):
         try:
-            self.client.connect(broker, port, keepalive=60)
-            self.client.loop_start()
-            try:
-                await asyncio.wait_for(self.connected.wait(), timeout=5)
-                return True
-            except asyncio.TimeoutError:
-                print("MQTT connection timed out.")
-                return False
+            # An unreachable broker is retried in the background meanwhile.
+            return await self.transport.connect(broker, port, timeout=5, retry=True)
         except Exception as exc:
             print(f"Unable to connect to MQTT broker: {exc}")
             return False
 
     async def disconnect(self):
-        if self.client.is_connected():
-            self.client.loop_stop()
-            self.client.disconnect()
+        await self.outbox.close()
+        await self.transport.disconnect()
 
     async def publish(self, payload: str):
-        if not self.connected.is_set():
-            print("Skipping MQTT publish; not connected.")
-            return False
         try:
-            self.client.publish(topic, payload)
+            # Waits until the payload is on the wire (backpressure).
+            if not await self.outbox.publish(topic, payload):
+                if self.connected.is_set():
+                    print("Failed to publish MQTT message.")
+                    return False
+                # Held in the outbox; the device gets the newest values on reconnect.
+                print("MQTT broker unreachable; the newest values will be sent when it reconnects.")
+                return True
             print("\n")
             return True
         except Exception as exc:
@@ -113,120 +239,6 @@ async def restart_thread():
     return True
 
 
-def calibrate_noise_floor(duration: float = 1.0) -> int | None:
-    """Measure ambient RMS level to improve speech gating."""
-    frames_needed = max(1, int(duration * SAMPLE_RATE / FRAME_SIZE))
-    energies: list[int] = []
-
-    try:
-        with sd.RawInputStream(
-            samplerate=SAMPLE_RATE,
-            blocksize=FRAME_SIZE,
-            dtype="int16",
-            channels=1,
-        ) as stream:
-            for _ in range(frames_needed):
-                frame, _ = stream.read(FRAME_SIZE)
-                if not frame:
-                    continue
-                energy = audioop.rms(frame, 2)
-                energies.append(energy)
-    except sd.PortAudioError as exc:
-        print(f"Calibration audio error: {exc}")
-        return None
-
-    if not energies:
-        return None
-
-    avg_energy = sum(energies) / len(energies)
-    return max(int(avg_energy), ENERGY_THRESHOLD // 2)
-
-
-def record_voice_once() -> bytes | None:
-    """Capture a single utterance using VAD-controlled recording."""
-    ring_buffer = collections.deque(maxlen=PRE_SPEECH_FRAMES)
-    post_buffer = collections.deque(maxlen=POST_SPEECH_FRAMES)
-    voiced_frames: list[bytes] = []
-    voiced_energies: list[int] = []
-    silence_frames = 0
-    triggered = False
-    start_time = time.time()
-    dynamic_threshold = max(ENERGY_THRESHOLD, int(noise_floor * 2))
-
-    try:
-        with sd.RawInputStream(
-            samplerate=SAMPLE_RATE,
-            blocksize=FRAME_SIZE,
-            dtype="int16",
-            channels=1,
-        ) as stream:
-            while True:
-                frame, _ = stream.read(FRAME_SIZE)
-                if not frame:
-                    continue
-
-                energy = audioop.rms(frame, 2)
-                is_voiced = energy >= dynamic_threshold and vad.is_speech(frame, SAMPLE_RATE)
-
-                if not triggered:
-                    ring_buffer.append((frame, energy))
-                    if is_voiced:
-                        triggered = True
-                        for buffered_frame, buffered_energy in ring_buffer:
-                            voiced_frames.append(buffered_frame)
-                            voiced_energies.append(buffered_energy)
-                        ring_buffer.clear()
-                        silence_frames = 0
-                    elif time.time() - start_time > VOICE_WAIT_TIMEOUT:
-                        return None
-                    continue
-
-                if is_voiced:
-                    voiced_frames.append(frame)
-                    voiced_energies.append(energy)
-                    silence_frames = 0
-                    post_buffer.clear()
-                else:
-                    post_buffer.append(frame)
-                    silence_frames += 1
-                    if silence_frames > SILENCE_FRAMES_LIMIT:
-                        voiced_frames.extend(post_buffer)
-                        post_buffer.clear()
-                        break
-
-                if len(voiced_frames) > MAX_FRAMES:
-                    voiced_frames.extend(post_buffer)
-                    post_buffer.clear()
-                    break
-
-    except sd.PortAudioError as exc:
-        print(f"Audio input error: {exc}")
-        return None
-
-    if not voiced_frames or len(voiced_frames) < MIN_VOICE_FRAMES:
-        return None
-
-    if not voiced_energies:
-        return None
-
-    avg_voiced_energy = sum(voiced_energies) / len(voiced_energies)
-    if avg_voiced_energy < dynamic_threshold * 1.1:
-        return None
-
-    return b"".join(voiced_frames)
-
-
-def pcm_to_wav(pcm_data: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
-    """Wrap raw PCM data in a WAV container."""
-    buffer = BytesIO()
-    with wave.open(buffer, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm_data)
-    return buffer.getvalue()
-
-
 async def handle_command(command, mqtt_client):
     global input_mode, voice_prompt_displayed, dev_mode
 
@@ -238,11 +250,16 @@ async def handle_command(command, mqtt_client):
             "/voice   Switch to voice mode\n"
             "/text    Switch to text mode\n"
             "/dev     Enable dev mode (text + MQTT preview)\n"
+            "/cache   Show response cache stats (/cache clear empties it)\n"
+            "/mic     Show microphone noise floor and endpointing stats\n"
+            "/runs    Show turns superseded by a newer prompt\n"
+            "/mqtt    Show MQTT connection and outbound queue stats\n"
             "/quit    Exit the program"
         )
         return True
 
     if command == "/restart":
+        supervisor.supersede()
         await restart_thread()
         return True
 
@@ -267,8 +284,82 @@ async def handle_command(command, mqtt_client):
         print("\nDev mode enabled. Text replies will show MQTT payloads without sending. Type /text to exit dev mode.")
         return True
 
+    if command.startswith("/cache"):
+        caches = {"Response cache": response_cache, "Semantic cache": semantic_cache}
+        if not any(caches.values()):
+            print("\nCaching is off. Set RESPONSE_CACHE=true or SEMANTIC_CACHE=true to enable it.")
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            if command == "/cache clear":
+                cache.clear()
+                print(f"\n{name} cleared.")
+                continue
+            stats = cache.stats()
+            print(
+                f"\n{name}: {stats['entries']} entries, {stats['hits']} hits, "
+                f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                f"{stats['evictions']} evictions"
+            )
+        return True
+
+    if command == "/mic":
+        if microphone is None:
+            print("\nNo microphone available.")
+            return True
+        stats = microphone.endpointer.stats()
+        print(
+            f"\nNoise floor {stats['noise_floor']} (speech gate {stats['threshold']}), "
+            f"{stats['triggers']} triggers: {stats['accepted']} sent, "
+            f"{stats['too_short']} too short, {stats['too_quiet']} too quiet. "
+            f"Mean silence tail {stats['mean_tail_ms']:.0f} ms."
+        )
+        last = stats["last_segment"]
+        if last:
+            print(
+                f"Last utterance: {last['verdict']}, ended by {last['cause']} after a "
+                f"{last['tail_ms']} ms tail (confidence {last['confidence']:.2f})."
+            )
+        return True
+
+    if command == "/runs":
+        stats = supervisor.stats()
+        cancelled = cancelled_run_stats()
+        print(
+            f"\n{stats['submitted']} turns: {stats['completed']} answered, "
+            f"{stats['superseded']} superseded by a newer prompt "
+            f"({stats['superseded_seconds']:.1f} s of work dropped)."
+        )
+        line = f"Model runs cancelled: {cancelled['runs']}"
+        if "prompt_tokens" in cancelled:
+            line += (
+                f", {cancelled['prompt_tokens']} prompt + {cancelled['completion_tokens']} "
+                f"completion tokens already spent, {cancelled['finished_anyway']} "
+                "finished before the cancel arrived"
+            )
+        print(line + ".")
+        return True
+
+    if command == "/mqtt":
+        queue = mqtt_client.outbox.stats()
+        link = mqtt_client.transport.stats()
+        state = "connected" if link["connected"] else "reconnecting"
+        print(
+            f"\nMQTT {state} ({link['reconnects']} reconnects). Sent {queue['sent']}, "
+            f"queued {queue['depth']}, coalesced {queue['coalesced']}, "
+            f"dropped {queue['dropped']}, failed {queue['failed']}."
+        )
+        if "keyframes" in queue:
+            print(
+                f"Delta mode: {queue['deltas']} deltas, {queue['keyframes']} keyframes, "
+                f"{queue['skipped']} unchanged skipped; {queue['bytes_sent']} of "
+                f"{queue['bytes_full']} full-state bytes sent ({queue['saved']:.0%} saved)."
+            )
+        return True
+
     if command == "/quit":
         print("Goodbye!")
+        await supervisor.shutdown()
         if mqtt_client:
             await mqtt_client.disconnect()
         sys.exit(0)
@@ -276,44 +367,202 @@ async def handle_command(command, mqtt_client):
     return False
 
 
+async def publish_values(values, mqtt_client, *, dev_mode: bool = False):
+    publish_payload = json.dumps(values, separators=(",", ":"))
+    if mqtt_client:
+        if await mqtt_client.publish(publish_payload):
+            device_state.update(values)
+    else:
+        print("To see preset commands type /help")
+
+    if dev_mode:
+        preview_payload = json.dumps(values, indent=2)
+        print("\n[DEV] MQTT payload preview (also sent):")
+        print(preview_payload)
+
+
+def refresh_cache_config():
+    """Re-key the reply caches when the instructions or schema were edited.
+
+    The assistant picks up an edit on its next turn (the config watcher), so
+    replies made under the old files must not be served from then on.
+    """
+    global config_stamp_loaded, config_hash, semantic_namespace
+
+    stamp = config_stamp()
+    if stamp == config_stamp_loaded:
+        return
+    config_stamp_loaded = stamp
+    new_hash = config_fingerprint(*CONFIG_FILES)
+    if new_hash == config_hash:
+        return
+    config_hash = new_hash
+    if response_cache is not None:
+        response_cache.fingerprint = config_hash
+        response_cache.clear()
+    if semantic_cache is not None:
+        semantic_namespace = semantic_namespace_for_config()
+
+
+def cached_reply(message, state, *, dev_mode: bool = False):
+    """Return a stored reply for this prompt and LED state, if any."""
+    refresh_cache_config()
+    if response_cache is not None:
+        cached = response_cache.get(message, state)
+        if cached is not None:
+            if dev_mode:
+                print("\n[DEV] Served from the response cache.")
+            return cached
+    if semantic_cache is not None:
+        hit = semantic_cache.lookup(semantic_namespace, message, state)
+        if hit is not None:
+            if dev_mode:
+                print(f"\n[DEV] Semantic cache match {hit.score:.2f}: {hit.prompt!r}")
+            return hit.reply
+    return None
+
+
+def remember_reply(message, state, reply):
+    if response_cache is not None:
+        response_cache.put(message, state, reply)
+    if semantic_cache is not None:
+        semantic_cache.add(semantic_namespace, message, state, reply)
+
+
 async def process_user_message(message: str, mqtt_client, *, dev_mode: bool = False):
-    global current_thread_id
+    global current_thread_id, model_state_stale
+
+    state = dict(device_state)
+    if intent_matcher is not None:
+        intent = intent_matcher.match(message, state)
+        if intent is not None:
+            print(f"\nAssistant: {intent.response}")
+            if dev_mode:
+                print(f"[DEV] Matched rule '{intent.name}'; the model was not called.")
+            await publish_values(intent.values, mqtt_client, dev_mode=dev_mode)
+            model_state_stale = True
+            return
+
+    cached = cached_reply(message, state, dev_mode=dev_mode)
+    if cached is not None:
+        print(f"\nAssistant: {cached.get('response', '')}")
+        await publish_values(cached["values"], mqtt_client, dev_mode=dev_mode)
+        model_state_stale = True
+        return
 
     if not current_thread_id:
         if not await restart_thread():
             return
 
-    response = await GPT_response(current_thread_id, message)
+    early_publish = None
+    streamed_text = False
+    superseded = False
+
+    def on_values(values):
+        # Update the LED while the reply text is still streaming in.
+        nonlocal early_publish
+        if values and early_publish is None and not superseded:
+            early_publish = asyncio.create_task(
+                publish_values(values, mqtt_client, dev_mode=dev_mode)
+            )
+
+    def on_text(delta):
+        nonlocal streamed_text
+        if superseded:
+            return
+        if not streamed_text:
+            print("\nAssistant: ", end="")
+            streamed_text = True
+        print(delta, end="", flush=True)
+
+    prompt = message
+    if model_state_stale and device_state:
+        # Earlier turns were answered locally; tell the model where things stand.
+        prompt = f"(Current values: {json.dumps(device_state)})\n{message}"
+    try:
+        response = await GPT_response(
+            current_thread_id, prompt, on_values=on_values, on_text=on_text
+        )
+    except asyncio.CancelledError:
+        # A newer prompt replaced this one.  The run can still emit events
+        # while it is being cancelled; none of them may reach the device.
+        superseded = True
+        if early_publish is not None:
+            early_publish.cancel()
+        if streamed_text:
+            print(" [interrupted]")
+        raise
+    model_state_stale = False
     text = response.get("response", "")
     values = response.get("values", {})
+    remember_reply(message, state, response)
 
-    print(f"\nAssistant: {text}")
+    if streamed_text:
+        print()
+    else:
+        print(f"\nAssistant: {text}")
 
-    if values:
-        publish_payload = json.dumps(values, separators=(",", ":"))
-        if mqtt_client:
-            await mqtt_client.publish(publish_payload)
-        else:
-            print("To see preset commands type /help")
+    if early_publish is not None:
+        await early_publish
+    elif values:
+        await publish_values(values, mqtt_client, dev_mode=dev_mode)
+
+
+def start_stdin_reader(loop):
+    """Read typed lines on a daemon thread and queue them on ``loop``.
+
+    Waiting for input never blocks the event loop, so a line typed while a
+    reply is still running is seen straight away.
+    """
+    lines = asyncio.Queue()
+
+    def read():
+        for line in iter(sys.stdin.readline, ""):
+            loop.call_soon_threadsafe(lines.put_nowait, line.strip())
+
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+    return lines
+
+
+async def run_turn(message, mqtt_client, *, dev_mode: bool = False):
+    try:
+        await process_user_message(message, mqtt_client, dev_mode=dev_mode)
+    except Exception as exc:
+        print(f"\nError: {exc}")
 
-        if dev_mode:
-            preview_payload = json.dumps(values, indent=2)
-            print("\n[DEV] MQTT payload preview (also sent):")
-            print(preview_payload)
+
+def submit_message(message, mqtt_client):
+    """Answer ``message`` in the background, superseding an unfinished turn."""
+    supervisor.submit(run_turn(message, mqtt_client, dev_mode=dev_mode))
 
 
 async def chat_loop(mqtt_client):
     global voice_prompt_displayed, input_mode, dev_mode
 
-    loop = asyncio.get_event_loop()
+    typed_lines = start_stdin_reader(asyncio.get_running_loop())
+    text_prompt_displayed = False
 
     while True:
         try:
+            if input_mode == "voice" and microphone is None:
+                print("\nNo microphone available; staying in text mode.")
+                input_mode = "text"
+            if microphone is not None:
+                microphone.listening = input_mode == "voice"
+
             if input_mode == "text":
                 voice_prompt_displayed = False
-                user_input = await loop.run_in_executor(
-                    None, lambda: input("\nYou: ").strip()
-                )
+                if not text_prompt_displayed and not supervisor.busy():
+                    print("\nYou: ", end="", flush=True)
+                    text_prompt_displayed = True
+                try:
+                    # Typing stays possible while a reply is still running.
+                    user_input = await asyncio.wait_for(
+                        typed_lines.get(), timeout=VOICE_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                text_prompt_displayed = False
                 if not user_input:
                     continue
 
@@ -321,14 +570,13 @@ async def chat_loop(mqtt_client):
                     if await handle_command(user_input, mqtt_client):
                         continue
 
-                await process_user_message(user_input, mqtt_client, dev_mode=dev_mode)
+                submit_message(user_input, mqtt_client)
                 continue
 
             if input_mode == "voice":
                 # Allow typed commands/messages even while in voice mode.
-                readable, _, _ = select.select([sys.stdin], [], [], 0)
-                if sys.stdin in readable:
-                    typed = sys.stdin.readline().strip()
+                if not typed_lines.empty():
+                    typed = typed_lines.get_nowait()
                     if not typed:
                         continue
                     print(f"\nYou (text): {typed}")
@@ -340,24 +588,23 @@ async def chat_loop(mqtt_client):
                         voice_prompt_displayed = False
                         print("\nSwitched to text mode based on typed input.")
                         dev_mode = False
-                    await process_user_message(typed, mqtt_client, dev_mode=dev_mode)
+                    submit_message(typed, mqtt_client)
                     continue
 
             if input_mode == "voice" and not voice_prompt_displayed:
                 print("\n🎤 Voice mode active. Speak clearly and pause to send.")
                 voice_prompt_displayed = True
 
-            if input_mode == "voice":
-                pcm_data = await asyncio.to_thread(record_voice_once)
-            else:
-                # Should not reach here in text mode due to continue above.
-                pcm_data = None
-
-            if not pcm_data:
+            try:
+                # Wake up regularly so typed input is noticed while listening.
+                utterance = await asyncio.wait_for(
+                    microphone.utterances.get(), timeout=VOICE_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
                 continue
 
-            wav_bytes = pcm_to_wav(pcm_data)
-            transcript = await transcribe_audio(wav_bytes)
+            # Streamed transcriptions were uploaded while the user was speaking.
+            transcript = await utterance.transcription.finish()
             if not transcript:
                 print("Didn't catch that. Try again.")
                 continue
@@ -367,12 +614,15 @@ async def chat_loop(mqtt_client):
                 continue
 
             print(f"\nYou (voice): {message}")
+            if utterance.transcription.rtf is not None:
+                print(f"(transcribed locally in {utterance.transcription.elapsed:.2f} s, "
+                      f"real-time factor {utterance.transcription.rtf:.2f})")
 
             if message.startswith("/"):
                 if await handle_command(message, mqtt_client):
                     continue
 
-            await process_user_message(message, mqtt_client, dev_mode=dev_mode)
+            submit_message(message, mqtt_client)
         except KeyboardInterrupt:
             print("\nExiting...")
             break
@@ -381,33 +631,50 @@ async def chat_loop(mqtt_client):
 
 
 async def main():
-    global current_thread_id, noise_floor
+    global current_thread_id, microphone
 
     print(settings["Welcom_msg"])
 
+    # Create the first thread while the microphone and MQTT are being set up.
+    first_thread = asyncio.create_task(create_new_thread())
+
+    microphone = build_microphone()
     try:
-        print("Calibrating microphone... please remain silent.")
-        measured = await asyncio.to_thread(calibrate_noise_floor)
+        microphone.start()
+        print("Measuring room noise... please remain silent.")
+        measured = await microphone.calibrate()
         if measured:
-            noise_floor = measured
-            print(f"Calibrated ambient noise level: {noise_floor:.0f}")
+            print(f"Ambient noise level: {measured:.0f} (tracked while running)")
     except Exception as exc:
-        print(f"Microphone calibration failed: {exc}")
+        print(f"Microphone unavailable: {exc}")
+        microphone = None
+
+    if microphone is not None:
+        try:
+            local_model = await prepare_transcription()
+            if local_model:
+                print(f"Local transcription model {local_model} loaded.")
+        except Exception as exc:
+            print(f"Local transcription model failed to load: {exc}")
 
-    current_thread_id = await create_new_thread()
+    current_thread_id = await first_thread
     if not current_thread_id:
         print("Failed to create an assistant thread. Exiting.")
+        await close_threads()
         return
 
     mqtt_client = MQTTClient()
     if not await mqtt_client.connect():
-        print("Continuing without MQTT publishing.")
-        mqtt_client = None
+        print("MQTT broker unreachable; retrying in the background and queueing values meanwhile.")
 
     await chat_loop(mqtt_client)
+    await supervisor.shutdown()
 
     if mqtt_client:
         await mqtt_client.disconnect()
+    if microphone is not None:
+        microphone.stop()
+    await close_threads()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+"""Host-side shadow of the device state, for delta-encoded MQTT payloads.
+
+Every reply used to republish the whole device state (all six windmill
+fields) even when one windmill changed.  The firmware only updates the keys
+present in a message (``core/circuitpython/circuitpython.handle_message``),
+so ``StateShadow`` remembers, per topic, the state last delivered to the
+broker and ``OutboundQueue`` sends only the keys whose value differs from
+it.  A reply that changes nothing is not sent at all.
+
+Deltas assume the device saw every earlier message, so a full-state
+keyframe (the shadow with the new values applied) is sent instead:
+
+* for the first payload of a topic;
+* after every ``keyframe_every`` deltas or ``keyframe_seconds`` seconds,
+  whichever comes first, so a board that rebooted or missed a QoS 0
+  message is back in sync on the next publish after that;
+* after the broker connection was re-established (``invalidate``).
+
+Only JSON objects are delta-encoded; other payloads pass through.  Keys in
+``volatile`` (the ``AckTracker`` sequence number) differ in every payload:
+they are sent along with each delta or keyframe but never compared or
+remembered, so they alone do not make a payload worth sending.
+``stats()`` compares the bytes sent with what full states would have cost.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def _dumps(state: dict) -> str:
+    return json.dumps(state, separators=(",", ":"))
+
+
+class StateShadow:
+    """Last delivered state per topic and the delta/keyframe policy."""
+
+    def __init__(
+        self,
+        *,
+        keyframe_every: int = 20,
+        keyframe_seconds: float = 60.0,
+        volatile: Iterable[str] = ("seq",),
+    ) -> None:
+        self.keyframe_every = max(1, keyframe_every)
+        self.keyframe_seconds = keyframe_seconds
+        self.volatile = frozenset(volatile)
+        self.keyframes = 0
+        self.deltas = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.bytes_full = 0
+        self._states: Dict[str, dict] = {}
+        # Deltas sent and time of the last keyframe, per topic.
+        self._since_keyframe: Dict[str, int] = {}
+        self._keyframe_at: Dict[str, float] = {}
+
+    def encode(self, topic: str, state: dict) -> Tuple[Optional[str], bool]:
+        """Return ``(payload, keyframe)`` for publishing ``state`` on ``topic``.
+
+        ``payload`` is None when nothing changed.  Call ``commit`` once the
+        payload has been delivered.
+        """
+        state, extra = self._split(state)
+        shadow = self._states.get(topic)
+        if shadow is None or self._keyframe_due(topic):
+            return _dumps({**(shadow or {}), **state, **extra}), True
+        changed = {key: value for key, value in state.items() if key not in shadow or shadow[key] != value}
+        return (_dumps({**changed, **extra}) if changed else None), False
+
+    def commit(self, topic: str, state: dict, payload: Optional[str], keyframe: bool) -> None:
+        """Record that ``state`` reached the broker as ``payload``."""
+        merged = {**self._states.get(topic, {}), **self._split(state)[0]}
+        self._states[topic] = merged
+        self.bytes_full += len(_dumps(merged))
+        if payload is None:
+            self.skipped += 1
+            return
+        self.bytes_sent += len(payload)
+        if keyframe:
+            self.keyframes += 1
+            self._since_keyframe[topic] = 0
+            self._keyframe_at[topic] = time.monotonic()
+        else:
+            self.deltas += 1
+            self._since_keyframe[topic] = self._since_keyframe.get(topic, 0) + 1
+
+    def invalidate(self, topic: Optional[str] = None) -> None:
+        """Send a keyframe next time (for ``topic``, or every topic)."""
+        topics = list(self._keyframe_at) if topic is None else [topic]
+        for name in topics:
+            self._keyframe_at[name] = float("-inf")
+
+    def get(self, topic: str) -> Dict[str, Any]:
+        return dict(self._states.get(topic, {}))
+
+    def stats(self) -> Dict[str, Any]:
+        saved = 1 - self.bytes_sent / self.bytes_full if self.bytes_full else 0.0
+        return {
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "skipped": self.skipped,
+            "bytes_sent": self.bytes_sent,
+            "bytes_full": self.bytes_full,
+            "saved": round(saved, 3),
+        }
+
+    def _split(self, state: dict) -> Tuple[dict, dict]:
+        """``state`` without its volatile keys, and those keys."""
+        if not self.volatile.intersection(state):
+            return state, {}
+        kept = {key: value for key, value in state.items() if key not in self.volatile}
+        return kept, {key: value for key, value in state.items() if key in self.volatile}
+
+    def _keyframe_due(self, topic: str) -> bool:
+        if self._since_keyframe.get(topic, 0) >= self.keyframe_every:
+            return True
+        return time.monotonic() - self._keyframe_at.get(topic, float("-inf")) >= self.keyframe_seconds
+
+
+__all__ = ["StateShadow"]
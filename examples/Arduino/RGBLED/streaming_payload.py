@@ -0,0 +1,184 @@
+"""Incremental parser for streamed ``{"response", "values"}`` payloads.
+
+The assistant reply arrives as a stream of text deltas that only form valid
+JSON once the last token is in.  ``StreamingPayloadParser`` scans the top-level
+object as it grows so callers can act on a field before the rest is written:
+
+* ``on_values`` fires once, with the decoded ``values`` object, the moment its
+  closing brace arrives, so MQTT can be published while the reply is still
+  being generated.
+* ``on_text`` receives the decoded ``response`` string piece by piece, ready to
+  print or speak.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+_WHITESPACE = " \t\r\n"
+
+
+class StreamingPayloadParser:
+    """Scan a JSON object chunk by chunk and surface fields as they complete."""
+
+    def __init__(
+        self,
+        on_values: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        *,
+        values_key: str = "values",
+        text_key: str = "response",
+    ) -> None:
+        self.on_values = on_values
+        self.on_text = on_text
+        self.values_key = values_key
+        self.text_key = text_key
+        self.fields: Dict[str, Any] = {}
+        self.values_emitted = False
+
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._text_start: Optional[int] = None
+        self._text_emitted = 0
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next text delta from the model stream."""
+        if not chunk:
+            return
+        self._buffer += chunk
+        buffer = self._buffer
+
+        for index in range(self._pos, len(buffer)):
+            char = buffer[index]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string(index)
+                continue
+
+            if char in _WHITESPACE:
+                continue
+
+            if self._depth == 1 and not self._expect_key and self._value_start is None:
+                self._value_start = index
+                if char == '"' and self._key == self.text_key:
+                    self._text_start = index + 1
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = index
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1 and self._value_start is not None:
+                    self._complete_value(buffer[self._value_start:index])
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._complete_value(buffer[self._value_start:index + 1])
+            elif self._depth == 1:
+                if char == ":":
+                    self._expect_key = False
+                elif char == ",":
+                    if self._value_start is not None:
+                        self._complete_value(buffer[self._value_start:index])
+                    self._expect_key = True
+
+        self._pos = len(buffer)
+        self._stream_text()
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Return the fully parsed payload, or ``None`` when it is not valid JSON."""
+        try:
+            parsed = json.loads(self._buffer)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(parsed, dict):
+            return None
+        if not self.values_emitted and isinstance(parsed.get(self.values_key), dict):
+            self._emit_values(parsed[self.values_key])
+        return parsed
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _close_string(self, index: int) -> None:
+        if self._depth != 1:
+            return
+        if self._key_start is not None:
+            try:
+                self._key = json.loads(self._buffer[self._key_start:index + 1])
+            except json.JSONDecodeError:
+                self._key = None
+            self._key_start = None
+        elif self._value_start is not None:
+            self._stream_text(end=index)
+            self._complete_value(self._buffer[self._value_start:index + 1])
+
+    def _complete_value(self, raw: str) -> None:
+        key = self._key
+        self._key = None
+        self._value_start = None
+        self._text_start = None
+        if key is None:
+            return
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            logging.debug("Could not decode streamed field %s: %r", key, raw)
+            return
+        self.fields[key] = value
+        if key == self.values_key and isinstance(value, dict):
+            self._emit_values(value)
+
+    def _emit_values(self, values: Dict[str, Any]) -> None:
+        self.values_emitted = True
+        if self.on_values:
+            self.on_values(values)
+
+    def _stream_text(self, end: Optional[int] = None) -> None:
+        if self._text_start is None or not self.on_text:
+            return
+        raw = self._buffer[self._text_start:self._pos if end is None else end]
+        decoded = _decode_partial_string(raw)
+        if len(decoded) > self._text_emitted:
+            self.on_text(decoded[self._text_emitted:])
+            self._text_emitted = len(decoded)
+        if end is not None:
+            self._text_emitted = 0
+
+
+def _decode_partial_string(raw: str) -> str:
+    """Decode the longest prefix of a JSON string body that is complete."""
+    # An escape sequence is at most 12 characters (a \\uXXXX surrogate pair).
+    for cut in range(len(raw), max(len(raw) - 12, 0) - 1, -1):
+        try:
+            decoded = json.loads(f'"{raw[:cut]}"')
+        except json.JSONDecodeError:
+            continue
+        if decoded and "\ud800" <= decoded[-1] <= "\udbff":
+            decoded = decoded[:-1]
+        return decoded
+    return ""
+
+
+__all__ = ["StreamingPayloadParser"]
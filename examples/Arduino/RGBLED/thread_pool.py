@@ -0,0 +1,156 @@
+"""Conversation threads created ahead of time so starting one costs nothing.
+
+Creating an Assistants thread is a full API round trip, and it sat in front
+of the first reply, ``/restart`` and a Telegram ``/resetuser``.  A
+``ThreadPool`` keeps ``size`` empty threads ready: ``acquire`` hands one out
+immediately and a background task creates its replacement.  Threads older
+than ``max_age`` seconds are not handed out; they are passed to ``discard``
+(e.g. to delete them server-side) and replaced.  With ``size=0`` every
+``acquire`` simply creates a thread, as before.
+
+If the pool is empty while a refill is in flight, ``acquire`` waits for that
+thread instead of creating a second one.  When creation fails, ``acquire``
+returns ``None`` just like the plain ``create`` function would.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class ThreadPool:
+    """A small stock of fresh conversation threads, refilled in the background."""
+
+    def __init__(
+        self,
+        create: Callable[[], Awaitable[Optional[str]]],
+        *,
+        size: int = 2,
+        max_age: float = 3600.0,
+        discard: Optional[Callable[[str], Awaitable[Any]]] = None,
+    ) -> None:
+        self.create = create
+        self.size = max(0, size)
+        self.max_age = max_age
+        self.discard = discard
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._ready: collections.deque = collections.deque()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._creating = False
+        # Set when a thread was added or a refill ended / when one was taken.
+        self._changed = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._discards: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Begin filling the pool; call from a running event loop."""
+        if self.size and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.create_task(self._refill())
+            # It will create a thread first; acquire() should wait for it.
+            self._creating = len(self._ready) < self.size
+        self._wake.set()
+
+    async def acquire(self) -> Optional[str]:
+        """Return a fresh thread id, from the pool when one is ready."""
+        while self.size:
+            thread_id = self._pop_fresh()
+            if thread_id is not None:
+                self.hits += 1
+                self.start()
+                return thread_id
+            if not self._creating:
+                break
+            # A thread is being created right now; wait for it rather than
+            # paying for another round trip.
+            self._changed.clear()
+            await self._changed.wait()
+
+        self.misses += 1
+        thread_id = await self.create()
+        self.start()
+        return thread_id
+
+    async def close(self) -> None:
+        """Stop refilling and discard the threads that were never used."""
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+        while self._ready:
+            thread_id, _ = self._ready.popleft()
+            self._discard(thread_id)
+        if self._discards:
+            await asyncio.gather(*self._discards, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": len(self._ready),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+        }
+
+    def _pop_fresh(self) -> Optional[str]:
+        now = time.monotonic()
+        while self._ready:
+            thread_id, created_at = self._ready.popleft()
+            if now - created_at <= self.max_age:
+                return thread_id
+            self.expired += 1
+            self._discard(thread_id)
+        return None
+
+    def _discard(self, thread_id: str) -> None:
+        if self.discard is None:
+            return
+        task = asyncio.create_task(self.discard(thread_id))
+        self._discards.add(task)
+        task.add_done_callback(self._discards.discard)
+
+    async def _refill(self) -> None:
+        try:
+            while True:
+                # Drop anything that aged out while sitting in the pool.
+                now = time.monotonic()
+                while self._ready and now - self._ready[0][1] > self.max_age:
+                    self.expired += 1
+                    self._discard(self._ready.popleft()[0])
+
+                if len(self._ready) < self.size:
+                    self._creating = True
+                    try:
+                        thread_id = await self.create()
+                    except Exception as exc:
+                        logging.error("Error pre-creating thread: %s", exc)
+                        thread_id = None
+                    finally:
+                        self._creating = False
+                    if thread_id is None:
+                        # Give up for now; the next acquire retries.
+                        return
+                    self._ready.append((thread_id, time.monotonic()))
+                    self._changed.set()
+                    continue
+
+                # Full: sleep until a thread is taken or the oldest one expires.
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.max_age - (now - self._ready[0][1]) + 0.01)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._creating = False
+            self._changed.set()
+
+
+__all__ = ["ThreadPool"]
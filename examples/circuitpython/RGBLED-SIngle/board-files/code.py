@@ -1,9 +1,9 @@
 # --- Imports
 import time
-import json
 import board
 import neopixel
-from MQTT import Create_MQTT
+import payload_codec
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 
 # --- Variables
@@ -24,7 +24,8 @@ led_state = [255, 255, 255, 200]
 # MQTT setup
 client_id = settings["mqtt_clientid"]
 mqtt_topic = settings.get("mqtt_topic", "led")
-mqtt_client = Create_MQTT(client_id)
+# JSON or binary payloads (payload_codec.py is generated from schema.json)
+mqtt_client = Create_MQTT(client_id, binary_payloads=True)
 
 
 # --- Functions
@@ -52,13 +53,20 @@ def on_message(client, topic, message):
     """Handle incoming MQTT messages to update the LED color."""
     global led_state
     try:
-        data = json.loads(message)
+        data = payload_codec.loads(message)
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Already applied; the host did not get our ack
+            Ack(client, topic, seq)
+            return
 
         # Expect messages like: {"led": [R, G, B, Brightness]}
         if "led" in data and isinstance(data["led"], list) and len(data["led"]) == 4:
-            led_state = data["led"]
+            # Binary payloads carry numbers as floats; NeoPixel wants ints
+            led_state = [int(v) for v in data["led"]]
             apply_led()
             print("Updated led:", led_state)
+            Ack(client, topic, seq)
         else:
             print("Received invalid LED payload:", data)
     except Exception as e:
@@ -41,7 +41,8 @@ def message(client, topic, m):
 
 
 # Creates a mqtt connection.
-def Create_MQTT(client_id, message_handler=message, connection_handler=connected, disconnected_handler=disconnected):
+# With binary_payloads, messages reach the handler as a bytearray (see payload_codec.py).
+def Create_MQTT(client_id, message_handler=message, connection_handler=connected, disconnected_handler=disconnected, binary_payloads=False):
     # Get the pins from the Wi-Fi module
     esp32_cs = DigitalInOut(board.D9)
     esp32_ready = DigitalInOut(board.D11)
@@ -83,6 +84,7 @@ def Create_MQTT(client_id, message_handler=message, connection_handler=connected
             broker=settings["broker"],
             username=settings["mqtt_user"],
             password=settings["mqtt_password"],
+            use_binary_mode=binary_payloads,
         )
     else:
         pool = adafruit_connection_manager.get_radio_socketpool(esp)
@@ -94,7 +96,8 @@ def Create_MQTT(client_id, message_handler=message, connection_handler=connected
             password=settings["mqtt_password"],
             socket_pool=pool,
             ssl_context=ssl_context,
-            socket_timeout=.1
+            socket_timeout=.1,
+            use_binary_mode=binary_payloads,
         )
 
     mqtt_client.on_connect = connection_handler
@@ -108,3 +111,35 @@ def Create_MQTT(client_id, message_handler=message, connection_handler=connected
         mqtt_client._backwards_compatible_sock = True
 
     return mqtt_client
+
+
+# Sequence number of the last payload received, to spot retransmissions.
+last_seq = None
+
+
+# Returns the sequence number the host tagged a payload with, or None.
+def Payload_Seq(data):
+    if isinstance(data, dict):
+        return data.get("seq")
+    return None
+
+
+# True when the host sent the previous payload again because its ack was late
+# or lost: acknowledge it again instead of applying it twice.
+def Is_Repeat(seq):
+    global last_seq
+    repeat = seq is not None and seq == last_seq
+    if seq is not None:
+        last_seq = seq
+    return repeat
+
+
+# Publishes {"seq": n} on "<topic>/ack" once a payload has been applied, so the
+# host can measure the round trip and stop retransmitting it.
+def Ack(mqtt_client, topic, seq):
+    if seq is None:
+        return
+    try:
+        mqtt_client.publish(topic + "/ack", '{"seq": %d}' % seq)
+    except Exception as e:
+        print("Could not publish ack:", e)
@@ -1,9 +1,9 @@
 # --- Imports
 import time
-import json
 import board
 import neopixel
-from MQTT import Create_MQTT
+import payload_codec
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 
 # --- Variables
@@ -36,7 +36,8 @@ led_states = {
 # MQTT setup
 client_id = settings["mqtt_clientid"]
 mqtt_topic = settings.get("mqtt_topic", "led")
-mqtt_client = Create_MQTT(client_id)
+# JSON or binary payloads (payload_codec.py is generated from schema.json)
+mqtt_client = Create_MQTT(client_id, binary_payloads=True)
 
 
 # --- Functions
@@ -65,7 +66,12 @@ def on_message(client, topic, message):
     """Handle incoming MQTT messages to update LED colors."""
     global led_states
     try:
-        data = json.loads(message)
+        data = payload_codec.loads(message)
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Already applied; the host did not get our ack
+            Ack(client, topic, seq)
+            return
 
         updated = False
 
@@ -86,6 +92,7 @@ def on_message(client, topic, message):
         if updated:
             apply_all_leds()
             print("Updated LEDs:", led_states)
+            Ack(client, topic, seq)
         else:
             print("Received invalid LED payload:", data)
     except Exception as e:
@@ -0,0 +1,34 @@
+"""Binary payload decoder generated by payload_codec.py from RGBLED-dichotomy/schema.json.
+
+Layout {led-d7:[4:B],led-d13:[4:B]}
+
+Do not edit; regenerate it when the schema changes.
+"""
+
+import json
+import struct
+
+MAGIC = 0xA5
+LAYOUT_ID = 0x6D0B
+
+
+def decode(buf):
+    """Decode a binary payload into the dict its JSON form would give."""
+    if buf[0] != MAGIC or struct.unpack_from("<H", buf, 1)[0] != LAYOUT_ID:
+        raise ValueError("unknown payload layout")
+    o = 3
+    v1 = struct.unpack_from("<BBBBBBBB", buf, o)
+    o += 8
+    values = {"led-d7": [v1[0], v1[1], v1[2], v1[3]], "led-d13": [v1[4], v1[5], v1[6], v1[7]]}
+    if len(buf) >= o + 4:
+        values["seq"] = struct.unpack_from("<I", buf, o)[0]
+    return values
+
+
+def loads(message):
+    """Parse an MQTT message: binary payloads with decode(), anything else as JSON."""
+    if isinstance(message, str):
+        return json.loads(message)
+    if message and message[0] == MAGIC:
+        return decode(message)
+    return json.loads(str(message, "utf-8"))
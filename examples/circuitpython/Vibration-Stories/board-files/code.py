@@ -1,9 +1,9 @@
 # --- Imports
 import time
-import json
 import board
 import pwmio
-from MQTT import Create_MQTT
+import payload_codec
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 
 # --- Variables
@@ -12,9 +12,10 @@ vibration_motor = pwmio.PWMOut(board.D4)
 # MQTT setup (topic must come from settings.py)
 client_id = settings["mqtt_clientid"]
 mqtt_topic = settings["mqtt_topic"]
-mqtt_client = Create_MQTT(client_id)
+# JSON or binary payloads (payload_codec.py is generated from schema.json)
+mqtt_client = Create_MQTT(client_id, binary_payloads=True)
 
-# Queue for incoming patterns; each item is a list of [intensity, duration, pause]
+# Queue for incoming patterns; each item is (list of [intensity, duration, pause], seq or None)
 pattern_queue = []
 
 
@@ -47,7 +48,13 @@ def on_message(client, topic, message):
     """
     global pattern_queue
     try:
-        data = json.loads(message)
+        data = payload_codec.loads(message)
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Ack again only if it already started; a queued copy is acked when it plays
+            if seq not in [queued_seq for _, queued_seq in pattern_queue]:
+                Ack(client, topic, seq)
+            return
 
         pattern = None
         # Direct list of notes
@@ -82,7 +89,7 @@ def on_message(client, topic, message):
             print("No valid notes in payload:", data)
             return
 
-        pattern_queue.append(cleaned)
+        pattern_queue.append((cleaned, seq))
         print("Queued vibration pattern:", cleaned)
     except Exception as e:
         print("Error parsing MQTT vibration message:", e)
@@ -102,7 +109,9 @@ while True:
 
     # If there is a queued pattern, play it
     if pattern_queue:
-        current_pattern = pattern_queue.pop(0)
+        current_pattern, seq = pattern_queue.pop(0)
+        # Acknowledge when the pattern starts playing
+        Ack(mqtt_client, mqtt_topic, seq)
         for note in current_pattern:
             intensity, duration, pause = note
             vibration_alarm(intensity, duration, pause)
@@ -1,9 +1,9 @@
 # --- Imports
 import time
-import json
 import board
 import pwmio
-from MQTT import Create_MQTT
+import payload_codec
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 
 # --- Variables
@@ -15,9 +15,10 @@ DUTY_CYCLE = int(0.1 * 65535)
 # MQTT setup
 client_id = settings["mqtt_clientid"]
 mqtt_topic = settings["mqtt_topic"]
-mqtt_client = Create_MQTT(client_id)
+# JSON or binary payloads (payload_codec.py is generated from schema.json)
+mqtt_client = Create_MQTT(client_id, binary_payloads=True)
 
-# Queue for incoming melodies; each item is a list of [pitch_hz_or_0, duration_seconds]
+# Queue for incoming melodies; each item is (list of [pitch_hz_or_0, duration_seconds], seq or None)
 pattern_queue = []
 
 
@@ -61,7 +62,13 @@ def on_message(client, topic, message):
     """
     global pattern_queue
     try:
-        data = json.loads(message)
+        data = payload_codec.loads(message)
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Ack again only if it already started; a queued copy is acked when it plays
+            if seq not in [queued_seq for _, queued_seq in pattern_queue]:
+                Ack(client, topic, seq)
+            return
         pattern = None
 
         # Direct list of events
@@ -92,7 +99,7 @@ def on_message(client, topic, message):
             print("No valid melody events:", data)
             return
 
-        pattern_queue.append(cleaned)
+        pattern_queue.append((cleaned, seq))
         print("Queued melody:", cleaned)
 
     except Exception as e:
@@ -110,7 +117,9 @@ while True:
     mqtt_client.loop(timeout=0.2)
 
     if pattern_queue:
-        current_pattern = pattern_queue.pop(0)
+        current_pattern, seq = pattern_queue.pop(0)
+        # Acknowledge when the melody starts playing
+        Ack(mqtt_client, mqtt_topic, seq)
         for ev in current_pattern:
             pitch_hz, duration_s = ev
             play_event(pitch_hz, duration_s)
@@ -1,10 +1,10 @@
 # --- Imports
 import time
-import json
 import board
 import pwmio
 from adafruit_motor import servo
-from MQTT import Create_MQTT
+import payload_codec
+from MQTT import Create_MQTT, Ack, Is_Repeat, Payload_Seq
 from settings import settings
 
 # --- Variables
@@ -17,7 +17,8 @@ current_pause = 1.0  # Default pause between steps
 # MQTT setup
 client_id = settings["mqtt_clientid"]
 mqtt_topic = settings.get("mqtt_topic", "servo")
-mqtt_client = Create_MQTT(client_id)
+# JSON or binary payloads (payload_codec.py is generated from schema.json)
+mqtt_client = Create_MQTT(client_id, binary_payloads=True)
 
 
 # --- Functions
@@ -26,12 +27,18 @@ def on_message(client, topic, message):
     global current_steps, step_index
     print(f"Received: {message}")
     try:
-        # Parse JSON message like {"steps": [[0, 0.5], [90, 1.0], [180, 0.5]]}
-        data = json.loads(message)
+        # Parse a JSON (or binary) message like {"steps": [[0, 0.5], [90, 1.0], [180, 0.5]]}
+        data = payload_codec.loads(message)
+        seq = Payload_Seq(data)
+        if Is_Repeat(seq):
+            # Already loaded; the host did not get our ack
+            Ack(client, topic, seq)
+            return
         if "steps" in data:
             current_steps = data["steps"]
             step_index = 0
             print(f"New steps loaded: {current_steps}")
+            Ack(client, topic, seq)
     except Exception as e:
         print(f"Error parsing message: {e}")
 
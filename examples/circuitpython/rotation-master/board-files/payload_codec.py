@@ -0,0 +1,37 @@
+"""Binary payload decoder generated by payload_codec.py from rotation-master/schema.json.
+
+Layout {steps:[H:[2:f]]}
+
+Do not edit; regenerate it when the schema changes.
+"""
+
+import json
+import struct
+
+MAGIC = 0xA5
+LAYOUT_ID = 0x5DD1
+
+
+def decode(buf):
+    """Decode a binary payload into the dict its JSON form would give."""
+    if buf[0] != MAGIC or struct.unpack_from("<H", buf, 1)[0] != LAYOUT_ID:
+        raise ValueError("unknown payload layout")
+    o = 3
+    v2 = struct.unpack_from("<H", buf, o)[0]
+    o += 2
+    v3 = struct.unpack_from("<%df" % (2 * v2), buf, o)
+    o += 8 * v2
+    v1 = [[v3[i], v3[i + 1]] for i in range(0, 2 * v2, 2)]
+    values = {"steps": v1}
+    if len(buf) >= o + 4:
+        values["seq"] = struct.unpack_from("<I", buf, o)[0]
+    return values
+
+
+def loads(message):
+    """Parse an MQTT message: binary payloads with decode(), anything else as JSON."""
+    if isinstance(message, str):
+        return json.loads(message)
+    if message and message[0] == MAGIC:
+        return decode(message)
+    return json.loads(str(message, "utf-8"))